@@ -21,4 +21,12 @@ if [ -z "$SNER_SERVER_BIND" ]; then
     SNER_SERVER_BIND="0.0.0.0:18000"
 fi
 
-exec /opt/sner/server/venv/bin/gunicorn --bind "$SNER_SERVER_BIND" --workers=5 'sner.server.app:create_app()' --access-logfile -
+if [ -z "$SNER_SERVER_THREADS" ]; then
+    SNER_SERVER_THREADS="8"
+fi
+# server sizes database connection pool and long-poll waiters by number of threads,
+# each worker might open up to 2*threads database connections (postgres max_connections)
+export SNER_SERVER_THREADS
+
+# threaded workers, long-polling agents (job assign wait) hold threads instead of whole workers
+exec /opt/sner/server/venv/bin/gunicorn --bind "$SNER_SERVER_BIND" --workers=5 --worker-class=gthread --threads="$SNER_SERVER_THREADS" 'sner.server.app:create_app()' --access-logfile -
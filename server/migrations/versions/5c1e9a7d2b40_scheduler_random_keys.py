@@ -0,0 +1,38 @@
+"""scheduler random keys
+
+Revision ID: 5c1e9a7d2b40
+Revises: d2cfafddd156
+Create Date: 2026-10-18 10:12:41.309127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9a7d2b40'
+down_revision = 'd2cfafddd156'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('target', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rand', sa.Float(), server_default=sa.text('random()'), nullable=False))
+        batch_op.drop_index('target_queueid_hashval')
+        batch_op.create_index('target_queueid_hashval_rand', ['queue_id', 'hashval', 'rand'], unique=False)
+
+    with op.batch_alter_table('readynet', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rand', sa.Float(), server_default=sa.text('random()'), nullable=False))
+        batch_op.create_index('readynet_queueid_rand', ['queue_id', 'rand'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('readynet', schema=None) as batch_op:
+        batch_op.drop_index('readynet_queueid_rand')
+        batch_op.drop_column('rand')
+
+    with op.batch_alter_table('target', schema=None) as batch_op:
+        batch_op.drop_index('target_queueid_hashval_rand')
+        batch_op.create_index('target_queueid_hashval', ['queue_id', 'hashval'], unique=False)
+        batch_op.drop_column('rand')
@@ -0,0 +1,139 @@
+"""storage identity constraints
+
+Revision ID: 774a15226a37
+Revises: a3f0c6b8e215
+Create Date: 2026-10-18 21:02:17.443519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '774a15226a37'
+down_revision = 'a3f0c6b8e215'
+branch_labels = None
+depends_on = None
+
+
+def duplicates_query(table, identity):
+    """select duplicate rows of the table with id of the oldest row of the identity"""
+
+    return (
+        f'SELECT id, keep_id FROM ('
+        f'SELECT id, min(id) OVER identity AS keep_id, count(*) OVER identity AS cnt FROM {table} WINDOW identity AS (PARTITION BY {identity})'
+        f') identities WHERE cnt > 1'
+    )
+
+
+def check_conflicts(table, identity, columns):
+    """abort migration if duplicate rows hold distinct values which cannot be merged"""
+
+    duplicates = duplicates_query(table, identity)
+    distinct = ' OR '.join(f'count(DISTINCT src.{col}) > 1' for col in columns)
+    conflicts = op.get_bind().execute(sa.text(
+        f'SELECT dup.keep_id, array_agg(dup.id ORDER BY dup.id) FROM ({duplicates}) dup JOIN {table} src ON src.id = dup.id '
+        f'GROUP BY dup.keep_id HAVING {distinct} ORDER BY dup.keep_id'
+    )).all()
+    if conflicts:
+        report = '\n'.join(f'{table} {ids}' for _, ids in conflicts)
+        raise RuntimeError(
+            f'storage identity conflicts, duplicate {table} rows hold distinct {", ".join(columns)}, '
+            f'resolve them manually and rerun the migration\n{report}'
+        )
+
+
+def merge_duplicates(table, identity, children, scalars, arrays=('tags',), aggregates=None, conflicts=None):  # pylint: disable=too-many-arguments
+    """
+    merge duplicate rows into the oldest row of the identity, re-point children of duplicates
+    and delete the duplicates
+
+    * tags, refs and comments of all duplicates are merged into the kept row in order of row ids
+    * empty scalar columns of the kept row are filled from the oldest duplicate having the value
+    * `aggregates` columns are set to aggregate expression over all duplicates (eg. highest severity)
+    * migration is aborted if duplicates hold distinct values in `conflicts` columns
+    """
+
+    if conflicts:
+        check_conflicts(table, identity, conflicts)
+
+    duplicates = duplicates_query(table, identity)
+    lists = {col: f'unnest(src.{col})' for col in arrays}
+    lists['comment'] = "unnest(array_remove(ARRAY[nullif(src.comment, '')], NULL))"
+    for col, items in lists.items():
+        merged = 'items.vals' if col in arrays else "nullif(array_to_string(items.vals, E'\\n'), '')"
+        op.execute(
+            f'UPDATE {table} SET {col} = {merged} FROM ('
+            f'SELECT keep_id, array_agg(val ORDER BY src_id, ord) AS vals FROM ('
+            f'SELECT DISTINCT ON (dup.keep_id, item.val) dup.keep_id, item.val, src.id AS src_id, item.ord '
+            f'FROM ({duplicates}) dup JOIN {table} src ON src.id = dup.id, {items} WITH ORDINALITY AS item(val, ord) '
+            f'ORDER BY dup.keep_id, item.val, src.id, item.ord'
+            f') distinct_items GROUP BY keep_id'
+            f') items WHERE {table}.id = items.keep_id'
+        )
+
+    assignments = {col: f'(array_agg(src.{col} ORDER BY src.id) FILTER (WHERE src.{col} IS NOT NULL))[1]' for col in scalars}
+    assignments.update({'created': 'min(src.created)', 'modified': 'max(src.modified)', **(aggregates or {})})
+    op.execute(
+        f'UPDATE {table} SET {", ".join(f"{col} = merged.{col}" for col in assignments)} FROM ('
+        f'SELECT dup.keep_id, {", ".join(f"{expr} AS {col}" for col, expr in assignments.items())} '
+        f'FROM ({duplicates}) dup JOIN {table} src ON src.id = dup.id GROUP BY dup.keep_id'
+        f') merged WHERE {table}.id = merged.keep_id'
+    )
+
+    for child in children:
+        op.execute(
+            f'UPDATE {child} SET {table}_id = dup.keep_id FROM ({duplicates}) dup '
+            f'WHERE {child}.{table}_id = dup.id AND dup.id != dup.keep_id'
+        )
+    op.execute(f'DELETE FROM {table} USING ({duplicates}) dup WHERE {table}.id = dup.id AND dup.id != dup.keep_id')
+
+
+def upgrade():
+    merge_duplicates('host', 'address', ['service', 'vuln', 'note'], ['hostname', 'os'], aggregates={'rescan_time': 'max(src.rescan_time)'})
+    merge_duplicates(
+        'service',
+        'host_id, proto, port',
+        ['vuln', 'note'],
+        ['state', 'name', 'info'],
+        aggregates={'rescan_time': 'max(src.rescan_time)', 'import_time': 'max(src.import_time)'}
+    )
+    merge_duplicates(
+        'vuln',
+        "host_id, name, coalesce(xtype, ''), coalesce(service_id, 0), coalesce(via_target, '')",
+        [],
+        ['descr'],
+        arrays=('tags', 'refs'),
+        aggregates={'severity': 'max(src.severity)', 'rescan_time': 'max(src.rescan_time)', 'import_time': 'max(src.import_time)'},
+        conflicts=['data']
+    )
+    merge_duplicates(
+        'note',
+        "host_id, coalesce(xtype, ''), coalesce(service_id, 0), coalesce(via_target, '')",
+        [],
+        [],
+        aggregates={'import_time': 'max(src.import_time)'},
+        conflicts=['data']
+    )
+
+    op.create_index('host_identity', 'host', ['address'], unique=True)
+    op.create_index('service_identity', 'service', ['host_id', 'proto', 'port'], unique=True)
+    op.create_index(
+        'vuln_identity',
+        'vuln',
+        ['host_id', 'name', sa.text("coalesce(xtype, '')"), sa.text('coalesce(service_id, 0)'), sa.text("coalesce(via_target, '')")],
+        unique=True
+    )
+    op.create_index(
+        'note_identity',
+        'note',
+        ['host_id', sa.text("coalesce(xtype, '')"), sa.text('coalesce(service_id, 0)'), sa.text("coalesce(via_target, '')")],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('note_identity', table_name='note')
+    op.drop_index('vuln_identity', table_name='vuln')
+    op.drop_index('service_identity', table_name='service')
+    op.drop_index('host_identity', table_name='host')
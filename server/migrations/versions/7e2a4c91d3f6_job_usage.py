@@ -0,0 +1,26 @@
+"""job usage
+
+Revision ID: 7e2a4c91d3f6
+Revises: 5c1e9a7d2b40
+Create Date: 2026-10-18 18:52:07.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2a4c91d3f6'
+down_revision = '5c1e9a7d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('usage', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('usage')
@@ -0,0 +1,28 @@
+"""job lease
+
+Revision ID: a3f0c6b8e215
+Revises: 7e2a4c91d3f6
+Create Date: 2026-10-18 20:14:36.902118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f0c6b8e215'
+down_revision = '7e2a4c91d3f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lease', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('progress', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('progress')
+        batch_op.drop_column('lease')
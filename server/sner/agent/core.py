@@ -4,20 +4,27 @@ sner agent
 """
 
 import copy
+import hashlib
 import json
 import logging
 import logging.config
+import multiprocessing
 import os
+import re
+import resource
 import shutil
 import signal
+import sys
 from abc import ABC, abstractmethod
 from argparse import ArgumentParser
-from base64 import b64encode
 from contextlib import contextmanager
+from http import HTTPStatus
 from pathlib import Path
-from time import sleep
+from queue import Queue
+from threading import Event, Thread
+from time import monotonic, sleep
 from uuid import uuid4
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, ZIP_BZIP2, ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED
 
 import marshmallow
 import requests
@@ -26,6 +33,7 @@ import yaml
 from sner.server.api.schema import JobAssignmentSchema
 from sner.lib import load_yaml, TerminateContextMixin
 from sner.agent.modules import load_agent_plugins, REGISTERED_MODULES
+from sner.agent.transport import Transport
 from sner.version import __version__
 
 
@@ -36,9 +44,20 @@ DEFAULT_CONFIG = {
     'QUEUE': None,
     'CAPS': None,
     'BACKOFF_TIME': 5.0,
+    'BACKOFF_MAX': 300.0,
     'NET_TIMEOUT': 300,
-    'ONESHOT': False
+    'NET_RETRIES': 3,
+    'ONESHOT': False,
+    'LONGPOLL': 0,
+    'SLOTS': 1,
+    'UPLOAD_SPOOL': 2,
+    'HEARTBEAT_INTERVAL': 60,
+    'OUTPUT_COMPRESSION': 'deflate',
+    'OUTPUT_COMPRESSLEVEL': None
 }
+OUTPUT_COMPRESSION_METHODS = {'store': ZIP_STORED, 'deflate': ZIP_DEFLATED, 'bzip2': ZIP_BZIP2, 'lzma': ZIP_LZMA}
+STORED_SUFFIXES = ('.gz', '.jpg', '.png', '.zip')
+PACKED_ALWAYS = ('assignment.json', 'manifest.json')
 
 
 def configure_logging():
@@ -86,22 +105,30 @@ def config_from_args(args):
     """pull config variables from parsed args/generic object"""
 
     config = {}
-    for item in ['server', 'apikey', 'queue', 'caps', 'oneshot']:
+    for item in ['server', 'apikey', 'queue', 'caps', 'oneshot', 'longpoll', 'slots']:
         if getattr(args, item) is not None:
             config[item.upper()] = getattr(args, item)
     return config
 
 
-def zipdir(path, zipto):
-    """pack directory to in zipfile"""
+def zipdir(path, zipto, compression=ZIP_DEFLATED, compresslevel=None, manifest=None):
+    """
+    pack directory to in zipfile
+
+    files are streamed into the archive one by one, already compressed files are stored.
+
+    :param manifest: regexp of archive paths to pack, other files except PACKED_ALWAYS are skipped
+    """
 
     with open(zipto, 'wb', 0o600) as output_file:
-        with ZipFile(output_file, 'w', ZIP_DEFLATED) as output_zip:
+        with ZipFile(output_file, 'w', compression, compresslevel=compresslevel) as output_zip:
             for root, _dirs, files in os.walk(path):
                 for fname in files:
                     filepath = os.path.join(root, fname)
                     arcname = os.path.join(*(filepath.split(os.path.sep)[1:]))
-                    output_zip.write(filepath, arcname)
+                    if manifest and (arcname not in PACKED_ALWAYS) and not re.fullmatch(manifest, arcname):
+                        continue
+                    output_zip.write(filepath, arcname, compress_type=ZIP_STORED if fname.endswith(STORED_SUFFIXES) else None)
 
 
 class AgentBase(ABC, TerminateContextMixin):
@@ -112,6 +139,8 @@ class AgentBase(ABC, TerminateContextMixin):
         self.module_instance = None
         self.original_signal_handlers = {}
         self.loop = None
+        self.output_compression = ZIP_DEFLATED
+        self.output_compresslevel = None
 
         load_agent_plugins()
 
@@ -128,15 +157,23 @@ class AgentBase(ABC, TerminateContextMixin):
             self.module_instance.terminate()
 
     def process_assignment(self, assignment):
-        """process assignment"""
+        """
+        process assignment
+
+        resource usage of the job and of the commands executed by module is reported in `manifest.json`
+        """
 
         jobdir = assignment['id']
         oldcwd = os.getcwd()
         os.makedirs(jobdir, mode=0o700)
         os.chdir(jobdir)
 
+        started = monotonic()
+        rusage_started = resource.getrusage(resource.RUSAGE_CHILDREN)
+        commands_usage = []
         try:
             self.module_instance = REGISTERED_MODULES[assignment['config']['module']]()
+            commands_usage = self.module_instance.usage
             retval = self.module_instance.run(assignment)
         except Exception as exc:  # pylint: disable=broad-except ; modules can raise variety of exceptions, but agent must continue
             self.log.exception(exc)
@@ -144,8 +181,26 @@ class AgentBase(ABC, TerminateContextMixin):
         finally:
             self.module_instance = None
 
+        rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage = {
+            'targets': len(assignment['targets']),
+            'wall_time': round(monotonic() - started, 3),
+            'user_time': round(rusage.ru_utime - rusage_started.ru_utime, 6),
+            'sys_time': round(rusage.ru_stime - rusage_started.ru_stime, 6),
+            'max_rss': max((item['max_rss'] for item in commands_usage), default=None),
+            'bytes_written': sum(x.stat().st_size for x in Path().rglob('*') if x.is_file()),
+            'commands': commands_usage
+        }
+        Path('manifest.json').write_text(json.dumps({'usage': usage}), encoding='utf-8')
+
         os.chdir(oldcwd)
-        zipdir(jobdir, f'{jobdir}.zip')
+        zipdir(
+            jobdir,
+            f'{jobdir}.zip',
+            compression=self.output_compression,
+            compresslevel=self.output_compresslevel,
+            manifest=getattr(REGISTERED_MODULES.get(assignment['config']['module']), 'OUTPUT_MANIFEST', None)
+        )
         shutil.rmtree(jobdir)
 
         self.log.info('process_assignment finished, retval=%d', retval)
@@ -158,6 +213,7 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
     def __init__(self, config):
         super().__init__()
 
+        self.config = config
         self.server = config['SERVER']
         self.apikey = config['APIKEY']
         self.queue = config['QUEUE']
@@ -165,22 +221,55 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         self.backoff_time = config['BACKOFF_TIME']
         self.net_timeout = config['NET_TIMEOUT']
         self.oneshot = config['ONESHOT']
+        self.slots = config['SLOTS']
+        self.output_compression = OUTPUT_COMPRESSION_METHODS[config['OUTPUT_COMPRESSION']]
+        self.output_compresslevel = config['OUTPUT_COMPRESSLEVEL']
+
+        self.heartbeat_interval = config['HEARTBEAT_INTERVAL']
 
         self.loop = True
+        self.workers = []
+        self.upload_spool = Queue(config['UPLOAD_SPOOL'])
+        # ids of processed and spooled jobs, their leases are kept alive by heartbeat thread until uploaded
+        self.leased_jobs = set()
+        self.running_job = None
+        self.heartbeat_stop = Event()
+        # oneshot agent fails on first get_assignment error, uploader and heartbeat threads use own connection pools
+        transport_args = {'backoff_time': self.backoff_time, 'backoff_max': config['BACKOFF_MAX']}
+        self.transport = Transport(self.apikey, self.net_timeout, retries=0 if self.oneshot else config['NET_RETRIES'], **transport_args)
+        self.upload_transport = Transport(self.apikey, self.net_timeout, retries=config['NET_RETRIES'], **transport_args)
+        self.heartbeat_transport = Transport(self.apikey, self.net_timeout, retries=0, **transport_args)
         self.get_assignment_url = f'{self.server}/api/v2/scheduler/job/assign'
         self.upload_output_url = f'{self.server}/api/v2/scheduler/job/output'
+        self.heartbeat_url = f'{self.server}/api/v2/scheduler/job/heartbeat'
 
         self.get_assignment_params = {}
         if self.queue:
             self.get_assignment_params['queue'] = self.queue
         if self.caps:
             self.get_assignment_params['caps'] = self.caps
+        if config['LONGPOLL']:
+            self.get_assignment_params['wait'] = config['LONGPOLL']
+
+    def terminate(self, signum=None, frame=None):  # pragma: no cover  pylint: disable=unused-argument  ; running over multiprocessing
+        """terminate at once, including slot workers"""
+
+        super().terminate(signum, frame)
+        self.signal_workers(signal.SIGTERM)
 
     def shutdown(self, signum=None, frame=None):  # pragma: no cover  pylint: disable=unused-argument  ; running over multiprocessing
         """wait for current assignment to finish"""
 
         self.log.info('received shutdown')
         self.loop = False
+        self.signal_workers(signal.SIGUSR1)
+
+    def signal_workers(self, signum):  # pragma: no cover  ; running over multiprocessing
+        """forward signal to running slot workers"""
+
+        for worker in self.workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signum)
 
     @contextmanager
     def shutdown_context(self):
@@ -195,7 +284,7 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
     def call_api(self, url, data):
         """call api"""
 
-        return requests.post(url, json=data, headers={'X-API-KEY': self.apikey}, timeout=self.net_timeout)
+        return self.transport.request('POST', url, json_data=data)
 
     def get_assignment(self):
         """get assignment from server"""
@@ -203,6 +292,7 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         assignment = None
         while self.loop and not assignment:
             try:
+                started = monotonic()
                 response = self.call_api(self.get_assignment_url, self.get_assignment_params)
                 response.raise_for_status()
                 assignment = response.json()
@@ -211,7 +301,8 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
                     if self.oneshot:  # pylint: disable=no-else-break  ; improves readability for following pragma
                         break
                     else:  # pragma: no cover ; running over multiprocessing
-                        sleep(self.backoff_time)
+                        # long-poll response-nowork arrives after server side wait, backoff only early responses
+                        sleep(max(self.backoff_time - (monotonic() - started), 0))
                         continue
                 JobAssignmentSchema().load(assignment)
             except (requests.exceptions.RequestException, json.decoder.JSONDecodeError, marshmallow.ValidationError) as exc:
@@ -219,51 +310,187 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
                 self.log.error('get_assignment error, %s', exc)
                 if self.oneshot:
                     return assignment, 1
-                sleep(self.backoff_time)
+                self.transport.backoff()
 
         self.log.info('get_assignment success, %s', assignment)
         return assignment, 0
 
-    def upload_output(self, output):
-        """upload assignment output to the server"""
+    def get_upload_offset(self, url):
+        """get size of already uploaded output"""
+
+        response = self.upload_transport.request('HEAD', url)
+        response.raise_for_status()
+        return int(response.headers.get('Upload-Offset', 0))
+
+    def upload_output(self, assignment_id, retval, path):
+        """
+        stream assignment output to the server, interrupted upload is resumed from the offset reported by server
 
+        :return: True if uploaded, False if retrying has been interrupted by agent shutdown
+        """
+
+        url = f'{self.upload_output_url}/{assignment_id}'
+        with open(path, 'rb') as ftmp:
+            headers = {
+                'Content-Type': 'application/zip',
+                'Upload-Length': str(os.path.getsize(path)),
+                'X-Sner-Retval': str(retval),
+                'X-Sner-Sha256': hashlib.file_digest(ftmp, 'sha256').hexdigest()
+            }
+
+        offset = 0
         uploaded = False
         while not uploaded:
             try:
-                response = self.call_api(self.upload_output_url, output)
+                if offset is None:
+                    offset = self.get_upload_offset(url)
+                with open(path, 'rb') as ftmp:
+                    ftmp.seek(offset)
+                    # streamed body cannot be replayed, upload is resumed by the loop
+                    response = self.upload_transport.request('PUT', url, data=ftmp, headers={**headers, 'Upload-Offset': str(offset)}, retries=0)
+                if response.status_code in (HTTPStatus.ACCEPTED, HTTPStatus.CONFLICT):
+                    offset = int(response.headers['Upload-Offset'])
+                    continue
                 response.raise_for_status()
                 uploaded = True
             except requests.exceptions.RequestException as exc:
                 self.log.error('upload_output error, %s', exc)
-                sleep(self.backoff_time)
-        self.log.info('upload_output success, %s', output['id'])
+                if not self.loop:
+                    return False
+                offset = None
+                self.upload_transport.backoff()
+        self.log.info('upload_output success, %s', assignment_id)
+        return True
+
+    def uploader(self):
+        """
+        upload outputs from spool until stop sentinel is received, on shutdown failed uploads are not
+        retried and outputs are left on disk
+        """
+
+        while (item := self.upload_spool.get()) is not None:
+            assignment_id, retval, path = item
+            try:
+                if not self.upload_output(assignment_id, retval, path):
+                    self.log.warning('uploader shutdown, output left in %s', path)
+                    continue
+                os.remove(path)
+            except OSError as exc:  # pragma: no cover  ; uploader must keep draining the spool, otherwise main loop would block
+                self.log.error('uploader error, %s', exc)
+            finally:
+                self.leased_jobs.discard(assignment_id)
+
+    def send_heartbeat(self, job_id):
+        """
+        extend lease of the job on server, report progress of running job
+
+        :return: False if the server does not hold the job anymore (finished or reaped)
+        """
+
+        data = {'id': job_id}
+        module_instance = self.module_instance
+        if (job_id == self.running_job) and module_instance:
+            data['progress'] = module_instance.progress
+
+        response = self.heartbeat_transport.request('POST', self.heartbeat_url, json_data=data)
+        response.raise_for_status()
+        return response.json().get('message') != 'discard job'
+
+    def heartbeat(self):
+        """keep leases of running and spooled jobs until stopped, abandon jobs discarded by server"""
+
+        while not self.heartbeat_stop.wait(self.heartbeat_interval):
+            for job_id in list(self.leased_jobs):
+                try:
+                    if self.send_heartbeat(job_id):
+                        continue
+                except (requests.exceptions.RequestException, json.decoder.JSONDecodeError) as exc:
+                    # lease is extended on next heartbeat, server reaps the job only after lease expiration
+                    self.log.error('heartbeat error, %s', exc)
+                    continue
+
+                self.log.warning('heartbeat lease lost, %s', job_id)
+                self.leased_jobs.discard(job_id)
+                module_instance = self.module_instance
+                if (job_id == self.running_job) and module_instance:
+                    module_instance.terminate()
 
     def run(self, **kwargs):
-        """fetch, process and upload output for assignment given by server"""
+        """
+        fetch, process and upload output for assignment given by server
+
+        outputs are handed over to background uploader through bounded spool (UPLOAD_SPOOL outputs
+        on disk), next assignment is fetched and processed while previous outputs are being uploaded.
+        pending uploads are drained before exit, after shutdown signal failed uploads are not retried.
+        leases of the jobs are kept alive by background heartbeat every HEARTBEAT_INTERVAL seconds
+        (0 disables heartbeat).
+        """
+
+        if self.slots > 1:
+            return self.run_slots()
 
         retval = 0
+        uploader = Thread(target=self.uploader, name='uploader')
+        uploader.start()
+        heartbeat = Thread(target=self.heartbeat, name='heartbeat', daemon=True)
+        if self.heartbeat_interval:
+            heartbeat.start()
         with self.terminate_context(), self.shutdown_context():
             while self.loop:
                 assignment, retval = self.get_assignment()
 
                 if assignment:
+                    self.leased_jobs.add(assignment['id'])
+                    self.running_job = assignment['id']
                     retval = self.process_assignment(assignment)
-
-                    assignment_output_file = f'{assignment["id"]}.zip'
-                    output = {
-                        'id': assignment['id'],
-                        'retval': retval,
-                        'output': b64encode(Path(assignment_output_file).read_bytes()).decode('utf-8')
-                    }
-                    self.upload_output(output)
-                    os.remove(assignment_output_file)
+                    self.running_job = None
+                    # uploader must not depend on working directory changed by process_assignment
+                    self.upload_spool.put((assignment['id'], retval, os.path.abspath(f'{assignment["id"]}.zip')))
 
                 if self.oneshot:
-                    self.loop = False
+                    break
+
+            self.upload_spool.put(None)
+            uploader.join()
+            self.heartbeat_stop.set()
+            if heartbeat.is_alive():
+                heartbeat.join()
+
+        self.transport.close()
+        self.upload_transport.close()
+        self.heartbeat_transport.close()
 
         self.log.info('exit')
         return retval
 
+    def run_slots(self):
+        """
+        run `slots` independent agent loops in worker subprocesses
+
+        each slot fetches, processes and uploads assignments on its own. process_assignment changes
+        working directory, which is process-wide, hence the slots are processes rather than threads.
+        shutdown and terminate signals are forwarded to all workers.
+        """
+
+        slot_config = {**self.config, 'SLOTS': 1}
+        self.workers = [multiprocessing.Process(target=run_slot, args=(slot_config,), name=f'slot{idx}') for idx in range(self.slots)]
+        for worker in self.workers:
+            worker.start()
+        self.log.info('started %d slots', len(self.workers))
+
+        with self.terminate_context(), self.shutdown_context():
+            for worker in self.workers:
+                worker.join()
+
+        self.log.info('exit')
+        return int(any(worker.exitcode for worker in self.workers))
+
+
+def run_slot(config):  # pragma: no cover  ; running over multiprocessing
+    """slot worker process entrypoint"""
+
+    sys.exit(ServerableAgent(config).run())
+
 
 class AssignableAgent(AgentBase):
     """agent to execute assignments supplied from command line"""
@@ -302,6 +529,8 @@ def main(argv=None):
     parser.add_argument('--queue', help='specific queue selector')
     parser.add_argument('--caps', nargs='+', help='agent capabilities tags')
     parser.add_argument('--oneshot', action='store_true', help='process single assignment and exit')
+    parser.add_argument('--longpoll', type=int, help='wait up to N seconds on server for assignment (long-poll)')
+    parser.add_argument('--slots', type=int, help='process up to N assignments concurrently')
 
     args = parser.parse_args(argv)
     if args.debug:
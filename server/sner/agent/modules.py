@@ -24,8 +24,10 @@ import signal
 import shlex
 import subprocess
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from importlib import import_module
 from pathlib import Path
+from time import monotonic, sleep
 
 from schema import Schema
 
@@ -54,9 +56,21 @@ class ModuleBase(ABC):
         'module': str
     })
 
+    # regexp of job directory files required by the server (parser), other files are not packed into output
+    # archive. None packs all files.
+    OUTPUT_MANIFEST = None
+
     def __init__(self):
         self.log = logging.getLogger(f'sner.agent.module.{self.__class__.__name__}')
-        self.process = None
+        self.processes = set()
+        self.terminated = False
+        self.usage = []
+
+    @property
+    def progress(self):
+        """number of targets processed by already finished commands"""
+
+        return sum(item['targets'] or 0 for item in self.usage)
 
     @abstractmethod
     def run(self, assignment):
@@ -70,24 +84,74 @@ class ModuleBase(ABC):
         """terminate method; should terminate module immediatelly"""
 
     def _terminate(self):  # pragma: no cover  ; running over multiprocessing
-        """terminate executed command"""
-
-        if self.process and (self.process.poll() is None):
-            try:
-                os.kill(self.process.pid, signal.SIGTERM)
-            except OSError as exc:
-                self.log.error(exc)
+        """terminate executed commands, no other command is started afterwards"""
+
+        self.terminated = True
+        # processes are reaped by _execute (wait4), poll() here would steal exit status and resource usage
+        for process in list(self.processes):
+            if process.returncode is None:
+                try:
+                    os.kill(process.pid, signal.SIGTERM)
+                except OSError as exc:
+                    self.log.error(exc)
+
+    def _execute(self, cmd, output_file='output', targets=None):
+        """
+        execute command, capture output and account resources used by the command
 
-    def _execute(self, cmd, output_file='output'):
-        """execute command and capture output"""
+        :param targets: number of targets processed by the command, reported in usage
+        """
 
         cmdarg = shlex.split(cmd) if isinstance(cmd, str) else cmd
+        started = monotonic()
         with open(output_file, 'w', encoding='utf-8') as output_fd:
-            self.process = subprocess.Popen(cmdarg, stdin=subprocess.DEVNULL, stdout=output_fd, stderr=subprocess.STDOUT)  # noqa: E501  pylint: disable=consider-using-with
-            retval = self.process.wait()
-            self.process = None
+            process = subprocess.Popen(cmdarg, stdin=subprocess.DEVNULL, stdout=output_fd, stderr=subprocess.STDOUT)  # noqa: E501  pylint: disable=consider-using-with
+            self.processes.add(process)
+            if self.terminated:  # pragma: no cover  ; race with terminate from other thread
+                self._terminate()
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = retval = os.waitstatus_to_exitcode(status)
+            self.processes.discard(process)
+
+        self.usage.append({
+            'cmd': cmdarg[0],
+            'targets': targets,
+            'wall_time': round(monotonic() - started, 3),
+            'user_time': rusage.ru_utime,
+            'sys_time': rusage.ru_stime,
+            'max_rss': rusage.ru_maxrss,
+            'bytes_written': sum(x.stat().st_size for x in [Path(output_file), *Path().glob(f'{output_file}.*')])
+        })
         return retval
 
+    def _execute_many(self, commands, concurrency=1, delay=0):
+        """
+        execute commands by pool of up to `concurrency` concurrently running commands
+
+        commands are started at least `delay` seconds apart and after `delay` since a pool slot has been
+        freed, with concurrency 1 commands are executed sequentially with `delay` between them.
+        no command is started after module termination.
+
+        :param commands: iterable of `_execute` (cmd, output_file, targets) argument tuples, consumed lazily
+        :return: list of command retvals in order of commands
+        """
+
+        futures = []
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='execute') as executor:
+            for args in commands:
+                if len(running) >= concurrency:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                if futures:
+                    sleep(delay)
+                if self.terminated:  # pragma: no cover  ; not tested
+                    break
+                future = executor.submit(self._execute, *args)
+                futures.append(future)
+                running.add(future)
+
+        return [future.result() for future in futures]
+
     def enumerate_service_targets(self, targets):
         """
         parse list of service targets, discards invalid values
@@ -0,0 +1,93 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+sner agent http transport
+"""
+
+import gzip
+import json
+import logging
+from http import HTTPStatus
+from random import uniform
+from time import monotonic, sleep
+
+import requests
+
+
+class Transport:  # pylint: disable=too-many-instance-attributes
+    """
+    agent http transport
+
+    * persistent connection pool (requests.Session)
+    * gzip compressed json request bodies
+    * exponential backoff with full jitter, so the agents reconnecting after server outage do not
+      hit the server at once
+    * retry budget; transient failures (connection errors, server busy or failing) are retried
+      up to `retries` times within single call
+    """
+
+    GZIP_MIN_SIZE = 256
+    BACKOFF_MAX_EXPONENT = 32
+    RETRY_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.BAD_GATEWAY, HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT)
+
+    def __init__(self, apikey, timeout, *, backoff_time, backoff_max, retries):  # pylint: disable=too-many-arguments
+        self.log = logging.getLogger('sner.agent.transport')
+        self.timeout = timeout
+        self.backoff_time = backoff_time
+        self.backoff_max = backoff_max
+        self.retries = retries
+
+        self.session = requests.Session()
+        self.session.headers['X-API-KEY'] = apikey
+        self.failures = 0
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0}
+
+    def backoff(self):
+        """sleep exponentially growing randomized time according to number of consecutive failures"""
+
+        # exponent is clamped, long outage would overflow float conversion of the power
+        sleep(uniform(0, min(self.backoff_max, self.backoff_time * 2 ** min(self.failures, self.BACKOFF_MAX_EXPONENT))))
+
+    def request(self, method, url, *, data=None, json_data=None, headers=None, retries=None):  # pylint: disable=too-many-arguments
+        """
+        perform http request, retry transient failures with backoff
+
+        :param retries: retry budget override, streamed (non-rewindable) bodies must not be retried
+        :return: response, for other than transient failures caller checks the response status
+        :raises requests.exceptions.RequestException: when retry budget is exhausted
+        """
+
+        headers = dict(headers or {})
+        if json_data is not None:
+            data = json.dumps(json_data).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if len(data) >= self.GZIP_MIN_SIZE:
+                data = gzip.compress(data)
+                headers['Content-Encoding'] = 'gzip'
+
+        budget = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            self.stats['calls'] += 1
+            started = monotonic()
+            try:
+                response = self.session.request(method, url, data=data, headers=headers, timeout=self.timeout)
+                if response.status_code in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                self.log.debug('%s %s status=%d latency=%.3fs attempt=%d', method, url, response.status_code, monotonic() - started, attempt)
+                self.failures = 0
+                return response
+            except requests.exceptions.RequestException as exc:
+                self.failures += 1
+                self.stats['failures'] += 1
+                self.log.debug('%s %s failed latency=%.3fs attempt=%d, %s', method, url, monotonic() - started, attempt, exc)
+                if attempt >= budget:
+                    raise
+                attempt += 1
+                self.stats['retries'] += 1
+                self.backoff()
+
+    def close(self):
+        """close pooled connections and log transport counters"""
+
+        self.session.close()
+        self.log.info('transport stats, %s', self.stats)
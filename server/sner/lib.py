@@ -7,6 +7,7 @@ import os
 import signal
 from contextlib import contextmanager
 from ipaddress import ip_address
+from itertools import islice
 from pathlib import Path
 from zipfile import ZipFile
 
@@ -76,3 +77,11 @@ def is_address(addr):
         return True
     except ValueError:
         return False
+
+
+def batched(iterable, size):
+    """yield lists of up to size items from iterable"""
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
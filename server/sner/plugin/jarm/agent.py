@@ -3,9 +3,7 @@
 sner agent jarm module
 """
 
-from time import sleep
-
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -21,6 +19,7 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'jarm',
         'delay': int,
+        Optional('concurrency'): int,
     })
 
     def __init__(self):
@@ -33,7 +32,18 @@ class AgentModule(ModuleBase):
         super().run(assignment)
         ret = 0
 
+        for retval in self._execute_many(self.commands(assignment), assignment['config'].get('concurrency', 1), assignment['config']['delay']):
+            ret |= retval
+
+        return ret
+
+    def commands(self, assignment):
+        """yield command for each target"""
+
         for idx, target, proto, host, port in self.enumerate_service_targets(assignment['targets']):
+            if not self.loop:  # pragma: no cover  ; not tested
+                break
+
             if proto != 'tcp':
                 self.log.warning('unsupported target (proto): %s', target)
                 continue
@@ -41,14 +51,7 @@ class AgentModule(ModuleBase):
             target_args = ['-p', port]
             target_args.append(host.replace('[', '').replace(']', ''))
 
-            cmd = ['jarm', '-v'] + target_args
-            ret |= self._execute(cmd, f'output-{idx}.out')
-            sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
-
-        return ret
+            yield ['jarm', '-v'] + target_args, f'output-{idx}.out', 1
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
@@ -4,9 +4,8 @@ sner agent manymap module
 """
 
 import shlex
-from time import sleep
 
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -23,8 +22,12 @@ class AgentModule(ModuleBase):
         'module': 'manymap',
         'args': str,
         'delay': int,
+        Optional('concurrency'): int,
     })
 
+    # nmap normal and grepable outputs duplicate xml output
+    OUTPUT_MANIFEST = r'output-[0-9]+|output-[0-9]+\.xml'
+
     def __init__(self):
         super().__init__()
         self.loop = True
@@ -35,7 +38,21 @@ class AgentModule(ModuleBase):
         super().run(assignment)
         ret = 0
 
+        for retval in self._execute_many(self.commands(assignment), assignment['config'].get('concurrency', 1), assignment['config']['delay']):
+            ret |= retval
+
+        if not self.loop:  # pragma: no cover  ; not tested
+            ret |= 2
+
+        return ret
+
+    def commands(self, assignment):
+        """yield command for each target"""
+
         for idx, _, proto, host, port in self.enumerate_service_targets(assignment['targets']):
+            if not self.loop:  # pragma: no cover  ; not tested
+                break
+
             output_args = ['-oA', f'output-{idx}', '--reason']
             target_args = ['-p', f'{proto[0].upper()}:{port}']
             if (host[0] == '[') and (host[-1] == ']'):
@@ -43,15 +60,7 @@ class AgentModule(ModuleBase):
             else:
                 target_args += [host]
 
-            cmd = ['nmap'] + shlex.split(assignment['config']['args']) + output_args + target_args
-            ret |= self._execute(cmd, f'output-{idx}')
-
-            sleep(assignment['config']['delay'])
-            if not self.loop:  # pragma: no cover  ; not tested
-                ret |= 2
-                break
-
-        return ret
+            yield ['nmap'] + shlex.split(assignment['config']['args']) + output_args + target_args, f'output-{idx}', 1
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
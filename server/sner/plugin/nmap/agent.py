@@ -23,9 +23,13 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'nmap',
         'args': str,
-        Optional('timing_perhost'): int
+        Optional('timing_perhost'): int,
+        Optional('shards'): int
     })
 
+    # nmap normal and grepable outputs duplicate xml output
+    OUTPUT_MANIFEST = r'targets6?(-[0-9]+)?|output6?(-[0-9]+)?|output6?(-[0-9]+)?\.xml'
+
     def __init__(self):
         super().__init__()
         self.loop = True
@@ -55,15 +59,15 @@ class AgentModule(ModuleBase):
 
         return targets, targets6
 
-    def run_scan(
-        self,
+    @staticmethod
+    def scan_command(
         assignment,
         targets,
         targets_file,
         output_file,
         extra_args=None
     ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
-        """run scan"""
+        """prepare scan, return `_execute` arguments"""
 
         Path(targets_file).write_text('\n'.join(targets), encoding='utf-8')
 
@@ -82,19 +86,36 @@ class AgentModule(ModuleBase):
         target_args = ['-iL', targets_file]
 
         cmd = ['nmap'] + (extra_args or []) + shlex.split(assignment['config']['args']) + timing_args + output_args + target_args
-        return self._execute(cmd, output_file)
+        return cmd, output_file, len(targets)
+
+    def commands(self, assignment, shards):
+        """
+        yield scan for each address family shard
+
+        with `shards` > 1 targets of each family are split into numbered shards (`output-N.xml`, `output6-N.xml`),
+        `timing_perhost` rate applies to the shard targets, so the rate of the whole job does not change.
+        """
+
+        targets, targets6 = self.sort_ipv6_targets(assignment['targets'])
+        for family_targets, family, extra_args in ((targets, '', None), (targets6, '6', ['-6'])):
+            for idx in range(shards):
+                if not self.loop:
+                    return
+
+                if not (shard_targets := family_targets[idx::shards]):
+                    continue
+                suffix = f'{family}-{idx}' if shards > 1 else family
+                yield self.scan_command(assignment, shard_targets, f'targets{suffix}', f'output{suffix}', extra_args)
 
     def run(self, assignment):
-        """run the agent"""
+        """run the agent, shards are scanned in parallel"""
 
         super().run(assignment)
         ret = 0
 
-        targets, targets6 = self.sort_ipv6_targets(assignment['targets'])
-        if targets and self.loop:
-            ret |= self.run_scan(assignment, targets, 'targets', 'output')
-        if targets6 and self.loop:
-            ret |= self.run_scan(assignment, targets6, 'targets6', 'output6', extra_args=['-6'])
+        shards = assignment['config'].get('shards', 1)
+        for retval in self._execute_many(self.commands(assignment, shards), concurrency=shards):
+            ret |= retval
         return ret
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
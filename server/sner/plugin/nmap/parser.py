@@ -7,21 +7,23 @@ import json
 import re
 import sys
 from datetime import datetime
-from pathlib import Path
 from pprint import pprint
 from time import time
+from xml.etree.ElementTree import ParseError, tostring
 from zipfile import ZipFile
 
-import libnmap.parser
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import iterparse
+from libnmap.parser import NmapParser, NmapParserException
 
-from sner.lib import file_from_zip, is_zip
+from sner.lib import is_zip
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
 class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     """nmap xml output parser"""
 
-    ARCHIVE_PATHS = r'output\.xml|output6\.xml'
+    ARCHIVE_PATHS = r'output6?(-[0-9]+)?\.xml'
 
     @classmethod
     def parse_path(cls, path):
@@ -32,19 +34,39 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
         if is_zip(path):
             with ZipFile(path) as fzip:
                 for fname in filter(lambda x: re.match(cls.ARCHIVE_PATHS, x), fzip.namelist()):
-                    pidb = cls._parse_data(file_from_zip(path, fname).decode('utf-8'), pidb)
+                    with fzip.open(fname) as fdata:
+                        pidb = cls._parse_data(fdata, pidb)
 
             return pidb
 
-        return cls._parse_data(Path(path).read_text(encoding='utf-8'), pidb)
+        with open(path, 'rb') as fdata:
+            return cls._parse_data(fdata, pidb)
+
+    @staticmethod
+    def _iter_hosts(fdata):
+        """
+        stream host elements from nmap xml file object, processed elements are
+        cleared so the whole document tree is never held in memory
+        """
+
+        root = None
+        try:
+            for event, elem in iterparse(fdata, events=('start', 'end')):
+                if root is None:
+                    root = elem
+                elif (event == 'end') and (elem.tag == 'host'):
+                    yield elem
+                    root.clear()
+        except (ParseError, DefusedXmlException) as exc:
+            raise NmapParserException(f'Wrong XML structure: cannot parse data: {exc}') from None
 
     @classmethod
-    def _parse_data(cls, data, pidb):
-        """parse raw string data"""
+    def _parse_data(cls, fdata, pidb):
+        """parse nmap xml data from binary file object"""
 
-        report = libnmap.parser.NmapParser.parse_fromstring(data)
+        for xhost in cls._iter_hosts(fdata):
+            ihost = NmapParser.parse(tostring(xhost, encoding='unicode'), data_type='XML')
 
-        for ihost in report.hosts:
             # metadata
             via_target = ihost.user_target_hostname or ihost.address
             import_time = datetime.fromtimestamp(int(ihost.starttime or time()))
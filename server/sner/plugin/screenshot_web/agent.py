@@ -7,10 +7,9 @@ import json
 from datetime import datetime
 from pathlib import Path
 from shutil import rmtree
-from time import sleep
 from uuid import uuid4
 
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -26,12 +25,13 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'screenshot_web',
         'delay': int,
-        'geometry': str
+        'geometry': str,
+        Optional('concurrency'): int,
     })
 
     def __init__(self):
         super().__init__()
-        self.loop = False
+        self.loop = True
 
     # pylint: disable=duplicate-code
     def run(self, assignment):
@@ -40,32 +40,33 @@ class AgentModule(ModuleBase):
         super().run(assignment)
         results = {}
 
+        self._execute_many(self.commands(assignment, results), assignment['config'].get('concurrency', 1), assignment['config']['delay'])
+        for profile_dir in Path().glob('*.profile'):
+            rmtree(profile_dir)
+        Path('results.json').write_text(json.dumps(results), encoding='utf-8')
+
+        return 0
+
+    def commands(self, assignment, results):
+        """yield command for each target, record started screenshots into results"""
+
         for item in assignment['targets']:
+            if not self.loop:  # pragma: no cover  ; not tested
+                break
+
             url = item.split(' ', maxsplit=1)[-1]
             filebase = str(uuid4())
             screenshot_path = Path(f'{filebase}.png')
             profile_dir = Path(f'{filebase}.profile')
             profile_dir.mkdir()
 
-            self._execute(
-                [
-                    'timeout', '60',
-                    'firefox', '--headless', '--profile', profile_dir,
-                    '--screenshot', screenshot_path.absolute(), '--window-size', assignment['config']['geometry'],
-                    url
-                ],
-                f'{filebase}.output'
-            )
-            rmtree(f'{profile_dir}')
             results[str(screenshot_path)] = {'target': item, 'timestamp': datetime.now().isoformat()}
-            Path('results.json').write_text(json.dumps(results), encoding='utf-8')
-
-            sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
-
-        return 0
+            yield [
+                'timeout', '60',
+                'firefox', '--headless', '--profile', profile_dir,
+                '--screenshot', screenshot_path.absolute(), '--window-size', assignment['config']['geometry'],
+                url
+            ], f'{filebase}.output', 1
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
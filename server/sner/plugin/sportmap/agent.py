@@ -28,6 +28,9 @@ class AgentModule(ModuleBase):
         Optional('delay'): int,
     })
 
+    # nmap normal and grepable outputs duplicate xml output
+    OUTPUT_MANIFEST = r'output6?\.targets|output6?-sport-[a-z0-9]+|output6?-sport-[a-z0-9]+\.xml'
+
     DEFAULT_SPORT = -1
 
     def __init__(self):
@@ -67,7 +70,7 @@ class AgentModule(ModuleBase):
             config_args = shlex.split(assignment['config']['args'])
 
             cmd = ['nmap'] + (extra_args or []) + config_args + output_args + sport_args + target_args
-            ret |= self._execute(cmd, output_file)
+            ret |= self._execute(cmd, output_file, targets=len(targets))
 
             if not self.loop:  # pragma: no cover  ; not tested
                 return 2
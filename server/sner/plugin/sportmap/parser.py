@@ -11,7 +11,6 @@ from collections import defaultdict
 from pprint import pprint
 from zipfile import ZipFile
 
-from sner.lib import file_from_zip
 from sner.plugin.nmap.parser import ParserModule as NmapParserModule
 from sner.server.parser import ParsedItemsDb, ParserBase
 
@@ -71,10 +70,8 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
             for fname in filter(lambda x: re.match(cls.ARCHIVE_PATHS, x), fzip.namelist()):
                 # recombine ipv4 and ipv6 scans
                 sport = fname.replace('.xml', '').split('-')[-1]
-                allparsed[sport] = NmapParserModule._parse_data(  # pylint: disable=protected-access
-                    file_from_zip(path, fname).decode('utf-8'),
-                    allparsed[sport]
-                )
+                with fzip.open(fname) as fdata:
+                    allparsed[sport] = NmapParserModule._parse_data(fdata, allparsed[sport])  # pylint: disable=protected-access
 
         if "default" not in allparsed:  # pragma: no cover  ; won't test
             raise ValueError(f"missing default scan for {path}")
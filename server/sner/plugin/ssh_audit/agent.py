@@ -4,7 +4,7 @@ sner agent ssh audit module
 """
 
 from pathlib import Path
-from schema import Schema
+from schema import Optional, Schema
 from sner.agent.modules import ModuleBase
 
 
@@ -18,6 +18,7 @@ class AgentModule(ModuleBase):
 
     CONFIG_SCHEMA = Schema({
         'module': 'ssh_audit',
+        Optional('concurrency'): int,
     })
 
     def run(self, assignment):
@@ -27,6 +28,9 @@ class AgentModule(ModuleBase):
 
         target_args = ['-T', 'targets']
         output_args = ['-j', '-n']
+        if 'concurrency' in assignment['config']:
+            # ssh-audit scans targets list by own thread pool
+            target_args += [f'--threads={assignment["config"]["concurrency"]}']
 
         cmd = ['ssh-audit'] + target_args + output_args
 
@@ -3,9 +3,7 @@
 sner agent testssl module
 """
 
-from time import sleep
-
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -21,6 +19,7 @@ class AgentModule(ModuleBase):  # pragma: cover-ignore-if-not-pytestslow
     CONFIG_SCHEMA = Schema({
         'module': 'testssl',
         'delay': int,
+        Optional('concurrency'): int,
     })
 
     def __init__(self):
@@ -50,21 +49,27 @@ class AgentModule(ModuleBase):  # pragma: cover-ignore-if-not-pytestslow
         super().run(assignment)
         ret = 0
 
+        for retval in self._execute_many(self.commands(assignment), assignment['config'].get('concurrency', 1), assignment['config']['delay']):
+            ret |= self._filter_exit_codes(retval)
+
+        if not self.loop:  # pragma: no cover  ; not tested
+            ret = -16
+
+        return ret
+
+    def commands(self, assignment):
+        """yield command for each target"""
+
         for idx, target, proto, host, port in self.enumerate_service_targets(assignment['targets']):
+            if not self.loop:  # pragma: no cover  ; not tested
+                break
+
             if proto != 'tcp':
                 self.log.warning('ignoring non-tcp target %s', target)
                 continue
 
             target_args = ['--jsonfile-pretty', f'output-{idx}.json', f'{host}:{port}']
-            cmd = ['testssl.sh', '--quiet', '--full', '-6', '--connect-timeout', '5', '--openssl-timeout', '5'] + target_args
-            ret |= self._filter_exit_codes(self._execute(cmd, f'output-{idx}'))
-
-            sleep(assignment['config']['delay'])
-            if not self.loop:  # pragma: no cover  ; not tested
-                ret = -16
-                break
-
-        return ret
+            yield ['testssl.sh', '--quiet', '--full', '-6', '--connect-timeout', '5', '--openssl-timeout', '5'] + target_args, f'output-{idx}', 1
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
@@ -11,6 +11,7 @@ from sqlalchemy import func
 
 from sner.server.extensions import db
 
+from sner.server.scheduler.core import SchedulerService
 from sner.server.scheduler.models import Heatmap, Job, Queue, Readynet, Target
 from sner.server.storage.models import Host, Note, Service, Versioninfo, Vuln
 
@@ -42,5 +43,10 @@ def get_metrics():
 
     metrics['sner_scheduler_readynets_available_total'] = db.session.query(func.distinct(Readynet.hashval)).count()
 
+    # scheduler lock hold time, accounted per server process
+    metrics['sner_scheduler_lock_hold_seconds_count'] = SchedulerService.lock_hold_stats['count']
+    metrics['sner_scheduler_lock_hold_seconds_sum'] = SchedulerService.lock_hold_stats['sum']
+    metrics['sner_scheduler_lock_hold_seconds_max'] = SchedulerService.lock_hold_stats['max']
+
     output = '\n'.join(f'{key} {val}' for key, val in metrics.items())
     return output
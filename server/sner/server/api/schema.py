@@ -21,6 +21,7 @@ class JobAssignArgsSchema(BaseSchema):
 
     queue = fields.String()
     caps = fields.List(fields.String)
+    wait = fields.Integer(validate=validate.Range(min=0))
 
 
 class JobAssignmentConfigSchema(BaseSchema):
@@ -61,6 +62,13 @@ class JobOutputSchema(BaseSchema):
     output = fields.String()
 
 
+class JobHeartbeatSchema(BaseSchema):
+    """job heartbeat schema"""
+
+    id = fields.String(required=True, validate=validate.Regexp(r'^[a-f0-9\-]{36}$'))
+    progress = fields.Integer(validate=validate.Range(min=0))
+
+
 class PublicNoteSchema(BaseSchema):
     """public note schema"""
 
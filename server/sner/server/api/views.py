@@ -8,8 +8,9 @@ import json
 from base64 import b64decode
 from dataclasses import dataclass
 from http import HTTPStatus
+from time import monotonic
 
-from flask import current_app, jsonify, Response
+from flask import current_app, jsonify, request, Response
 from flask_login import current_user
 from flask_smorest import Blueprint, Page
 from sqlalchemy import and_, or_, select
@@ -18,7 +19,7 @@ import sner.server.api.schema as api_schema
 from sner.server.api.core import get_metrics
 from sner.server.auth.core import apikey_required
 from sner.server.extensions import db
-from sner.server.scheduler.core import SchedulerService, SchedulerServiceBusyException
+from sner.server.scheduler.core import JobManager, SchedulerService, SchedulerServiceBusyException
 from sner.server.scheduler.models import Job
 from sner.server.storage.models import Host, Note, Service, Vuln, Versioninfo
 from sner.server.storage.version_parser import is_in_version_range, parse as versionspec_parse
@@ -43,16 +44,58 @@ class QueryPage(Page):
 @blueprint.arguments(api_schema.JobAssignArgsSchema)
 @blueprint.response(HTTPStatus.OK, api_schema.JobAssignmentSchema)
 def v2_scheduler_job_assign_route(args):
-    """assign job for agent"""
+    """
+    assign job for agent
+
+    with `wait` (long-poll) the request is held until work becomes available
+    or wait timeout (capped by SNER_SCHEDULER_LONGPOLL_TIMEOUT) expires
+    """
 
     if current_app.config['SNER_MAINTENANCE']:
         return {}  # nowork
 
+    wait = min(args.get('wait', 0), current_app.config['SNER_SCHEDULER_LONGPOLL_TIMEOUT'])
+    if not wait:
+        return try_job_assign(args) or {}
+
+    deadline = monotonic() + wait
+    with SchedulerService.work_listener() as wait_for_work:
+        if not wait_for_work:
+            # too many waiters, agent polls again later
+            return try_job_assign(args) or {}
+        while not (resp := try_job_assign(args)) and ((remaining := deadline - monotonic()) > 0):
+            # do not hold session (transaction) while waiting
+            db.session.rollback()
+            wait_for_work(min(remaining, SchedulerService.TIMEOUT_JOB_ASSIGN) if resp is None else remaining)
+    return resp or {}
+
+
+def try_job_assign(args):
+    """
+    assign job helper
+
+    :return: assignment, empty dict if there's no work or None if scheduler is busy
+    """
+
     try:
-        resp = SchedulerService.job_assign(args.get('queue'), args.get('caps', []))
+        return SchedulerService.job_assign(args.get('queue'), args.get('caps', []))
     except SchedulerServiceBusyException:
-        resp = {}  # nowork
-    return resp
+        return None
+
+
+@blueprint.route('/v2/scheduler/job/heartbeat', methods=['POST'])
+@apikey_required('agent')
+@blueprint.arguments(api_schema.JobHeartbeatSchema)
+def v2_scheduler_job_heartbeat_route(args):
+    """extend lease of assigned job, optionaly report job progress"""
+
+    job = Job.query.filter(Job.id == args['id'], Job.retval == None).one_or_none()  # noqa: E711  pylint: disable=singleton-comparison
+    if not job:
+        # job has been finished or reaped, agent should abandon it
+        return jsonify({'message': 'discard job'})
+
+    JobManager.heartbeat(job, args.get('progress'))
+    return jsonify({'message': 'success'})
 
 
 @blueprint.route('/v2/scheduler/job/output', methods=['POST'])
@@ -80,6 +123,53 @@ def v2_scheduler_job_output_route(args):
     return jsonify({'message': 'success'})
 
 
+@blueprint.route('/v2/scheduler/job/output/<job_id>', methods=['HEAD', 'PUT'])
+@apikey_required('agent')
+def v2_scheduler_job_output_upload_route(job_id):  # pylint: disable=too-many-return-statements
+    """
+    receive output from assigned job as streamed binary body
+
+    * `HEAD` returns size of already uploaded data in `Upload-Offset` header
+    * `PUT` writes body at `Upload-Offset` (default 0) of the upload, `Upload-Length` is total size
+      of the output, `X-Sner-Retval` job retval and `X-Sner-Sha256` output digest. upload is
+      finished when all data has been received; interrupted uploads are resumed from current offset.
+    """
+
+    job = Job.query.filter(Job.id == job_id, Job.retval == None).one_or_none()  # noqa: E711  pylint: disable=singleton-comparison
+    if not job:
+        # invalid/repeated requests are silently discarded, agent would delete working data
+        # on it's side as well
+        return jsonify({'message': 'discard job'})
+
+    if request.method == 'HEAD':
+        return '', HTTPStatus.OK, {'Upload-Offset': str(JobManager.upload_offset(job))}
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', 0))
+        length = int(request.headers['Upload-Length'])
+        retval = int(request.headers['X-Sner-Retval'])
+        digest = request.headers['X-Sner-Sha256']
+    except (KeyError, ValueError):
+        return jsonify({'message': 'invalid request'}), HTTPStatus.BAD_REQUEST
+
+    uploaded = JobManager.upload_output(job, request.stream, offset)
+    if uploaded is None:
+        return jsonify({'message': 'invalid offset'}), HTTPStatus.CONFLICT, {'Upload-Offset': str(JobManager.upload_offset(job))}
+    if uploaded < length:
+        return jsonify({'message': 'partial upload'}), HTTPStatus.ACCEPTED, {'Upload-Offset': str(uploaded)}
+    if (uploaded > length) or (not JobManager.upload_verify(job, digest)):
+        JobManager.upload_path(job).unlink(missing_ok=True)
+        return jsonify({'message': 'invalid upload'}), HTTPStatus.BAD_REQUEST
+
+    try:
+        SchedulerService.job_output(job, retval, JobManager.upload_path(job))
+    except SchedulerServiceBusyException:
+        return jsonify({'message': 'server busy'}), HTTPStatus.TOO_MANY_REQUESTS
+
+    JobManager.upload_path(job).unlink()
+    return jsonify({'message': 'success'})
+
+
 @blueprint.route('/v2/metrics')
 @blueprint.response(HTTPStatus.OK, {'type': 'string'}, content_type='text/plain')
 def v2_stats_prometheus_route():
@@ -9,6 +9,7 @@ import logging.config
 import os
 import sys
 from http import HTTPStatus
+from threading import BoundedSemaphore
 
 import flask.cli
 import yaml
@@ -17,6 +18,7 @@ from flask_login import current_user
 from flask_wtf.csrf import generate_csrf, CSRFProtect, CSRFError
 from flask_cors import CORS
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from sner.agent.modules import load_agent_plugins
@@ -26,7 +28,8 @@ from sner.server.extensions import api, db, migrate, login_manager, oauth, webau
 from sner.server.parser import load_parser_plugins
 from sner.server.scheduler.core import ExclMatcher
 from sner.server.sessions import FilesystemSessionInterface
-from sner.server.utils import error_response, FilterQueryError
+from sner.server.storage.models import IDENTITY_INDEXES
+from sner.server.utils import error_response, FilterQueryError, GzipRequestMiddleware
 from sner.version import __version__
 
 # blueprints and commands
@@ -70,6 +73,8 @@ DEFAULT_CONFIG = {
     'SNER_VULN_GROUP_IGNORE_TAG_PREFIX': "i:",
     'SNER_AUTOCOMPLETE_LIMIT': 10,
     'SNER_WEBAUTHN_RP_HOSTNAME': None,
+    # gunicorn worker threads, sizes database connection pool, see docker/server/entrypoint.sh
+    'SNER_SERVER_THREADS': int(os.environ.get('SNER_SERVER_THREADS', 0)) or None,
 
     # frontend appConfig overrides, see frontend/src/appConfig.ts
     'SNER_FRONTEND_CONFIG': {},
@@ -77,6 +82,12 @@ DEFAULT_CONFIG = {
     # sner server scheduler
     'SNER_MAINTENANCE': False,
     'SNER_HEATMAP_HOT_LEVEL': 0,
+    'SNER_SCHEDULER_ENGINE': 'advisory',
+    'SNER_SCHEDULER_SOCKET': None,
+    'SNER_SCHEDULER_SNAPSHOT_INTERVAL': 60,
+    'SNER_SCHEDULER_LONGPOLL_TIMEOUT': 60,
+    'SNER_SCHEDULER_LONGPOLL_WAITERS': None,  # per process, defaults to half of SNER_SERVER_THREADS
+    'SNER_SCHEDULER_LEASE': 900,
     'SNER_EXCLUSIONS': [
         ['regex', r'^tcp://.*:22$'],
         ['network', '127.66.66.0/26']
@@ -205,6 +216,7 @@ def create_app(config_file='/etc/sner.yaml', config_env='SNER_CONFIG'):  # pylin
     if app.config["DEBUG"]:  # pragma: nocover  ; won't test
         logging.getLogger('sner.server').setLevel(logging.DEBUG)
 
+    app.wsgi_app = GzipRequestMiddleware(app.wsgi_app)
     if app.config['XFLASK_PROXYFIX']:
         app.wsgi_app = ProxyFix(app.wsgi_app)
     app.session_interface = FilesystemSessionInterface(os.path.join(app.config['SNER_VAR'], 'sessions'), app.config['SNER_SESSION_IDLETIME'])
@@ -213,6 +225,13 @@ def create_app(config_file='/etc/sner.yaml', config_env='SNER_CONFIG'):  # pylin
     csrf = CSRFProtect(app)
     csrf.exempt(api_blueprint)
 
+    if threads := app.config['SNER_SERVER_THREADS']:
+        # thread might hold session connection and scheduler lock connection at once
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': threads, 'max_overflow': threads, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    # long-polling requests hold a thread and a listener connection outside of the pool
+    waiters = app.config['SNER_SCHEDULER_LONGPOLL_WAITERS'] or max((threads or 16) // 2, 1)
+    app.extensions['sner_longpoll_waiters'] = BoundedSemaphore(waiters)
+
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login_route'
@@ -325,6 +344,15 @@ def create_app(config_file='/etc/sner.yaml', config_env='SNER_CONFIG'):  # pylin
     def handle_filter_query_error(err):
         return error_response(message=str(err), code=HTTPStatus.BAD_REQUEST)
 
+    @app.errorhandler(IntegrityError)
+    def handle_integrity_error(err):
+        # only storage identity violations are user errors, anything else is a bug
+        if getattr(getattr(err.orig, 'diag', None), 'constraint_name', None) not in IDENTITY_INDEXES:
+            raise err
+        db.session.rollback()
+        current_app.logger.warning('integrity error, %s', err.orig)
+        return error_response(message='Item already exists.', code=HTTPStatus.CONFLICT)
+
     return app
 
 
@@ -298,6 +298,7 @@ def initdata_dev():
         host=host,
         name='vulnerability2',
         xtype='testxtype.124',
+        via_target='vhost.sner.test',
         severity=SeverityEnum.INFO,
         tags=['info']
     ))
@@ -350,6 +351,7 @@ def initdata_dev():
     db.session.add(Note(
         host=product_host,
         service=product_service,
+        via_target='xssdummy.sner.test',
         xtype='nmap.banner_dict',
         data='{"product": "Apache httpd", "version": "0.0", "extrainfo": "(xssdummy<script>alert(window);</script>) dummy/1.1"}'
     ))
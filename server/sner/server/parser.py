@@ -11,6 +11,7 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
 from importlib import import_module
+from operator import attrgetter
 from pathlib import Path
 
 from littletable import Table as LittleTable
@@ -33,25 +34,28 @@ def load_parser_plugins():
 class ParsedItemBase:  # pylint: disable=too-few-public-methods
     """parsed items base object; shared functions"""
 
+    __slots__ = ()
+
     def update(self, obj):
-        """update data from other object"""
+        """merge fields from other object of the same type"""
+
+        for key in obj.__slots__:
+            value = getattr(obj, key)
 
-        for key, value in obj.__dict__.items():
             # do not overwrite with None value
             if value is None:
                 continue
 
             # merge lists
             if isinstance(value, list):
-                new_value = (getattr(self, key) or []) + value
-                setattr(self, key, new_value)
+                setattr(self, key, (getattr(self, key) or []) + value)
                 continue
 
             # set new value
             setattr(self, key, value)
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedHost(ParsedItemBase):
     """parsed host"""
 
@@ -62,7 +66,7 @@ class ParsedHost(ParsedItemBase):
     os: str = None  # pylint: disable=invalid-name
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedService(ParsedItemBase):  # pylint: disable=too-many-instance-attributes
     """parsed service"""
 
@@ -76,7 +80,7 @@ class ParsedService(ParsedItemBase):  # pylint: disable=too-many-instance-attrib
     import_time: datetime = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedVuln(ParsedItemBase):  # pylint: disable=too-many-instance-attributes
     """parsed vuln"""
 
@@ -93,7 +97,7 @@ class ParsedVuln(ParsedItemBase):  # pylint: disable=too-many-instance-attribute
     import_time: datetime = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedNote(ParsedItemBase):
     """parsed note"""
 
@@ -106,53 +110,110 @@ class ParsedNote(ParsedItemBase):
     import_time: datetime = None
 
 
+class ParsedItemsTable(LittleTable):
+    """
+    littletable of parsed items with hash index on item identity
+
+    Items are looked up by identity in O(1), removal of many items is done in
+    single pass over the table; order of items is preserved.
+    """
+
+    def __init__(self, identity):
+        super().__init__()
+        self.create_index('iid', unique=True)
+        self.identity = identity
+        self.identity_key = attrgetter(*identity)
+        self.identities = {}
+        self.iid_counter = 0
+
+    def get_identity(self, item):
+        """get stored item with same identity or None"""
+
+        return self.identities.get(self.identity_key(item))
+
+    def insert_many(self, it):
+        """insert items, assign iids to new items"""
+
+        items = {}
+        for item in it:
+            key = self.identity_key(item)
+            if (key in self.identities) or (key in items):
+                raise KeyError(f'duplicate identity {key!r}')
+            if item.iid is None:
+                item.iid = self.iid_counter
+            self.iid_counter = max(self.iid_counter, item.iid + 1)
+            items[key] = item
+
+        super().insert_many(items.values())
+        self.identities.update(items)
+        return self
+
+    def remove_many(self, it):
+        """remove items"""
+
+        removed = {id(item) for item in it if self.identities.get(self.identity_key(item)) is item}
+        if not removed:
+            return self
+
+        kept = []
+        for item in self.obs:
+            if id(item) in removed:
+                for index in self._indexes.values():
+                    index.remove(item)
+                del self.identities[self.identity_key(item)]
+            else:
+                kept.append(item)
+        self.obs[:] = kept
+
+        self._contents_changed()
+        return self
+
+    def pop(self, i=-1):
+        """remove and return item at index"""
+
+        item = super().pop(i)
+        del self.identities[self.identity_key(item)]
+        return item
+
+    def clear(self):
+        """remove all items"""
+
+        super().clear()
+        self.identities.clear()
+        return self
+
+
 class ParsedItemsDb:
     """container for parsed items"""
 
     def __init__(self):
-        self.hosts = LittleTable()
-        self.hosts.create_index('iid', unique=True)
-        self.services = LittleTable()
-        self.services.create_index('iid', unique=True)
-        self.vulns = LittleTable()
-        self.vulns.create_index('iid', unique=True)
-        self.notes = LittleTable()
-        self.notes.create_index('iid', unique=True)
+        self.hosts = ParsedItemsTable(('address',))
+        self.services = ParsedItemsTable(('host_iid', 'proto', 'port'))
+        self.vulns = ParsedItemsTable(('host_iid', 'name', 'xtype', 'service_iid', 'via_target'))
+        self.notes = ParsedItemsTable(('host_iid', 'xtype', 'service_iid', 'via_target'))
 
     @staticmethod
-    def _first(alist):
-        if alist:
-            return alist[0]
-        return None
+    def _upsert(table, item):
+        """insert item or update stored item with same identity"""
 
-    def upsert_host(self, address, **kwargs):
-        """upsert host"""
+        pidb_item = table.get_identity(item)
+        if pidb_item is not None:
+            pidb_item.update(item)
+            return pidb_item
 
-        host = ParsedHost(address, **kwargs)
+        table.insert(item)
+        return item
 
-        pidb_host = self._first(self.hosts.where(address=host.address))
-        if pidb_host:
-            pidb_host.update(host)
-            return pidb_host
+    def upsert_host(self, address, **kwargs):
+        """upsert host"""
 
-        host.iid = len(self.hosts)
-        self.hosts.insert(host)
-        return host
+        return self._upsert(self.hosts, ParsedHost(address, **kwargs))
 
     def upsert_service(self, host_address, proto, port, **kwargs):
         """upsert service"""
 
         pidb_host = self.upsert_host(host_address)
-        service = ParsedService(pidb_host.iid, proto, port, **kwargs)
-
-        pidb_service = self._first(self.services.where(host_iid=service.host_iid, proto=service.proto, port=service.port))
-        if pidb_service:
-            pidb_service.update(service)
-            return pidb_service
-
-        service.iid = len(self.services)
-        self.services.insert(service)
-        return service
+        return self._upsert(self.services, ParsedService(pidb_host.iid, proto, port, **kwargs))
 
     def upsert_vuln(
         self,
@@ -169,21 +230,7 @@ class ParsedItemsDb:
         pidb_host = self.upsert_host(host_address)
         pidb_service = self.upsert_service(host_address, service_proto, service_port) if (service_proto and service_port) else None
         vuln = ParsedVuln(pidb_host.iid, name, xtype, service_iid=pidb_service.iid if pidb_service else None, via_target=via_target, **kwargs)
-
-        pidb_vuln = self._first(self.vulns.where(
-            host_iid=vuln.host_iid,
-            name=vuln.name,
-            xtype=vuln.xtype,
-            service_iid=vuln.service_iid,
-            via_target=vuln.via_target
-        ))
-        if pidb_vuln:
-            pidb_vuln.update(vuln)
-            return pidb_vuln
-
-        vuln.iid = len(self.vulns)
-        self.vulns.insert(vuln)
-        return vuln
+        return self._upsert(self.vulns, vuln)
 
     def upsert_note(
         self,
@@ -199,15 +246,7 @@ class ParsedItemsDb:
         pidb_host = self.upsert_host(host_address)
         pidb_service = self.upsert_service(host_address, service_proto, service_port) if (service_proto and service_port) else None
         note = ParsedNote(pidb_host.iid, xtype, service_iid=pidb_service.iid if pidb_service else None, via_target=via_target, **kwargs)
-
-        pidb_note = self._first(self.notes.where(host_iid=note.host_iid, xtype=note.xtype, service_iid=note.service_iid, via_target=note.via_target))
-        if pidb_note:
-            pidb_note.update(note)
-            return pidb_note
-
-        note.iid = len(self.notes)
-        self.notes.insert(note)
-        return note
+        return self._upsert(self.notes, note)
 
 
 class ParserBase(ABC):  # pylint: disable=too-few-public-methods
@@ -62,6 +62,11 @@ class StorageCleanup(BaseModel):
     enabled: bool
 
 
+class ReapExpiredJobs(BaseModel):
+    """reap jobs with expired lease"""
+    enabled: bool
+
+
 class RebuildVersionInfoMap(BaseModel):
     """rebuild versioninfomap"""
     schedule: str
@@ -78,6 +83,7 @@ class Pipelines(BaseModel):
     testssl_scan: Optional[TestsslScan] = None
     auror_scan: Optional[AurorScan] = None
     storage_cleanup: Optional[StorageCleanup] = StorageCleanup(enabled=True)
+    reap_expired_jobs: Optional[ReapExpiredJobs] = ReapExpiredJobs(enabled=True)
     rebuild_versioninfo_map: Optional[RebuildVersionInfoMap] = None
 
 
@@ -19,6 +19,7 @@ from sner.server.planner.config import PlannerConfig
 from sner.server.planner.stages import (
     Netlist,
     Targetlist,
+    ReapExpiredJobs,
     RebuildVersioninfoMap,
     Schedule,
     ServiceDisco,
@@ -68,13 +69,12 @@ def configure_logging():
 def dump_targets(netlist):
     """dump all available targets, helper for manual sweeps"""
 
-    blacklist = ExclMatcher(current_app.config["SNER_EXCLUSIONS"])
+    blacklist = ExclMatcher.cached(current_app.config["SNER_EXCLUSIONS"])
 
     addrs = []
     for net in current_app.config["SNER_PLANNER"][netlist]:
-        for addr in enumerate_network(net):
-            if not blacklist.match(addr):
-                addrs.append(addr)
+        net_addrs = enumerate_network(net)
+        addrs += [addr for addr, excluded in zip(net_addrs, blacklist.match_many(net_addrs)) if not excluded]
 
     return addrs
 
@@ -195,7 +195,7 @@ class Planner(TerminateContextMixin):
         self.stages[name] = stage_cls(**kwargs)
         return self.stages[name]
 
-    def _setup_stages(self):
+    def _setup_stages(self):  # pylint: disable=too-many-branches
         """setup planner stages/pipelines"""
 
         if not self.config.pipelines:
@@ -377,6 +377,10 @@ class Planner(TerminateContextMixin):
         if plines.storage_cleanup and plines.storage_cleanup.enabled:
             self._add_stage("storage_cleanup", StorageCleanup)
 
+        # reap jobs with expired lease
+        if plines.reap_expired_jobs and plines.reap_expired_jobs.enabled:
+            self._add_stage("reap_expired_jobs", ReapExpiredJobs)
+
         # rebuild versioninfo
         if plines.rebuild_versioninfo_map:
             self._add_stage(
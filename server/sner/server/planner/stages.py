@@ -17,7 +17,7 @@ from sqlalchemy import and_, select, tuple_
 from sqlalchemy.orm.exc import NoResultFound
 from sner.lib import format_host_address
 from sner.server.extensions import db
-from sner.server.scheduler.core import enumerate_network, JobManager, QueueManager
+from sner.server.scheduler.core import enumerate_network, JobManager, QueueManager, SchedulerService
 from sner.server.scheduler.models import Queue, Job, Target
 from sner.server.storage.core import StorageManager
 from sner.server.storage.models import Host, Note, Service, Vuln
@@ -70,15 +70,9 @@ def filter_tarpits(pidb, threshold=200):
 
     if hosts_over_threshold:
         for collection in ['services', 'vulns', 'notes']:
-            # list() should provide copy for list-in-loop pruning
-            for item in list(getattr(pidb, collection)):
-                if pidb.hosts.by.iid[item.host_iid].address in hosts_over_threshold:
-                    getattr(pidb, collection).remove(item)
-
-        # list() should provide copy for list-in-loop pruning
-        for host in list(pidb.hosts):
-            if host.address in hosts_over_threshold:
-                pidb.hosts.remove(host)
+            table = getattr(pidb, collection)
+            table.remove_many([item for item in table if pidb.hosts.by.iid[item.host_iid].address in hosts_over_threshold])
+        pidb.hosts.remove_many([host for host in pidb.hosts if host.address in hosts_over_threshold])
 
     return pidb
 
@@ -93,10 +87,7 @@ def filter_external_hosts(hosts, nets):
 def filter_service_open(pidb):
     """filter open services"""
 
-    # list() should provide copy for list-in-loop pruning
-    for service in list(pidb.services):
-        if not service.state.startswith('open:'):
-            pidb.services.remove(service)
+    pidb.services.remove_many([service for service in pidb.services if not service.state.startswith('open:')])
     return pidb
 
 
@@ -363,6 +354,16 @@ class StorageCleanup(Stage):  # pylint: disable=too-few-public-methods
         current_app.logger.debug(f'{self.__class__.__name__} finished')
 
 
+class ReapExpiredJobs(Stage):  # pylint: disable=too-few-public-methods
+    """reconcile and repeat jobs with expired lease"""
+
+    def run(self):
+        """run"""
+
+        SchedulerService.reap_expired_jobs()
+        current_app.logger.debug(f'{self.__class__.__name__} finished')
+
+
 class StorageLoaderNuclei(QueueHandler):
     """load nuclei queue to storage"""
 
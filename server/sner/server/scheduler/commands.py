@@ -3,14 +3,17 @@
 scheduler commands
 """
 
+import os
 import sys
 from ipaddress import ip_address, summarize_address_range
+from itertools import chain
 
 import click
 from flask import current_app
 from flask.cli import with_appcontext
 
-from sner.server.scheduler.core import enumerate_network, QueueManager, SchedulerService
+from sner.server.scheduler.core import enumerate_network, QueueManager, SchedulerDaemonClient, SchedulerService
+from sner.server.scheduler.daemon import SchedulerDaemon
 from sner.server.scheduler.models import Queue
 
 
@@ -57,12 +60,12 @@ def queue_enqueue_command(queue_name, targets, **kwargs):
         current_app.logger.error('no such queue')
         sys.exit(1)
 
-    targets = list(targets)
+    sources = [targets]
     if kwargs['file']:
-        targets.extend(kwargs['file'].read().splitlines())
-    if not targets:
-        targets.extend(sys.stdin.readlines())
-    QueueManager.enqueue(queue, targets)
+        sources.append(kwargs['file'])
+    if not (targets or kwargs['file']):
+        sources.append(sys.stdin)
+    QueueManager.enqueue(queue, chain.from_iterable(sources), progress=lambda count: print(f'staged {count} targets', file=sys.stderr))
     sys.exit(0)
 
 
@@ -125,6 +128,15 @@ def repeat_failed_jobs_command():
     sys.exit(0)
 
 
+@command.command(name='reap-expired-jobs', help='reconcile and repeat running jobs with expired lease')
+@with_appcontext
+def reap_expired_jobs_command():
+    """reap expired jobs"""
+
+    SchedulerService.reap_expired_jobs()
+    sys.exit(0)
+
+
 @command.command(name='recover-heatmap', help='recover inconsistent heatmap state (deployment helper)')
 @with_appcontext
 def recover_heatmap_command():
@@ -132,3 +144,16 @@ def recover_heatmap_command():
 
     SchedulerService.recover_heatmap()
     sys.exit(0)
+
+
+@command.command(name='daemon', help='run in-memory scheduler daemon (SNER_SCHEDULER_ENGINE daemon)')
+@with_appcontext
+def daemon_command():
+    """run scheduler daemon"""
+
+    SchedulerDaemon(
+        current_app._get_current_object(),  # pylint: disable=protected-access
+        SchedulerDaemonClient.socket_path(),
+        os.path.join(current_app.config['SNER_VAR'], 'scheduler.journal'),
+        current_app.config['SNER_SCHEDULER_SNAPSHOT_INTERVAL']
+    ).run()
@@ -2,26 +2,40 @@
 """
 scheduler shared functions
 """
+# pylint: disable=too-many-lines
 
+import csv
+import hashlib
 import json
+import os
 import re
 from abc import ABC, abstractmethod
+from bisect import bisect_right
 from collections import defaultdict, namedtuple
-from datetime import datetime
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
 from enum import Enum
-from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address
+from functools import lru_cache
+from io import StringIO
+from ipaddress import ip_address, ip_network
 from pathlib import Path
 from random import random
-from shutil import copy2
+from select import select as select_fds
+from shutil import copy2, copyfileobj
+from socket import AF_INET, AF_INET6, AF_UNIX, SOCK_STREAM, inet_ntop, inet_pton, socket
+from tempfile import NamedTemporaryFile
+from time import monotonic
 from uuid import uuid4
+from zipfile import BadZipFile
 
 import yaml
-from flask import current_app
-from sqlalchemy import and_, cast, delete, distinct, func, or_, select, text
+from flask import current_app, g
+from sqlalchemy import and_, cast, column, delete, func, literal, or_, select, table, text, true, tuple_, union_all, update, values as sql_values
 from sqlalchemy.dialects.postgresql import ARRAY as pg_ARRAY, insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 
 from sner.agent.modules import SERVICE_TARGET_REGEXP
+from sner.lib import batched, file_from_zip
 from sner.plugin.six_enum_discover.agent import SIXENUM_TARGET_REGEXP
 from sner.server.extensions import db
 from sner.server.parser import REGISTERED_PARSERS
@@ -29,6 +43,9 @@ from sner.server.scheduler.models import Heatmap, Job, Queue, Readynet, Target
 
 
 SCHEDULER_LOCK_NUMBER = 1
+SCHEDULER_NOTIFY_CHANNEL = 'sner_scheduler_work'
+SERVICE_TARGET_PATTERN = re.compile(SERVICE_TARGET_REGEXP)
+SIXENUM_TARGET_PATTERN = re.compile(SIXENUM_TARGET_REGEXP)
 
 
 def enumerate_network(arg):
@@ -55,7 +72,7 @@ def enumerate_network(arg):
 def sixenum_target_boundaries(value):
     """returns tuple(first, last)"""
 
-    if not (mtmp := re.match(SIXENUM_TARGET_REGEXP, value)):
+    if not (mtmp := SIXENUM_TARGET_PATTERN.match(value)):
         raise ValueError('not valid sixenum target')
 
     addr = mtmp.group('scan6dst')
@@ -78,7 +95,12 @@ class ExclFamily(Enum):
 
 
 class ExclMatcher():
-    """object matching value againts set of exclusions/rules"""
+    """
+    object matching value againts set of exclusions/rules
+
+    exclusions are compiled per family into single matcher (see ExclMatcherImplBase.compile),
+    use `ExclMatcher.cached` to reuse compiled matcher for the same config.
+    """
 
     MATCHERS = {}
 
@@ -97,15 +119,37 @@ class ExclMatcher():
             ExclMatcher.MATCHERS[ExclFamily(family)](value)
             for family, value in config
         ]
+        self.compiled = [
+            impl.compile([excl for excl in self.excls if isinstance(excl, impl)])
+            for impl in dict.fromkeys(map(type, self.excls))
+        ]
+
+    @staticmethod
+    def cached(config):
+        """returns compiled matcher for config, matchers are cached per config value"""
+
+        return _excl_matcher_cached(tuple(map(tuple, config)))
 
     def match(self, value):
         """match value against all exclusions/matchers"""
 
-        for excl in self.excls:
-            if excl.match(value):
+        for matcher in self.compiled:
+            if matcher(value):
                 return True
         return False
 
+    def match_many(self, values):
+        """match values against all exclusions/matchers, returns list of bools"""
+
+        return [self.match(value) for value in values]
+
+
+@lru_cache(maxsize=16)
+def _excl_matcher_cached(config):
+    """cached ExclMatcher factory"""
+
+    return ExclMatcher(config)
+
 
 class ExclMatcherImplBase(ABC):  # pylint: disable=too-few-public-methods
     """base interface which must  be implemented by all available matchers"""
@@ -121,57 +165,123 @@ class ExclMatcherImplBase(ABC):  # pylint: disable=too-few-public-methods
     def match(self, value):
         """returns bool if value matches the initialized match_to"""
 
+    @classmethod
+    def compile(cls, excls):
+        """returns callable matching value against any of the family exclusions"""
+
+        return lambda value: any(excl.match(value) for excl in excls)
+
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.match_to}>'
 
 
 @ExclMatcher.register(ExclFamily.NETWORK)
 class NetworkExclMatcher(ExclMatcherImplBase):  # pylint: disable=too-few-public-methods
-    """network matcher"""
+    """
+    network matcher
+
+    compiled matcher merges all excluded networks into sorted disjoint intervals per address family,
+    target is parsed once into address interval and tested by bisection.
+    """
 
     def _initialize(self, match_to):
         return ip_network(match_to)
 
-    def _test_addr(self, value):
+    @staticmethod
+    def parse_target(value):
+        """
+        parse target into address interval, sixenum target spans interval of enumerated addresses
+
+        :return: (version, first, last) or None if target does not hold address
+        :rtype: tuple
+        """
+
         try:
-            return ip_address(value) in self.match_to
+            addr = ip_address(value)
+            return addr.version, int(addr), int(addr)
         except ValueError:
-            return False
-
-    def match(self, value):
-        # test value as plain address
-        if self._test_addr(value):
-            return True
+            pass
 
-        # test value as service target
-        if mtmp := re.match(SERVICE_TARGET_REGEXP, value):
-            return self._test_addr(mtmp.group('host').replace('[', '').replace(']', ''))
+        if mtmp := SERVICE_TARGET_PATTERN.match(value):
+            try:
+                addr = ip_address(mtmp.group('host').replace('[', '').replace(']', ''))
+                return addr.version, int(addr), int(addr)
+            except ValueError:
+                return None
 
-        # test value as sixenum target
-        if mtmp := re.match(SIXENUM_TARGET_REGEXP, value):
+        if SIXENUM_TARGET_PATTERN.match(value):
             first, last = map(ip_address, sixenum_target_boundaries(value))
+            return first.version, int(first), int(last)
 
-            # first or last enum addr is in excluded range
-            if self._test_addr(first) or self._test_addr(last):
-                return True
+        return None
 
-            # excluded range could be smaller than enum, check if excluded range does not belong into enum itself
-            if (
-                (first.version == self.match_to.version)
-                and ((first <= self.match_to.network_address <= last) or (first <= self.match_to.broadcast_address <= last))
-            ):
-                return True
+    @staticmethod
+    def intervals_match(intervals, parsed):
+        """test if parsed target interval intersects any of sorted disjoint (starts, ends) intervals"""
 
-        return False
+        if not parsed:
+            return False
+
+        version, first, last = parsed
+        starts, ends = intervals[version]
+        idx = bisect_right(starts, last) - 1
+        return (idx >= 0) and (ends[idx] >= first)
+
+    @staticmethod
+    def build_intervals(networks):
+        """build sorted disjoint (starts, ends) intervals per ip version from networks"""
+
+        intervals = {4: ([], []), 6: ([], [])}
+        for net in sorted(networks, key=lambda x: (x.version, int(x.network_address))):
+            starts, ends = intervals[net.version]
+            first, last = int(net.network_address), int(net.broadcast_address)
+            if ends and (first <= ends[-1] + 1):
+                ends[-1] = max(ends[-1], last)
+            else:
+                starts.append(first)
+                ends.append(last)
+        return intervals
+
+    @classmethod
+    def compile(cls, excls):
+        intervals = cls.build_intervals([excl.match_to for excl in excls])
+        return lambda value: cls.intervals_match(intervals, cls.parse_target(value))
+
+    def match(self, value):
+        return self.compile([self])(value)
 
 
 @ExclMatcher.register(ExclFamily.REGEX)
 class RegexExclMatcher(ExclMatcherImplBase):  # pylint: disable=too-few-public-methods
-    """regex matcher"""
+    """
+    regex matcher
+
+    compiled matcher joins all patterns into single alternation. patterns which
+    cannot be joined safely (backreferences, global flags) are matched separately.
+    """
+
+    UNJOINABLE_REGEXP = r'\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)'
 
     def _initialize(self, match_to):
         return re.compile(match_to)
 
+    @classmethod
+    def compile(cls, excls):
+        separate = [excl for excl in excls if re.search(cls.UNJOINABLE_REGEXP, excl.match_to.pattern)]
+        joined = [excl.match_to.pattern for excl in excls if excl not in separate]
+
+        try:
+            combined = re.compile('|'.join(f'(?:{pattern})' for pattern in joined)) if joined else None
+        except re.error:  # pragma: no cover  ; duplicate group names
+            return super().compile(excls)
+
+        def match(value):
+            if combined and combined.search(value):
+                return True
+            return any(excl.match(value) for excl in separate)
+
+        return match
+
     def match(self, value):
         return bool(self.match_to.search(value))
 
@@ -179,45 +289,70 @@ class RegexExclMatcher(ExclMatcherImplBase):  # pylint: disable=too-few-public-m
 class QueueManager:
     """Governs queues, readynets and targets"""
 
+    ENQUEUE_CHUNK_SIZE = 100000
+
     @staticmethod
-    def enqueue(queue, targets):
-        """enqueue targets to queue"""
+    def enqueue(queue, targets, progress=None):
+        """
+        enqueue targets to queue
 
-        enqueued = []
-        enqueued_hashvals = set()
+        targets are streamed in chunks via COPY into temporary staging table and merged
+        into targets and readynets set-wise, memory usage is bounded by chunk size.
 
-        for target in filter(None, map(lambda x: x.strip(), targets)):
-            thashval = SchedulerService.hashval(target)
-            enqueued.append({'queue_id': queue.id, 'target': target, 'hashval': thashval})
-            enqueued_hashvals.add(thashval)
+        :param progress: optional callable receiving the number of targets staged so far
+        :return: number of enqueued targets
+        :rtype: int
+        """
 
-        if enqueued:
-            SchedulerService.get_lock()
+        conn = db.session.connection()
+        conn.execute(text('CREATE TEMPORARY TABLE target_enqueue (target TEXT NOT NULL, hashval TEXT NOT NULL)'))
+        staging = table('target_enqueue', column('target'), column('hashval'))
+        cursor = conn.connection.cursor()
 
-            conn = db.session.connection()
-            conn.execute(pg_insert(Target), enqueued)
-            hot_hashvals = set(SchedulerService.grep_hot_hashvals(enqueued_hashvals))
-            for thashval in (enqueued_hashvals - hot_hashvals):
+        count = 0
+        for chunk in batched(filter(None, map(lambda x: x.strip(), targets)), QueueManager.ENQUEUE_CHUNK_SIZE):
+            buf = StringIO()
+            csv.writer(buf, lineterminator='\n').writerows(zip(chunk, SchedulerService.hashval_many(chunk)))
+            buf.seek(0)
+            cursor.copy_expert('COPY target_enqueue (target, hashval) FROM STDIN WITH (FORMAT csv)', buf)
+            count += len(chunk)
+            if progress:
+                progress(count)
+
+        if count:
+            # scheduler daemon loads new targets on sync, does not have to be paused
+            with SchedulerService.lock(pause_daemon=False):
+                conn.execute(
+                    pg_insert(Target)
+                    .from_select(['queue_id', 'target', 'hashval'], select(literal(queue.id), staging.c.target, staging.c.hashval))
+                )
                 conn.execute(
                     pg_insert(Readynet)
-                    .values(queue_id=queue.id, hashval=thashval)
+                    .from_select(
+                        ['queue_id', 'hashval'],
+                        select(literal(queue.id), staging.c.hashval).filter(SchedulerService.not_hot_clause(staging.c.hashval)).distinct()
+                    )
                     .on_conflict_do_nothing(constraint='readynet_pkey')
                 )
+                conn.execute(text('DROP TABLE target_enqueue'))
+                db.session.commit()
+            if SchedulerDaemonClient.enabled():
+                SchedulerDaemonClient.call('sync')
+            SchedulerService.notify_work()
             db.session.commit()
+        else:
+            conn.execute(text('DROP TABLE target_enqueue'))
 
-            SchedulerService.release_lock()
+        return count
 
     @staticmethod
     def flush(queue):
         """queue flush; flush all targets from queue"""
 
-        SchedulerService.get_lock()
-
-        Target.query.filter(Target.queue_id == queue.id).delete()
-        Readynet.query.filter(Readynet.queue_id == queue.id).delete()
-        db.session.commit()
-
-        SchedulerService.release_lock()
+        with SchedulerService.lock():
+            Target.query.filter(Target.queue_id == queue.id).delete()
+            Readynet.query.filter(Readynet.queue_id == queue.id).delete()
+            db.session.commit()
 
     @staticmethod
     def prune(queue):
@@ -240,42 +375,144 @@ class QueueManager:
         except OSError as exc:  # pragma: no cover  ; wont test
             raise RuntimeError(f'failed to remove queue directory: {exc.strerror}') from None
 
-        SchedulerService.get_lock()
-        db.session.delete(queue)
-        db.session.commit()
-        SchedulerService.release_lock()
+        with SchedulerService.lock():
+            db.session.delete(queue)
+            db.session.commit()
 
 
 class JobManager:
     """job governance"""
 
+    UPLOAD_CHUNK_SIZE = 1024*1024
+
     @staticmethod
-    def create(queue, assigned_targets):
+    def create(queue, assigned_targets, job_id=None):
         """
-        create job for queue with targets
+        create job for queue with targets, job id might be preassigned by scheduler daemon
 
         :return: agent assignment data
         :rtype: dict
         """
 
         assignment = {
-            'id': str(uuid4()),
+            'id': job_id or str(uuid4()),
             'config': {} if queue.config is None else yaml.safe_load(queue.config),
             'targets': assigned_targets
         }
+        # lease is granted by first heartbeat, jobs of agents without heartbeat are never reaped
         db.session.add(Job(id=assignment['id'], queue=queue, assignment=json.dumps(assignment)))
         db.session.commit()
         return assignment
 
     @staticmethod
-    def finish(job, retval, output):
-        """writeback job results"""
+    def lease_until():
+        """compute lease expiration for running job"""
+
+        return datetime.utcnow() + timedelta(seconds=current_app.config['SNER_SCHEDULER_LEASE'])
+
+    @staticmethod
+    def heartbeat(job, progress=None):
+        """extend lease of running job, agent reports number of already processed targets"""
+
+        job.lease = JobManager.lease_until()
+        if progress is not None:
+            job.progress = progress
+        db.session.commit()
+
+    @staticmethod
+    def store_output(job, output):
+        """
+        store job output, data are written into temporary file which is atomically renamed to output path
+
+        :param output: output data, bytes or path of uploaded file (see `upload_output`)
+        :raises TypeError: output of other type
+        """
+
+        if not isinstance(output, (bytes, Path)):
+            raise TypeError(f'job output must be bytes or Path, not {type(output).__name__}')
 
         opath = Path(job.output_abspath)
         opath.parent.mkdir(parents=True, exist_ok=True)
-        opath.write_bytes(output)
+        if isinstance(output, Path):
+            # hard link keeps the upload resumable until the job is finished
+            tmp_path = opath.with_name(f'.{opath.name}.{uuid4()}')
+            os.link(output, tmp_path)
+            os.replace(tmp_path, opath)
+            return
+
+        with NamedTemporaryFile(dir=opath.parent, prefix=f'.{opath.name}.', delete=False) as ftmp:
+            try:
+                ftmp.write(output)
+            except BaseException:
+                Path(ftmp.name).unlink()
+                raise
+        os.replace(ftmp.name, opath)
+
+    @staticmethod
+    def upload_path(job):
+        """return path of the partially uploaded job output"""
+
+        opath = Path(job.output_abspath)
+        return opath.with_name(f'.{opath.name}.upload')
+
+    @staticmethod
+    def upload_offset(job):
+        """return size of the partially uploaded job output"""
+
+        upath = JobManager.upload_path(job)
+        return upath.stat().st_size if upath.exists() else 0
+
+    @staticmethod
+    def upload_output(job, stream, offset):
+        """
+        write streamed chunk of job output at offset of the partial upload
+
+        :return: size of the partial upload or None if offset is beyond uploaded data
+        :rtype: int
+        """
+
+        upath = JobManager.upload_path(job)
+        upath.parent.mkdir(parents=True, exist_ok=True)
+        with open(upath, 'r+b' if upath.exists() else 'wb') as ftmp:
+            if offset > ftmp.seek(0, os.SEEK_END):
+                return None
+            ftmp.seek(offset)
+            ftmp.truncate()
+            copyfileobj(stream, ftmp, JobManager.UPLOAD_CHUNK_SIZE)
+            return ftmp.tell()
+
+    @staticmethod
+    def upload_verify(job, digest):
+        """verify sha256 digest of the uploaded job output, invalid upload is discarded"""
+
+        upath = JobManager.upload_path(job)
+        with open(upath, 'rb') as ftmp:
+            valid = hashlib.file_digest(ftmp, 'sha256').hexdigest() == digest.lower()
+        if not valid:
+            upath.unlink()
+        return valid
+
+    @staticmethod
+    def output_usage(job):
+        """
+        read resource usage reported by agent in output manifest
+
+        :return: usage data or None if not available
+        :rtype: dict
+        """
+
+        try:
+            return json.loads(file_from_zip(job.output_abspath, 'manifest.json'))['usage']
+        except (BadZipFile, KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def finish(job, retval, usage=None):
+        """writeback job results"""
+
         job.retval = retval
         job.time_end = datetime.utcnow()
+        job.usage = usage
         db.session.commit()
 
     @staticmethod
@@ -289,13 +526,9 @@ class JobManager:
             current_app.logger.error('cannot reconcile completed job %s', job.id)
             raise RuntimeError('cannot reconcile completed job')
 
-        SchedulerService.get_lock()
-
-        job.retval = -1
-        for target in json.loads(job.assignment)['targets']:
-            SchedulerService.heatmap_pop(SchedulerService.hashval(target))
-
-        SchedulerService.release_lock()
+        with SchedulerService.lock():
+            job.retval = -1
+            SchedulerService.heatmap_pop_many(SchedulerService.hashval_many(json.loads(job.assignment)['targets']))
 
     @staticmethod
     def repeat(job):
@@ -329,9 +562,8 @@ class JobManager:
             current_app.logger.error('cannot delete running job %s', job.id)
             raise RuntimeError('cannot delete running job')
 
-        opath = Path(job.output_abspath)
-        if opath.exists():
-            opath.unlink()
+        Path(job.output_abspath).unlink(missing_ok=True)
+        JobManager.upload_path(job).unlink(missing_ok=True)
         db.session.delete(job)
         db.session.commit()
 
@@ -343,7 +575,45 @@ class SchedulerServiceBusyException(Exception):
     """raised when timeout is reached when obtaining scheduling service lock"""
 
 
-class SchedulerService:
+class SchedulerDaemonClient:
+    """scheduler daemon client, see `sner.server.scheduler.daemon`"""
+
+    TIMEOUT = 30
+
+    @staticmethod
+    def enabled():
+        """daemon engine enabled"""
+
+        return current_app.config['SNER_SCHEDULER_ENGINE'] == 'daemon'
+
+    @staticmethod
+    def socket_path():
+        """daemon socket path"""
+
+        return current_app.config['SNER_SCHEDULER_SOCKET'] or os.path.join(current_app.config['SNER_VAR'], 'scheduler.sock')
+
+    @classmethod
+    def call(cls, op, **kwargs):  # pylint: disable=invalid-name
+        """call daemon operation or raise exception"""
+
+        try:
+            with socket(AF_UNIX, SOCK_STREAM) as sock:
+                sock.settimeout(cls.TIMEOUT)
+                sock.connect(cls.socket_path())
+                sock.sendall(json.dumps({'op': op, 'args': kwargs}).encode() + b'\n')
+                with sock.makefile('rb') as sockfile:
+                    response = json.loads(sockfile.readline())
+        except (OSError, ValueError):
+            current_app.logger.warning('failed to call SchedulerService daemon')
+            raise SchedulerServiceBusyException() from None
+
+        if 'error' in response:
+            current_app.logger.warning(f'SchedulerService daemon {op} failed, {response["error"]}')
+            raise SchedulerServiceBusyException()
+        return response
+
+
+class SchedulerService:  # pylint: disable=too-many-public-methods
     """
     rate-limiting scheduling service (nacelnik.mk1 design)
 
@@ -362,91 +632,278 @@ class SchedulerService:
     TIMEOUT_JOB_OUTPUT = 30
     HEATMAP_GC_PROBABILITY = 0.1
 
+    # per-process lock hold time accounting, see get_metrics
+    lock_hold_stats = {'count': 0, 'sum': 0.0, 'max': 0.0}
+
+    @staticmethod
+    def get_lock(timeout=0, pause_daemon=True):
+        """
+        wait for database lock or raise exception
+
+        with `daemon` engine the scheduler daemon is paused (state snapshotted into database)
+        so the lock holder can operate on database state.
+        """
+
+        if not g.get('scheduler_lock_depth'):
+            # session level lock is held on dedicated connection, session commits return
+            # session connection into the pool which is shared with other threads
+            conn = db.engine.connect()
+            try:
+                conn.execute(
+                    text('SET LOCAL lock_timeout=:timeout; SELECT pg_advisory_lock(:locknum);'),
+                    {'timeout': timeout*100, 'locknum': SCHEDULER_LOCK_NUMBER}
+                )
+                conn.commit()
+            except SQLAlchemyError:
+                conn.close()
+                current_app.logger.warning('failed to acquire SchedulerService lock')
+                raise SchedulerServiceBusyException() from None
+
+            g.scheduler_lock_conn = conn
+            g.scheduler_lock_acquired = monotonic()
+        g.scheduler_lock_depth = g.get('scheduler_lock_depth', 0) + 1
+
+        if pause_daemon and SchedulerDaemonClient.enabled():
+            try:
+                SchedulerDaemonClient.call('pause')
+            except SchedulerServiceBusyException:
+                SchedulerService.release_lock(pause_daemon=False)
+                raise
+
     @staticmethod
-    def get_lock(timeout=0):
-        """wait for database lock or raise exception"""
+    def release_lock(pause_daemon=True):
+        """
+        release scheduling lock, lock is released even if daemon resume fails. daemon paused
+        by gone lock holder resumes by itself, see `sner.server.scheduler.daemon`.
+        """
 
         try:
-            db.session.execute(
-                text('SET LOCAL lock_timeout=:timeout; SELECT pg_advisory_lock(:locknum);'),
-                {'timeout': timeout*100, 'locknum': SCHEDULER_LOCK_NUMBER}
-            )
-        except SQLAlchemyError:
-            db.session.rollback()
-            current_app.logger.warning('failed to acquire SchedulerService lock')
-            raise SchedulerServiceBusyException() from None
+            if pause_daemon and SchedulerDaemonClient.enabled():
+                SchedulerDaemonClient.call('resume')
+        finally:
+            g.scheduler_lock_depth -= 1
+            if not g.scheduler_lock_depth:
+                conn = g.pop('scheduler_lock_conn')
+                conn.execute(text('SELECT pg_advisory_unlock(:locknum);'), {'locknum': SCHEDULER_LOCK_NUMBER})
+                conn.commit()
+                conn.close()
+
+                hold_time = monotonic() - g.scheduler_lock_acquired
+                stats = SchedulerService.lock_hold_stats
+                stats['count'] += 1
+                stats['sum'] += hold_time
+                stats['max'] = max(stats['max'], hold_time)
 
     @staticmethod
-    def release_lock():
-        """release scheduling lock"""
+    @contextmanager
+    def lock(timeout=0, pause_daemon=True):
+        """scheduling lock context, lock is released (daemon resumed) also when the block raises"""
 
-        db.session.execute(
-            text('SELECT pg_advisory_unlock(:locknum);'),
-            {'locknum': SCHEDULER_LOCK_NUMBER}
-        )
+        SchedulerService.get_lock(timeout, pause_daemon)
+        try:
+            yield
+        finally:
+            SchedulerService.release_lock(pause_daemon)
 
     @staticmethod
-    def hashval(value):
-        """computes rate-limit heatmap hash value"""
+    def hashval_compute(value):
+        """
+        computes rate-limit heatmap hash value (uncached)
+
+        address is parsed and masked to /24 (ipv4) or /48 (ipv6) by truncating its
+        packed form, inet_ntop formats the network address same as ipaddress module.
+        scoped ipv6 addresses (not parsed by inet_pton) are handled by ipaddress module.
+        """
 
-        if mtmp := re.match(SERVICE_TARGET_REGEXP, value):
+        if mtmp := SERVICE_TARGET_PATTERN.match(value):
             value = mtmp.group('host')
             if (value[0] == '[') and (value[-1] == ']'):
                 value = value[1:-1]
 
-        if mtmp := re.match(SIXENUM_TARGET_REGEXP, value):
+        if mtmp := SIXENUM_TARGET_PATTERN.match(value):
             value = mtmp.group('scan6dst').split('-')[0]
 
         try:
-            addr = ip_address(value)
-            if isinstance(addr, IPv4Address):
-                return str(ip_network(f'{ip_address(value)}/24', strict=False))
-            if isinstance(addr, IPv6Address):
-                return str(ip_network(f'{ip_address(value)}/48', strict=False))
-        except ValueError:
+            return f'{inet_ntop(AF_INET, inet_pton(AF_INET, value)[:3] + bytes(1))}/24'
+        except (OSError, ValueError):
+            pass
+
+        try:
+            return f'{inet_ntop(AF_INET6, inet_pton(AF_INET6, value)[:6] + bytes(10))}/48'
+        except (OSError, ValueError):
             pass
 
+        if '%' in value:
+            try:
+                return str(ip_network(f'{ip_address(value)}/48', strict=False))
+            except ValueError:
+                pass
+
         return value
 
     @staticmethod
-    def heatmap_put(hashval):
+    @lru_cache(maxsize=65536)
+    def hashval(value):
+        """computes rate-limit heatmap hash value, cached for repeated targets"""
+
+        return SchedulerService.hashval_compute(value)
+
+    @classmethod
+    def hashval_many(cls, values):
+        """computes rate-limit heatmap hash values for bulk of (mostly unique) values, bypasses cache"""
+
+        return list(map(cls.hashval_compute, values))
+
+    @classmethod
+    def heatmap_put(cls, hashval):
         """account value (increment counter) in heatmap and update readynets"""
 
+        return cls.heatmap_put_many([hashval])[hashval]
+
+    @staticmethod
+    def heatmap_put_many(hashvals, skip_locked=False):
+        """
+        account values (increment counters by occurrence) in heatmap with single upsert and update readynets
+
+        :param skip_locked: do not wait for readynets locked by concurrent assigners when deactivating hot ones,
+                            skipped readynets are pruned by the next claim (see `_claim_readynets`)
+        """
+
+        increments = defaultdict(int)
+        for hashval in hashvals:
+            increments[hashval] += 1
+
         conn = db.session.connection()
-        heat_count = conn.execute(
-            pg_insert(Heatmap)
-            .values(hashval=hashval, count=1)
-            .on_conflict_do_update(constraint='heatmap_pkey', set_={"count": Heatmap.count + 1})
-            .returning(Heatmap.count)
-        ).scalar()
+        heat_counts = {}
+        if increments:
+            stmt = pg_insert(Heatmap).values([{'hashval': hashval, 'count': count} for hashval, count in increments.items()])
+            heat_counts = dict(conn.execute(
+                stmt
+                .on_conflict_do_update(constraint='heatmap_pkey', set_={'count': Heatmap.count + stmt.excluded.count})
+                .returning(Heatmap.hashval, Heatmap.count)
+            ).all())
 
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL'] and (heat_count >= current_app.config['SNER_HEATMAP_HOT_LEVEL']):
-            conn.execute(delete(Readynet).filter(Readynet.hashval == hashval))
+        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            hot_hashvals = [hashval for hashval, count in heat_counts.items() if count >= current_app.config['SNER_HEATMAP_HOT_LEVEL']]
+            if hot_hashvals and skip_locked:
+                hot_readynets = (
+                    select(Readynet.queue_id, Readynet.hashval)
+                    .filter(Readynet.hashval.in_(hot_hashvals))
+                    .with_for_update(skip_locked=True)
+                )
+                conn.execute(delete(Readynet).filter(tuple_(Readynet.queue_id, Readynet.hashval).in_(hot_readynets)))
+            elif hot_hashvals:
+                conn.execute(delete(Readynet).filter(Readynet.hashval.in_(hot_hashvals)))
 
         db.session.commit()
-        return heat_count
+        return heat_counts
 
     @classmethod
     def heatmap_pop(cls, hashval):
         """account value (decrement counter) in heatmap and update readynets"""
 
+        return cls.heatmap_pop_many([hashval])[hashval]
+
+    @classmethod
+    def heatmap_pop_many(cls, hashvals):
+        """account values (decrement counters by occurrence) in heatmap with single upsert and update readynets"""
+
+        decrements = defaultdict(int)
+        for hashval in hashvals:
+            decrements[hashval] += 1
+        if not decrements:
+            return {}
+
         conn = db.session.connection()
-        heat_count = conn.execute(
-            pg_insert(Heatmap)
-            .values(hashval=hashval, count=1)
-            .on_conflict_do_update(constraint='heatmap_pkey', set_={"count": Heatmap.count - 1})
-            .returning(Heatmap.count)
-        ).scalar()
+        stmt = pg_insert(Heatmap).from_select(
+            ['hashval', 'count'],
+            select(
+                func.unnest(cast(list(decrements.keys()), pg_ARRAY(db.String))),
+                func.unnest(cast(list(decrements.values()), pg_ARRAY(db.Integer)))
+            )
+        )
+        heat_counts = dict(conn.execute(
+            stmt
+            .on_conflict_do_update(constraint='heatmap_pkey', set_={'count': Heatmap.count - stmt.excluded.count})
+            .returning(Heatmap.hashval, Heatmap.count)
+        ).all())
 
         if random() < cls.HEATMAP_GC_PROBABILITY:
             conn.execute(delete(Heatmap).filter(Heatmap.count == 0))
 
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL'] and (heat_count+1 == current_app.config['SNER_HEATMAP_HOT_LEVEL']):
-            for queue_id in db.session.execute(select(func.distinct(Target.queue_id)).filter(Target.hashval == hashval)).scalars().all():
-                conn.execute(pg_insert(Readynet).values(queue_id=queue_id, hashval=hashval))
+        if hot_level := current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            cooled_hashvals = [
+                hashval for hashval, count in heat_counts.items()
+                if count < hot_level <= count + decrements[hashval]
+            ]
+            if cooled_hashvals:
+                conn.execute(
+                    pg_insert(Readynet)
+                    .from_select(
+                        ['queue_id', 'hashval'],
+                        select(Target.queue_id, Target.hashval).filter(Target.hashval.in_(cooled_hashvals)).distinct()
+                    )
+                    .on_conflict_do_nothing(constraint='readynet_pkey')
+                )
+                cls.notify_work()
 
         db.session.commit()
-        return heat_count
+        return heat_counts
+
+    @staticmethod
+    def notify_work():
+        """notify long-polling assigners about available work, notification is delivered on commit"""
+
+        db.session.execute(select(func.pg_notify(SCHEDULER_NOTIFY_CHANNEL, '')))
+
+    @staticmethod
+    @contextmanager
+    def work_listener():
+        """
+        listen for available work notifications (enqueue, heatmap cool-down)
+
+        yields wait(timeout) function returning True if notification was received. listener uses dedicated
+        connection outside of connection pool, so long-polling requests do not exhaust the pool. number of
+        listeners is limited by SNER_SCHEDULER_LONGPOLL_WAITERS, yields None if the limit is reached.
+        """
+
+        waiters = current_app.extensions['sner_longpoll_waiters']
+        if not waiters.acquire(blocking=False):
+            yield None
+            return
+
+        def wait(timeout):
+            if not (conn.notifies or select_fds([conn], [], [], timeout)[0]):
+                return False
+            conn.poll()
+            conn.notifies.clear()
+            return True
+
+        try:
+            cargs, cparams = db.engine.dialect.create_connect_args(db.engine.url)
+            conn = db.engine.dialect.connect(*cargs, **cparams)
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {SCHEDULER_NOTIFY_CHANNEL}')
+                yield wait
+            finally:
+                conn.close()
+        finally:
+            waiters.release()
+
+    @staticmethod
+    def not_hot_clause(hashval_column):
+        """returns filter clause selecting only hashvals which are not hot in heatmap"""
+
+        if not current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            return true()
+
+        return ~(
+            select(Heatmap.hashval)
+            .filter(Heatmap.hashval == hashval_column, Heatmap.count >= current_app.config['SNER_HEATMAP_HOT_LEVEL'])
+            .exists()
+        )
 
     @staticmethod
     def grep_hot_hashvals(hashvals):
@@ -481,7 +938,7 @@ class SchedulerService:
 
         query = select(Queue).filter(
             Queue.active,
-            Queue.id.in_(select(distinct(Readynet.queue_id)))
+            select(Readynet.hashval).filter(Readynet.queue_id == Queue.id).exists()
         )
 
         if agent_caps:
@@ -494,42 +951,162 @@ class SchedulerService:
         return db.session.execute(query).scalars().first()
 
     @staticmethod
-    def _pop_random_target(queue):
+    def _random_seek(query, key_column, count):
+        """
+        fetch up to `count` random rows of the query
+
+        rows carry uniformly distributed random key, index range seek from random start point
+        (wrapping around the key space) costs O(log n) instead of sorting whole range with
+        `ORDER BY random()`.
+        """
+
+        conn = db.session.connection()
+        start = random()
+        rows = conn.execute(query.filter(key_column >= start).order_by(key_column).limit(count)).all()
+        if len(rows) < count:
+            rows += conn.execute(query.filter(key_column < start).order_by(key_column).limit(count - len(rows))).all()
+        return rows
+
+    @staticmethod
+    def _readynets_capacity(queue, hashvals, count, skip_locked=False):
         """
-        pop random target from queue and update readynet info
+        compute remaining rate-limit capacity of selected readynets
 
-        :return: random target properties as tuple
-        :rtype: sner.server.scheduler.core.RandomTarget
+        * selected readynets get new random keys, so subsequent selections are independent
+        * readynets without capacity left (hot ones, skipped by concurrent deactivation) are pruned
+
+        :return: readynets (hashval, capacity, start) values or None if no capacity is available
         """
 
         conn = db.session.connection()
+        hot_level = current_app.config['SNER_HEATMAP_HOT_LEVEL']
+
+        capacities = {}
+        if hashvals:
+            conn.execute(
+                update(Readynet)
+                .filter(Readynet.queue_id == queue.id, Readynet.hashval.in_(hashvals))
+                .values(rand=func.random())
+            )
+            capacities = {hashval: min(hot_level, count) if hot_level else count for hashval in hashvals}
+
+        if hashvals and (hot_level or skip_locked):
+            query = select(Heatmap.hashval, Heatmap.count).filter(Heatmap.hashval.in_(hashvals))
+            if skip_locked:
+                # heatmap rows locked by concurrent assigners are skipped along with their readynets
+                conn.execute(
+                    pg_insert(Heatmap)
+                    .values([{'hashval': hashval, 'count': 0} for hashval in hashvals])
+                    .on_conflict_do_nothing(constraint='heatmap_pkey')
+                )
+                query = query.with_for_update(skip_locked=True)
+                capacities = {}
+            for hashval, heat_count in conn.execute(query).all():
+                capacities[hashval] = min(max(hot_level - heat_count, 0), count) if hot_level else count
+
+        if exhausted := [hashval for hashval, capacity in capacities.items() if not capacity]:
+            conn.execute(delete(Readynet).filter(Readynet.queue_id == queue.id, Readynet.hashval.in_(exhausted)))
 
-        readynet_hashval = conn.execute(
-            select(Readynet.hashval).filter(Readynet.queue_id == queue.id).order_by(func.random()).limit(1)
-        ).scalar()
-        if not readynet_hashval:
+        if not (selected := [(hashval, capacity, random()) for hashval, capacity in capacities.items() if capacity]):
             return None
+        return sql_values(
+            column('hashval', db.String),
+            column('capacity', db.Integer),
+            column('start', db.Float),
+            name='readynets'
+        ).data(selected)
+
+    @classmethod
+    def _random_readynets(cls, queue, count):
+        """
+        select up to `count` random readynets of the queue along with their remaining rate-limit capacity
+
+        :return: readynets (hashval, capacity, start) values or None
+        """
+
+        hashvals = [
+            row.hashval
+            for row in cls._random_seek(select(Readynet.hashval).filter(Readynet.queue_id == queue.id), Readynet.rand, count)
+        ]
+        return cls._readynets_capacity(queue, hashvals, count)
 
-        target_id, target = conn.execute(
-            select(Target.id, Target.target)
-            .filter(Target.queue_id == queue.id, Target.hashval == readynet_hashval)
-            .order_by(func.random())
-            .limit(1)
-        ).first()
+    @classmethod
+    def _claim_readynets(cls, queue, count):
+        """
+        claim up to `count` random readynets of the queue with row-level locks instead of scheduler lock
+
+        * readynets and heatmap rows locked by concurrent assigners are skipped (FOR UPDATE SKIP LOCKED)
+        * rate-limit capacity is computed from locked heatmap rows, so it cannot be consumed concurrently
+
+        :return: readynets (hashval, capacity, start) values or None if nothing was claimed
+        """
 
-        conn.execute(delete(Target).filter(Target.id == target_id))
-        # prune readynet if no targets left for current queue
+        hashvals = [
+            row.hashval
+            for row in cls._random_seek(
+                select(Readynet.hashval).filter(Readynet.queue_id == queue.id).with_for_update(skip_locked=True),
+                Readynet.rand,
+                count
+            )
+        ]
+        return cls._readynets_capacity(queue, hashvals, count, skip_locked=True)
+
+    @staticmethod
+    def _pop_random_targets(queue, readynets, count):
+        """
+        pop batch of random targets from selected readynets and update readynet info
+
+        * pick random targets within each readynet up to its capacity (random key index seek from readynet start point)
+        * spread the batch over distinct readynets (round-robin by in-readynet rank)
+        * delete picked targets and prune readynets without targets left for current queue
+
+        heatmap is not updated nor changes are commited, caller must account assigned targets via `heatmap_put_many`.
+
+        :return: random targets properties
+        :rtype: list of sner.server.scheduler.core.RandomTarget
+        """
+
+        if readynets is None:
+            return []
+
+        conn = db.session.connection()
+        candidates = (
+            select(Target.id, Target.rand)
+            .filter(Target.queue_id == queue.id, Target.hashval == readynets.c.hashval)
+            .correlate(readynets)
+        )
+        seek = union_all(
+            candidates.filter(Target.rand >= readynets.c.start).order_by(Target.rand).limit(readynets.c.capacity),
+            candidates.filter(Target.rand < readynets.c.start).order_by(Target.rand).limit(readynets.c.capacity)
+        ).subquery()
+        picks = select(seek.c.id).limit(readynets.c.capacity).lateral()
+        picked_ids = (
+            select(picks.c.id)
+            .select_from(readynets.join(picks, true()))
+            .order_by(func.row_number().over(partition_by=readynets.c.hashval), func.random())
+            .limit(count)
+        )
+
+        rtargets = [
+            RandomTarget(*row)
+            for row in conn.execute(
+                delete(Target).filter(Target.id.in_(picked_ids)).returning(Target.id, Target.target, Target.hashval)
+            ).all()
+        ]
+        if not rtargets:
+            return rtargets
+
+        # prune readynets if no targets left for current queue
         conn.execute(
             delete(Readynet)
             .filter(
                 Readynet.queue_id == queue.id,
-                Readynet.hashval == readynet_hashval,
-                select(func.count(Target.id)).filter(Target.queue_id == queue.id, Target.hashval == readynet_hashval).scalar_subquery() == 0
+                Readynet.hashval.in_({item.hashval for item in rtargets}),
+                ~select(Target.id).filter(Target.queue_id == queue.id, Target.hashval == Readynet.hashval).exists()
             )
         )
 
-        db.session.commit()
-        return RandomTarget(target_id, target, readynet_hashval)
+        return rtargets
 
     @classmethod
     def job_assign(cls, queue_name, agent_caps):
@@ -537,58 +1114,88 @@ class SchedulerService:
         assign job for agent
 
         * select suitable queue
-        * pop random target
-            * select random readynet for queue (readynets reflects current rate-limit heatmap state)
-            * pop random target within selected readynet
-            * cleanup readynet if queue does not hold any target in same readynet
+        * pop batch of random targets
+            * select random readynets for queue (readynets reflects current rate-limit heatmap state)
+            * pop random targets within selected readynets up to their rate-limit capacity
+            * cleanup readynets if queue does not hold any target in same readynet
         * update rate-limit heatmap
-            * deactivate readynet for all queues if it becomes hot
+            * deactivate readynets for all queues if they become hot
+        * repeat until group_size is filled (excluded targets are discarded)
+
+        `SNER_SCHEDULER_ENGINE` selects serialization of concurrent assigners, `advisory` engine
+        holds global scheduler lock, `skiplocked` engine claims readynets and heatmap rows with
+        row-level locks so assigners for different queues or networks proceed in parallel,
+        `daemon` engine delegates target selection to in-memory scheduler daemon.
         """
 
-        cls.get_lock(cls.TIMEOUT_JOB_ASSIGN)
+        if SchedulerDaemonClient.enabled():
+            return cls._job_assign_daemon(queue_name, agent_caps)
 
+        skip_locked = current_app.config['SNER_SCHEDULER_ENGINE'] == 'skiplocked'
         assignment = {}  # nowork
         assigned_targets = []
-        blacklist = ExclMatcher(current_app.config['SNER_EXCLUSIONS'])
-
-        queue = cls._get_assignment_queue(queue_name, agent_caps)
-        if not queue:
-            SchedulerService.release_lock()
-            return assignment
-
-        while len(assigned_targets) < queue.group_size:
-            rtarget = cls._pop_random_target(queue)
-            if not rtarget:
-                break
-            if blacklist.match(rtarget.target):
-                continue
-            assigned_targets.append(rtarget.target)
-            cls.heatmap_put(rtarget.hashval)
-
-        if assigned_targets:
-            assignment = JobManager.create(queue, assigned_targets)
-
-        cls.release_lock()
+        blacklist = ExclMatcher.cached(current_app.config['SNER_EXCLUSIONS'])
+
+        with nullcontext() if skip_locked else cls.lock(cls.TIMEOUT_JOB_ASSIGN):
+            queue = cls._get_assignment_queue(queue_name, agent_caps)
+            while queue and (len(assigned_targets) < queue.group_size):
+                count = queue.group_size - len(assigned_targets)
+                readynets = cls._claim_readynets(queue, count) if skip_locked else cls._random_readynets(queue, count)
+                rtargets = cls._pop_random_targets(queue, readynets, count)
+                assigned_rtargets = [
+                    item for item, excluded in zip(rtargets, blacklist.match_many([item.target for item in rtargets])) if not excluded
+                ]
+                assigned_targets += [item.target for item in assigned_rtargets]
+                cls.heatmap_put_many([item.hashval for item in assigned_rtargets], skip_locked=skip_locked)
+                if not rtargets:
+                    break
+
+            if assigned_targets:
+                assignment = JobManager.create(queue, assigned_targets)
+
         if assignment:
             current_app.logger.info(f'SchedulerService job_assign {assignment["id"]} ({queue.name})')
         return assignment
 
+    @staticmethod
+    def _job_assign_daemon(queue_name, agent_caps):
+        """assign job with targets popped by scheduler daemon"""
+
+        assignment = {}  # nowork
+        response = SchedulerDaemonClient.call('assign', queue_name=queue_name, agent_caps=agent_caps)
+        if response:
+            queue = db.session.get(Queue, response['queue_id'])
+            assignment = JobManager.create(queue, response['targets'], response['id'])
+            current_app.logger.info(f'SchedulerService job_assign {assignment["id"]} ({queue.name})')
+        return assignment
+
     @classmethod
     def job_output(cls, job, retval, output):
         """
         receive output from assigned job
 
-        * for each target update rate-limit heatmap
-            * if readynet of the target becomes cool activate it for all queues
+        * store output file and read resource usage reported by agent outside of scheduler lock
+        * update job state and rate-limit heatmap for all targets at once (aggregated by hashval)
+            * if readynets of the targets become cool activate them for all queues
         """
 
-        cls.get_lock(cls.TIMEOUT_JOB_OUTPUT)
-
-        JobManager.finish(job, retval, output)
-        for target in json.loads(job.assignment)['targets']:
-            cls.heatmap_pop(cls.hashval(target))
-
-        cls.release_lock()
+        JobManager.store_output(job, output)
+        usage = JobManager.output_usage(job)
+
+        if SchedulerDaemonClient.enabled():
+            # release in daemon first, failed call leaves job running and agent retries the upload. release is idempotent
+            # and daemon does not account released job on load, even if finish fails or has not been committed yet
+            cooled = SchedulerDaemonClient.call('release', targets=json.loads(job.assignment)['targets'], job_id=job.id)['cooled']
+            JobManager.finish(job, retval, usage)
+            if cooled:
+                cls.notify_work()
+                db.session.commit()
+            current_app.logger.info(f'SchedulerService job_output {job.id} ({job.queue.name})')
+            return
+
+        with cls.lock(cls.TIMEOUT_JOB_OUTPUT):
+            JobManager.finish(job, retval, usage)
+            cls.heatmap_pop_many(map(cls.hashval, json.loads(job.assignment)['targets']))
         current_app.logger.info(f'SchedulerService job_output {job.id} ({job.queue.name})')
 
     @classmethod
@@ -597,31 +1204,28 @@ class SchedulerService:
         rescan targets and update readynets table for new heatmap hot level
         """
 
-        cls.get_lock()
-        conn = db.session.connection()
-
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
-            hot_hashvals = set(conn.execute(
-                select(Heatmap.hashval).filter(Heatmap.count >= current_app.config['SNER_HEATMAP_HOT_LEVEL'])
-            ).scalars().all())
+        with cls.lock():
+            conn = db.session.connection()
 
             # all heatmap hashvals over limit remove from readynet
-            conn.execute(delete(Readynet).filter(Readynet.hashval.in_(hot_hashvals)))
-        else:
-            hot_hashvals = set()
-
-        # for all target hashvals except over limit insert as readynet for all queues
-        all_hashvals = set(conn.execute(select(func.distinct(Target.hashval))).scalars().all())
-        for thashval in (all_hashvals - hot_hashvals):
-            for queue_id in conn.execute(select(func.distinct(Target.queue_id)).filter(Target.hashval == thashval)).scalars().all():
+            if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
                 conn.execute(
-                    pg_insert(Readynet)
-                    .values(queue_id=queue_id, hashval=thashval)
-                    .on_conflict_do_nothing(constraint='readynet_pkey')
+                    delete(Readynet)
+                    .filter(Readynet.hashval.in_(select(Heatmap.hashval).filter(Heatmap.count >= current_app.config['SNER_HEATMAP_HOT_LEVEL'])))
                 )
 
-        db.session.commit()
-        cls.release_lock()
+            # for all target hashvals except over limit insert as readynet for all queues
+            conn.execute(
+                pg_insert(Readynet)
+                .from_select(
+                    ['queue_id', 'hashval'],
+                    select(Target.queue_id, Target.hashval).filter(cls.not_hot_clause(Target.hashval)).distinct()
+                )
+                .on_conflict_do_nothing(constraint='readynet_pkey')
+            )
+
+            cls.notify_work()
+            db.session.commit()
 
     @classmethod
     def heatmap_check(cls):
@@ -632,48 +1236,72 @@ class SchedulerService:
         :rtype: bool
         """
 
-        cls.get_lock()
-
-        ref_heatmap = defaultdict(int)
-        for job in Job.query.filter(Job.retval == None).all():  # noqa: E711  pylint: disable=singleton-comparison
-            for target in json.loads(job.assignment)['targets']:
-                ref_heatmap[SchedulerService.hashval(target)] += 1
-
-        db_heatmap = {
-            item.hashval: item.count
-            for item in Heatmap.query.all()
-            if item.count != 0
-        }
-
-        keys_only_in_dict1 = set(ref_heatmap.keys()) - set(db_heatmap.keys())
-        keys_only_in_dict2 = set(db_heatmap.keys()) - set(ref_heatmap.keys())
-        different_values = {
-            key: (ref_heatmap[key], db_heatmap[key])
-            for key in ref_heatmap
-            if (key in db_heatmap) and (ref_heatmap[key] != db_heatmap[key])
-        }
-
-        heatmaps_equal = not bool(keys_only_in_dict1 or keys_only_in_dict2 or different_values)
-        cls.release_lock()
+        with cls.lock():
+            ref_heatmap = defaultdict(int)
+            for job in Job.query.filter(Job.retval == None).all():  # noqa: E711  pylint: disable=singleton-comparison
+                for thashval in cls.hashval_many(json.loads(job.assignment)['targets']):
+                    ref_heatmap[thashval] += 1
+
+            db_heatmap = {
+                item.hashval: item.count
+                for item in Heatmap.query.all()
+                if item.count != 0
+            }
+
+            keys_only_in_dict1 = set(ref_heatmap.keys()) - set(db_heatmap.keys())
+            keys_only_in_dict2 = set(db_heatmap.keys()) - set(ref_heatmap.keys())
+            different_values = {
+                key: (ref_heatmap[key], db_heatmap[key])
+                for key in ref_heatmap
+                if (key in db_heatmap) and (ref_heatmap[key] != db_heatmap[key])
+            }
+
+            heatmaps_equal = not bool(keys_only_in_dict1 or keys_only_in_dict2 or different_values)
         return heatmaps_equal
 
     @classmethod
     def repeat_failed_jobs(cls):
         """repeat and prune failed jobs, tries to recover from deployment restart"""
 
-        cls.get_lock()
-        count = 0
-        for job in Job.query.filter(
-                Job.retval != None,  # noqa: E711  pylint: disable=singleton-comparison  ; not running jobs
-                Job.retval != 0,  # not successful jobs
-                Job.retval < 1000  # do not repeat planner failed jobs
-        ).all():
-            JobManager.repeat(job)
-            JobManager.delete(job)
-            count += 1
-        cls.release_lock()
+        with cls.lock():
+            count = 0
+            for job in Job.query.filter(
+                    Job.retval != None,  # noqa: E711  pylint: disable=singleton-comparison  ; not running jobs
+                    Job.retval != 0,  # not successful jobs
+                    Job.retval < 1000  # do not repeat planner failed jobs
+            ).all():
+                JobManager.repeat(job)
+                JobManager.delete(job)
+                count += 1
         current_app.logger.info(f"SchedulerService repeat_failed_jobs, {count} jobs repeated")
 
+    @classmethod
+    def reap_expired_jobs(cls):
+        """
+        reconcile and repeat running jobs with expired lease (agent stopped sending heartbeats).
+        only jobs which lease has been granted by heartbeat are reaped, jobs of agents not sending
+        heartbeats are left for manual reconcile. reaped jobs are deleted, late output from the agent is discarded.
+
+        :return: number of reaped jobs
+        :rtype: int
+        """
+
+        expired_clause = and_(Job.retval == None, Job.lease < datetime.utcnow())  # noqa: E711  pylint: disable=singleton-comparison
+        # cheap check without lock, reaper runs periodically
+        if not db.session.query(Job.query.filter(expired_clause).exists()).scalar():
+            return 0
+
+        with cls.lock():
+            count = 0
+            for job in Job.query.filter(expired_clause).all():
+                current_app.logger.warning(f'SchedulerService reap_expired_jobs {job.id} ({job.queue.name}), lease expired {job.lease}')
+                JobManager.reconcile(job)
+                JobManager.repeat(job)
+                JobManager.delete(job)
+                count += 1
+        current_app.logger.info(f'SchedulerService reap_expired_jobs, {count} jobs reaped')
+        return count
+
     @classmethod
     def recover_heatmap(cls):
         """
@@ -682,26 +1310,24 @@ class SchedulerService:
         from inconsistent heatmap state
         """
 
-        cls.get_lock()
-        count = 0
-        for job in Job.query.filter(
-            or_(
-                Job.retval == None,  # noqa: E711  pylint: disable=singleton-comparison  ; do repeat "running" jobs
-                and_(
-                    Job.retval != 0,  # do not repeat finished jobs
-                    Job.retval < 1000  # do not repeat planner failed jobs
+        with cls.lock():
+            count = 0
+            for job in Job.query.filter(
+                or_(
+                    Job.retval == None,  # noqa: E711  pylint: disable=singleton-comparison  ; do repeat "running" jobs
+                    and_(
+                        Job.retval != 0,  # do not repeat finished jobs
+                        Job.retval < 1000  # do not repeat planner failed jobs
+                    )
                 )
-            )
-        ).all():
-            if job.retval is None:
-                JobManager.reconcile(job)
-            JobManager.repeat(job)
-            JobManager.delete(job)
-            count += 1
-
-        Heatmap.query.delete()
-        db.session.commit()
-        cls.readynet_recount()
-
-        cls.release_lock()
+            ).all():
+                if job.retval is None:
+                    JobManager.reconcile(job)
+                JobManager.repeat(job)
+                JobManager.delete(job)
+                count += 1
+
+            Heatmap.query.delete()
+            db.session.commit()
+            cls.readynet_recount()
         current_app.logger.info("SchedulerService recover_heatmap")
@@ -0,0 +1,615 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+in-memory scheduler daemon
+
+Daemon keeps queues, readynets and heatmap in memory and serves job assignment
+and job output accounting to the server workers over local unix socket
+(see `sner.server.scheduler.core.SchedulerDaemonClient`).
+
+* every change is appended to write-ahead journal before it's acknowledged
+* state is periodically snapshotted into the database and journal truncated
+* on start state is loaded from the database and journal replayed; journal
+  records popped target ids and absolute heatmap values, so replay is idempotent
+  and recovers exact state after crash regardless of last snapshot completion
+* maintenance operations (holders of SchedulerService lock) pause the daemon,
+  which snapshots the state and reloads it from the database on resume. pause
+  of a holder which is gone without resuming (scheduler lock is not held by
+  anyone) is dropped on next assign or release request
+* assignments are tracked as pending until their job is created by the server
+  worker, heatmap counts are rebuilt on load from running jobs and pending
+  assignments, orphaned assignments (worker failed to create the job) are released
+* released jobs are tracked until they are finished in the database, release is
+  idempotent and released jobs are not accounted on load
+"""
+
+import json
+import os
+import socketserver
+from collections import defaultdict
+from pathlib import Path
+from random import choice, randrange
+from threading import Event, Lock, Thread
+from time import time
+from uuid import uuid4
+
+from flask import current_app
+from sqlalchemy import any_, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import ARRAY as pg_ARRAY, insert as pg_insert
+
+from sner.server.extensions import db
+from sner.server.scheduler.core import ExclMatcher, SCHEDULER_LOCK_NUMBER, SchedulerDaemonClient, SchedulerService
+from sner.server.scheduler.models import Heatmap, Job, Queue, Readynet, Target
+
+
+class Journal:
+    """append-only write-ahead journal"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+
+    def append(self, entry):
+        """durably append entry"""
+
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def replay(self):
+        """
+        read journal entries
+
+        :return: popped target ids, latest heatmap values, pending assignments and released jobs
+        :rtype: tuple(set, dict, dict, dict)
+        """
+
+        popped_ids = set()
+        heatmap = {}
+        pending = {}
+        released = {}
+        with open(self.path, 'r', encoding='utf-8') as ftmp:
+            for line in ftmp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write of the last entry, was never acknowledged
+                    break
+                popped_ids.update(entry.get('ids', []))
+                heatmap.update(entry.get('heat', {}))
+                if 'job' in entry:
+                    pending[entry['job']] = (entry['time'], entry['hashvals'])
+                if entry.get('done'):
+                    pending.pop(entry['done'], None)
+                    released[entry['done']] = entry['time']
+        return popped_ids, heatmap, pending, released
+
+    def truncate(self):
+        """truncate journal after snapshot"""
+
+        self.file.truncate(0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """close journal"""
+
+        self.file.close()
+
+
+class QueueState:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """in-memory queue, targets grouped by hashval and readynets list"""
+
+    def __init__(self, queue):
+        self.id = queue.id  # pylint: disable=invalid-name
+        self.update(queue)
+        self.targets = defaultdict(list)
+        self.readynets = []
+        self.readynets_index = {}
+
+    def update(self, queue):
+        """update queue properties"""
+
+        self.name = queue.name
+        self.priority = queue.priority
+        self.active = queue.active
+        self.reqs = set(queue.reqs)
+        self.group_size = queue.group_size
+
+    def readynet_add(self, hashval):
+        """add readynet"""
+
+        if hashval not in self.readynets_index:
+            self.readynets_index[hashval] = len(self.readynets)
+            self.readynets.append(hashval)
+
+    def readynet_remove(self, hashval):
+        """remove readynet, last item takes place of removed one"""
+
+        if (idx := self.readynets_index.pop(hashval, None)) is None:
+            return
+        last = self.readynets.pop()
+        if idx < len(self.readynets):
+            self.readynets[idx] = last
+            self.readynets_index[last] = idx
+
+
+class SchedulerState:  # pylint: disable=too-many-instance-attributes
+    """
+    in-memory scheduler state (nacelnik.mk1 datastructure)
+
+    readynets and targets are kept in lists, random items are removed by replacing them
+    with the last item, so both selection and removal are O(1).
+    """
+
+    # time for server worker to create job for assignment, see SchedulerService._job_assign_daemon
+    PENDING_GRACE = 2 * SchedulerDaemonClient.TIMEOUT
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.queues = {}
+        self.heatmap = {}
+        self.hashval_queues = defaultdict(set)
+        self.max_target_id = 0
+        self.popped_ids = []
+        self.dirty_hashvals = set()
+        self.pending = {}
+        # jobs released from heatmap which might be still running in database
+        self.released = {}
+
+    def is_hot(self, hashval):
+        """check if hashval is hot"""
+
+        hot_level = current_app.config['SNER_HEATMAP_HOT_LEVEL']
+        return bool(hot_level) and (self.heatmap.get(hashval, 0) >= hot_level)
+
+    def load(self):
+        """load state from database and replay journal"""
+
+        popped_ids, _, journal_pending, journal_released = self.journal.replay()
+
+        self.queues = {}
+        self.hashval_queues = defaultdict(set)
+        self.max_target_id = 0
+        self.sync_queues()
+
+        self.pending.update(journal_pending)
+        self.released.update(journal_released)
+        db_heatmap = {hashval: count for hashval, count in db.session.execute(select(Heatmap.hashval, Heatmap.count)).all() if count}
+        self.heatmap = self._rebuild_heatmap()
+
+        self.popped_ids = list(popped_ids)
+        self.dirty_hashvals = set(db_heatmap) | set(self.heatmap)
+        self._load_targets(popped_ids)
+
+    def _rebuild_heatmap(self):
+        """
+        compute heatmap from targets of running jobs and pending assignments, pending
+        assignments older than grace period without job are orphaned and dropped. released
+        jobs (output received, job not finished yet) are not accounted.
+        """
+
+        heatmap = defaultdict(int)
+        running = select(Job.id, Job.assignment).filter(Job.retval == None)  # noqa: E711  pylint: disable=singleton-comparison
+        for job_id, assignment in db.session.execute(running):
+            if job_id in self.released:
+                continue
+            for hashval in SchedulerService.hashval_many(json.loads(assignment)['targets']):
+                heatmap[hashval] += 1
+
+        existing = set(db.session.execute(select(Job.id).filter(Job.id.in_(list(self.pending)))).scalars().all())
+        for job_id, (created, hashvals) in list(self.pending.items()):
+            if (job_id in existing) or (created < time() - self.PENDING_GRACE):
+                del self.pending[job_id]
+                continue
+            for hashval in hashvals:
+                heatmap[hashval] += 1
+
+        return {hashval: count for hashval, count in heatmap.items() if count}
+
+    def sync_queues(self):
+        """sync queue properties from database"""
+
+        queues = db.session.execute(select(Queue)).scalars().all()
+        for queue in queues:
+            if queue.id in self.queues:
+                self.queues[queue.id].update(queue)
+            else:
+                self.queues[queue.id] = QueueState(queue)
+        for queue_id in set(self.queues) - {queue.id for queue in queues}:
+            del self.queues[queue_id]
+
+    def sync(self):
+        """load queues and targets enqueued since last load/sync, release orphaned assignments"""
+
+        self.sync_queues()
+        self._load_targets()
+        self.release_orphaned()
+        self.prune_released()
+
+    def release_orphaned(self, grace=None):
+        """
+        drop pending assignments which jobs has been created, release heatmap counts of
+        assignments older than grace period without job (worker failed to create the job)
+
+        :return: released job ids
+        :rtype: list
+        """
+
+        if not self.pending:
+            return []
+
+        grace = self.PENDING_GRACE if grace is None else grace
+        existing = set(db.session.execute(select(Job.id).filter(Job.id.in_(list(self.pending)))).scalars().all())
+        orphaned = []
+        for job_id, (created, hashvals) in list(self.pending.items()):
+            if job_id in existing:
+                del self.pending[job_id]
+            elif created <= time() - grace:
+                current_app.logger.warning(f'SchedulerDaemon releasing orphaned assignment {job_id}')
+                for hashval in hashvals:
+                    self.heatmap_pop(hashval)
+                self.journal.append({'heat': {hashval: self.heatmap.get(hashval, 0) for hashval in hashvals}, 'done': job_id, 'time': time()})
+                del self.pending[job_id]
+                self.released[job_id] = time()
+                orphaned.append(job_id)
+        return orphaned
+
+    def prune_released(self):
+        """stop tracking released jobs finished in database, or missing for grace period (deleted or orphaned)"""
+
+        if not self.released:
+            return
+
+        retvals = dict(db.session.execute(select(Job.id, Job.retval).filter(Job.id.in_(list(self.released)))).all())
+        for job_id, released in list(self.released.items()):
+            if job_id in retvals:
+                if retvals[job_id] is not None:
+                    del self.released[job_id]
+            elif released <= time() - self.PENDING_GRACE:
+                del self.released[job_id]
+
+    def _load_targets(self, skip_ids=None):
+        """load targets newer than already loaded ones"""
+
+        query = (
+            select(Target.id, Target.queue_id, Target.target, Target.hashval)
+            .filter(Target.id > self.max_target_id)
+            .execution_options(yield_per=100000)
+        )
+        for target_id, queue_id, target, hashval in db.session.execute(query):
+            self.max_target_id = max(self.max_target_id, target_id)
+            if (skip_ids and (target_id in skip_ids)) or (queue_id not in self.queues):
+                continue
+            queue = self.queues[queue_id]
+            queue.targets[hashval].append((target_id, target))
+            self.hashval_queues[hashval].add(queue_id)
+            if not self.is_hot(hashval):
+                queue.readynet_add(hashval)
+
+    def select_queue(self, queue_name, agent_caps):
+        """select queue for assignment, see SchedulerService._get_assignment_queue"""
+
+        candidates = [
+            queue for queue in self.queues.values()
+            if queue.active
+            and queue.readynets
+            and ((not agent_caps) or queue.reqs.issubset(agent_caps))
+            and ((not queue_name) or (queue.name == queue_name))
+        ]
+        if not candidates:
+            return None
+        priority = max(queue.priority for queue in candidates)
+        return choice([queue for queue in candidates if queue.priority == priority])
+
+    def pop_random_target(self, queue):
+        """pop random target from random readynet of the queue"""
+
+        hashval = choice(queue.readynets)
+        targets = queue.targets[hashval]
+        idx = randrange(len(targets))
+        targets[idx], targets[-1] = targets[-1], targets[idx]
+        target_id, target = targets.pop()
+
+        if not targets:
+            del queue.targets[hashval]
+            queue.readynet_remove(hashval)
+            self.hashval_queues[hashval].discard(queue.id)
+            if not self.hashval_queues[hashval]:
+                del self.hashval_queues[hashval]
+
+        self.popped_ids.append(target_id)
+        self.dirty_hashvals.add(hashval)
+        return target_id, target, hashval
+
+    def heatmap_put(self, hashval):
+        """increment heatmap, deactivate readynets for all queues if hashval becomes hot"""
+
+        self.heatmap[hashval] = self.heatmap.get(hashval, 0) + 1
+        self.dirty_hashvals.add(hashval)
+        if self.is_hot(hashval):
+            for queue_id in self.hashval_queues.get(hashval, []):
+                self.queues[queue_id].readynet_remove(hashval)
+
+    def heatmap_pop(self, hashval):
+        """
+        decrement heatmap, activate readynets for all queues if hashval becomes cool
+
+        :return: True if hashval became cool
+        """
+
+        was_hot = self.is_hot(hashval)
+        self.heatmap[hashval] = self.heatmap.get(hashval, 0) - 1
+        self.dirty_hashvals.add(hashval)
+        cooled = was_hot and not self.is_hot(hashval)
+        if cooled:
+            for queue_id in self.hashval_queues.get(hashval, []):
+                self.queues[queue_id].readynet_add(hashval)
+        if not self.heatmap[hashval]:
+            del self.heatmap[hashval]
+        return cooled
+
+    def assign(self, queue_name, agent_caps):
+        """
+        pop targets for assignment, see SchedulerService.job_assign
+
+        state changes are reverted if the journal append fails, so the assignment is either
+        durably journaled or not made at all
+
+        :return: job id, queue_id and targets or empty dict if there is no work
+        :rtype: dict
+        """
+
+        if not (queue := self.select_queue(queue_name, agent_caps)):
+            return {}
+
+        blacklist = ExclMatcher.cached(current_app.config['SNER_EXCLUSIONS'])
+        popped = []
+        assigned_targets = []
+        assigned_hashvals = []
+        while queue.readynets and (len(assigned_targets) < queue.group_size):
+            target_id, target, hashval = self.pop_random_target(queue)
+            popped.append((target_id, target, hashval))
+            if blacklist.match(target):
+                continue
+            assigned_targets.append(target)
+            assigned_hashvals.append(hashval)
+            self.heatmap_put(hashval)
+
+        entry = {
+            'ids': [target_id for target_id, _, _ in popped],
+            'heat': {hashval: self.heatmap.get(hashval, 0) for hashval in assigned_hashvals}
+        }
+        if assigned_targets:
+            entry.update({'job': str(uuid4()), 'time': time(), 'hashvals': assigned_hashvals})
+
+        try:
+            self.journal.append(entry)
+        except Exception:
+            self._unassign(queue, popped, assigned_hashvals)
+            raise
+
+        if not assigned_targets:
+            return {}
+        self.pending[entry['job']] = (entry['time'], assigned_hashvals)
+        return {'id': entry['job'], 'queue_id': queue.id, 'targets': assigned_targets}
+
+    def _unassign(self, queue, popped, assigned_hashvals):
+        """revert assign state changes"""
+
+        for hashval in assigned_hashvals:
+            self.heatmap_pop(hashval)
+        for target_id, target, hashval in popped:
+            queue.targets[hashval].append((target_id, target))
+            self.hashval_queues[hashval].add(queue.id)
+            if not self.is_hot(hashval):
+                queue.readynet_add(hashval)
+        del self.popped_ids[-len(popped):]
+
+    def release(self, targets, job_id=None):
+        """
+        account finished targets, see SchedulerService.job_output
+
+        release is idempotent, job is released once even if its output is received repeatedly
+        (job finish failed and agent retries the upload) or its assignment has been released
+        as orphaned
+
+        :return: True if any hashval became cool
+        """
+
+        if job_id in self.released:
+            return False
+
+        hashvals = SchedulerService.hashval_many(targets)
+        cooled = [self.heatmap_pop(hashval) for hashval in hashvals]
+        self.journal.append({'heat': {hashval: self.heatmap.get(hashval, 0) for hashval in hashvals}, 'done': job_id, 'time': time()})
+        self.pending.pop(job_id, None)
+        if job_id:
+            self.released[job_id] = time()
+        return any(cooled)
+
+    def snapshot(self):
+        """persist state into database and truncate journal"""
+
+        conn = db.session.connection()
+        if self.popped_ids:
+            conn.execute(delete(Target).filter(Target.id == any_(cast(self.popped_ids, pg_ARRAY(db.Integer)))))
+
+        if dirty_hashvals := list(self.dirty_hashvals):
+            stmt = pg_insert(Heatmap).from_select(
+                ['hashval', 'count'],
+                select(
+                    func.unnest(cast(dirty_hashvals, pg_ARRAY(db.String))),
+                    func.unnest(cast([self.heatmap.get(hashval, 0) for hashval in dirty_hashvals], pg_ARRAY(db.Integer)))
+                )
+            )
+            conn.execute(stmt.on_conflict_do_update(constraint='heatmap_pkey', set_={'count': stmt.excluded.count}))
+            conn.execute(delete(Readynet).filter(Readynet.hashval.in_(dirty_hashvals)))
+            conn.execute(
+                pg_insert(Readynet)
+                .from_select(
+                    ['queue_id', 'hashval'],
+                    select(Target.queue_id, Target.hashval)
+                    .filter(Target.hashval.in_(dirty_hashvals), SchedulerService.not_hot_clause(Target.hashval))
+                    .distinct()
+                )
+                .on_conflict_do_nothing(constraint='readynet_pkey')
+            )
+
+        db.session.commit()
+        self.journal.truncate()
+        for job_id, (created, hashvals) in self.pending.items():
+            self.journal.append({'job': job_id, 'time': created, 'hashvals': hashvals})
+        for job_id, released in self.released.items():
+            self.journal.append({'done': job_id, 'time': released})
+        self.popped_ids = []
+        self.dirty_hashvals = set()
+
+    @staticmethod
+    def fingerprint():
+        """database targets and heatmap fingerprint, detects changes made by maintenance operations"""
+
+        return (
+            db.session.execute(
+                select(Target.queue_id, func.count(Target.id), func.max(Target.id), func.sum(Target.id))
+                .group_by(Target.queue_id)
+                .order_by(Target.queue_id)
+            ).all(),
+            db.session.execute(select(Heatmap.hashval, Heatmap.count).filter(Heatmap.count != 0).order_by(Heatmap.hashval)).all()
+        )
+
+
+class SchedulerDaemonHandler(socketserver.StreamRequestHandler):
+    """handles line delimited json requests"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as exc:  # pylint: disable=broad-except  ; report any failure to client
+                self.server.app.logger.exception('SchedulerDaemon request failed')
+                response = {'error': str(exc)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class SchedulerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):  # pylint: disable=too-many-instance-attributes
+    """scheduler daemon server"""
+
+    daemon_threads = True
+
+    def __init__(self, app, socket_path, journal_path, snapshot_interval):
+        self.app = app
+        self.state = SchedulerState(Journal(journal_path))
+        self.lock = Lock()
+        self.paused = 0
+        self.paused_fingerprint = None
+        self.snapshot_interval = snapshot_interval
+        self.stopped = Event()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, SchedulerDaemonHandler)
+
+    def dispatch(self, request):
+        """dispatch request to operation handler"""
+
+        with self.app.app_context(), self.lock:
+            if self.paused and (request['op'] in ['assign', 'release']) and not self.drop_stale_pause():
+                return {'error': 'paused'}
+            try:
+                return getattr(self, f'op_{request["op"]}')(**request.get('args', {}))
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def drop_stale_pause(self):
+        """
+        resume if the scheduler lock is not held by anyone, pause holder has gone without resuming
+        (holders pause the daemon after acquiring the lock and resume it before releasing the lock)
+
+        :return: True if resumed
+        """
+
+        if not db.session.execute(select(func.pg_try_advisory_lock(SCHEDULER_LOCK_NUMBER))).scalar():
+            db.session.rollback()
+            return False
+        db.session.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+        db.session.commit()
+
+        current_app.logger.warning('SchedulerDaemon paused by gone lock holder, resuming')
+        self.paused = 1
+        self.op_resume()
+        return True
+
+    def op_assign(self, queue_name, agent_caps):
+        """assign targets"""
+
+        return self.state.assign(queue_name, agent_caps)
+
+    def op_release(self, targets, job_id=None):
+        """release targets from heatmap"""
+
+        return {'cooled': self.state.release(targets, job_id)}
+
+    def op_sync(self):
+        """load newly enqueued targets"""
+
+        if not self.paused:
+            self.state.sync()
+        return {}
+
+    def op_pause(self):
+        """snapshot state and pause serving until resumed, pauses are counted"""
+
+        if not self.paused:
+            self.state.snapshot()
+            self.paused_fingerprint = self.state.fingerprint()
+        self.paused += 1
+        return {}
+
+    def op_resume(self):
+        """resume serving, reload state if database has been changed during pause"""
+
+        self.paused = max(self.paused - 1, 0)
+        if not self.paused:
+            if self.state.fingerprint() != self.paused_fingerprint:
+                current_app.logger.info('SchedulerDaemon reload')
+                self.state.load()
+            else:
+                self.state.sync()
+        return {}
+
+    def op_snapshot(self):
+        """snapshot state to database"""
+
+        if not self.paused:
+            self.state.snapshot()
+        return {}
+
+    def snapshot_loop(self):
+        """periodic snapshot worker"""
+
+        while not self.stopped.wait(self.snapshot_interval):
+            try:
+                self.dispatch({'op': 'snapshot'})
+                self.dispatch({'op': 'sync'})
+            except Exception:  # pylint: disable=broad-except  ; retry on next interval
+                self.app.logger.exception('SchedulerDaemon snapshot failed')
+
+    def run(self):
+        """load state and serve requests until shutdown"""
+
+        with self.app.app_context():
+            self.state.load()
+            current_app.logger.info(f'SchedulerDaemon loaded {len(self.state.queues)} queues, serving {self.server_address}')
+
+        snapshot_thread = Thread(target=self.snapshot_loop, daemon=True)
+        snapshot_thread.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.stopped.set()
+            snapshot_thread.join()
+            self.dispatch({'op': 'snapshot'})
+            self.state.journal.close()
+            self.server_close()
@@ -8,6 +8,7 @@ import os
 from datetime import datetime
 
 from flask import current_app
+from sqlalchemy import func
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Index, PrimaryKeyConstraint
@@ -45,11 +46,12 @@ class Target(db.Model):
     queue_id = db.Column(db.Integer, db.ForeignKey('queue.id', ondelete='CASCADE'), nullable=False)
     target = db.Column(db.Text, nullable=False)
     hashval = db.Column(db.Text, nullable=False)
+    rand = db.Column(db.Float, nullable=False, server_default=func.random())
 
     queue = relationship('Queue', back_populates='targets')
 
     __table_args__ = (
-        Index('target_queueid_hashval', 'queue_id', 'hashval'),  # get_assignment: select random target from queue
+        Index('target_queueid_hashval_rand', 'queue_id', 'hashval', 'rand'),  # get_assignment: select random target from queue
         Index('target_hashval', 'hashval')  # job_done: enable readynet on all queues
     )
 
@@ -76,10 +78,12 @@ class Readynet(db.Model):
 
     queue_id = db.Column(db.Integer, db.ForeignKey('queue.id', ondelete='CASCADE'), nullable=False)
     hashval = db.Column(db.String, nullable=False)
+    rand = db.Column(db.Float, nullable=False, server_default=func.random())
 
     __table_args__ = (
         PrimaryKeyConstraint('queue_id', 'hashval', name='readynet_pkey'),  # enqueue: ensure uniqueness
-        Index('readynet_hashval', 'hashval')  # get_assignment: remove readynet when hot
+        Index('readynet_hashval', 'hashval'),  # get_assignment: remove readynet when hot
+        Index('readynet_queueid_rand', 'queue_id', 'rand')  # get_assignment: select random readynet from queue
     )
 
     def __repr__(self):
@@ -95,6 +99,9 @@ class Job(db.Model):
     retval = db.Column(db.Integer)
     time_start = db.Column(db.DateTime, default=datetime.utcnow)
     time_end = db.Column(db.DateTime)
+    usage = db.Column(db.JSON)
+    lease = db.Column(db.DateTime)
+    progress = db.Column(db.Integer)
 
     queue = relationship('Queue', back_populates='jobs')
 
@@ -3,7 +3,6 @@
 scheduler module functions
 """
 
-import json
 from csv import DictWriter, QUOTE_ALL
 from datetime import datetime, timedelta
 from http import HTTPStatus
@@ -19,6 +18,7 @@ from sqlalchemy.sql.functions import coalesce
 from sner.lib import format_host_address
 from sner.server.extensions import db
 from sner.server.storage.forms import AnnotateForm
+from sner.server.storage.importer import ParsedItemsImporter
 from sner.server.storage.models import Host, Note, Service, Vuln
 from sner.server.utils import filter_query, windowed_query, error_response
 
@@ -397,93 +397,10 @@ class StorageManager:
                 print(f'storage update new note: {inote}')
 
     @staticmethod
-    def import_parsed(pidb, addtags=None):  # pylint: disable=too-many-branches
-        """import"""
+    def import_parsed(pidb, addtags=None):
+        """import parsed items into storage"""
 
-        # import hosts
-        for ihost in pidb.hosts:
-            host = db_host(ihost.address)
-            if not host:
-                host = Host(address=ihost.address)
-                db.session.add(host)
-                current_app.logger.info(f'storage update new host {host}')
-            host.update(ihost)
-            if addtags:
-                tag_add(host, addtags)
-
-            if ihost.hostnames:
-                note = db_note(ihost.address, 'hostnames')
-                if not note:
-                    note = Note(host=host, xtype='hostnames', data='[]')
-                    db.session.add(note)
-                note.data = json.dumps(list(set(json.loads(note.data) + ihost.hostnames)))
-        db.session.commit()
-
-        # import services
-        for iservice in pidb.services:
-            host = db_host(pidb.hosts.by.iid[iservice.host_iid].address, flag_required=True)
-            service = db_service(host.address, iservice.proto, iservice.port)
-            if not service:
-                service = Service(host=host, proto=iservice.proto, port=iservice.port)
-                db.session.add(service)
-                current_app.logger.info(f'storage update new service {service}')
-            service.update(iservice)
-            if addtags:
-                tag_add(service, addtags)
-        db.session.commit()
-
-        # import vulns
-        for ivuln in pidb.vulns:
-            host = db_host(pidb.hosts.by.iid[ivuln.host_iid].address, flag_required=True)
-            service = (
-                db_service(
-                    host.address,
-                    pidb.services.by.iid[ivuln.service_iid].proto,
-                    pidb.services.by.iid[ivuln.service_iid].port,
-                    flag_required=True
-                )
-                if ivuln.service_iid is not None
-                else None
-            )
-            vuln = db_vuln(
-                host.address,
-                ivuln.name,
-                ivuln.xtype,
-                service.proto if service else None,
-                service.port if service else None,
-                ivuln.via_target
-            )
-            if not vuln:
-                vuln = Vuln(host=host, name=ivuln.name, xtype=ivuln.xtype, service=service, via_target=ivuln.via_target)
-                db.session.add(vuln)
-                current_app.logger.info(f'storage update new vuln {vuln}')
-            vuln.update(ivuln)
-            if addtags:
-                tag_add(vuln, addtags)
-        db.session.commit()
-
-        # import notes
-        for inote in pidb.notes:
-            host = db_host(pidb.hosts.by.iid[inote.host_iid].address, flag_required=True)
-            service = (
-                db_service(
-                    host.address,
-                    pidb.services.by.iid[inote.service_iid].proto,
-                    pidb.services.by.iid[inote.service_iid].port,
-                    flag_required=True
-                )
-                if inote.service_iid is not None
-                else None
-            )
-            note = db_note(host.address, inote.xtype, service.proto if service else None, service.port if service else None, inote.via_target)
-            if not note:
-                note = Note(host=host, xtype=inote.xtype, service=service, via_target=inote.via_target)
-                db.session.add(note)
-                current_app.logger.info(f'storage update new note {note}')
-            note.update(inote)
-            if addtags:
-                tag_add(note, addtags)
-        db.session.commit()
+        ParsedItemsImporter(pidb, addtags).run()
 
     @staticmethod
     def get_all_six_address(filternets=None):
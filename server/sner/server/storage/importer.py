@@ -0,0 +1,286 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+storage bulk import of parsed items
+
+Items of the same type are upserted in batches by INSERT ... ON CONFLICT DO UPDATE
+statements targeting the storage identity unique indexes, so concurrent imports
+cannot create duplicates. Merge semantics follows StorageModelBase.update; existing
+values are not overwritten with empty values and conflicting rows are updated only
+if their data changes. Storage ids of unchanged rows are resolved by batched VALUES
+joins.
+"""
+
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, any_, case, cast, column, distinct, func, literal, literal_column, or_, select, values as sql_values
+from sqlalchemy.dialects.postgresql import aggregate_order_by, ARRAY as pg_ARRAY, insert as pg_insert, JSONB
+from sqlalchemy.sql.functions import coalesce
+
+from sner.lib import batched
+from sner.server.extensions import db
+from sner.server.storage.models import Host, Note, Service, Vuln
+
+
+HOST_IDENTITY = ('address',)
+HOST_COLUMNS = ('hostname', 'os')
+SERVICE_IDENTITY = ('host_id', 'proto', 'port')
+SERVICE_COLUMNS = ('state', 'name', 'info', 'import_time')
+VULN_IDENTITY = ('host_id', 'name', 'xtype', 'service_id', 'via_target')
+VULN_COLUMNS = ('severity', 'descr', 'data', 'refs', 'import_time')
+NOTE_IDENTITY = ('host_id', 'xtype', 'service_id', 'via_target')
+NOTE_COLUMNS = ('data', 'import_time')
+
+
+def typed_values(table, columns, rows, name='items'):
+    """
+    VALUES construct usable as subquery. values are casted to the types of table columns,
+    postgres would otherwise infer text for columns with NULLs only.
+
+    :param columns: list of table column names, `idx` denotes item index column
+    """
+
+    coltypes = [(col, db.Integer if col == 'idx' else table.c[col].type) for col in columns]
+    vals = sql_values(*[column(col, coltype) for col, coltype in coltypes], name=f'{name}_raw').data(rows)
+    return select(*[cast(vals.c[col], coltype).label(col) for col, coltype in coltypes]).subquery(name)
+
+
+def identity_expr(table, col):
+    """
+    identity column expression; optional parts of the identity are compared null-safe
+    the same way as by the storage identity unique indexes
+    """
+
+    if not table.c[col.name].nullable:
+        return col
+    return coalesce(col, literal_column('0' if isinstance(table.c[col.name].type, db.Integer) else "''"))
+
+
+def identity_key(table, identity, item):
+    """identity of item compared the same way as by identity_expr"""
+
+    return tuple(
+        (0 if isinstance(table.c[col].type, db.Integer) else '') if (item[col] is None) and table.c[col].nullable else item[col]
+        for col in identity
+    )
+
+
+class ParsedItemsImporter:
+    """set-based import of ParsedItemsDb into storage"""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, pidb, addtags=None):
+        self.pidb = pidb
+        self.addtags = list(dict.fromkeys(addtags)) if addtags else []
+
+    def run(self):
+        """import all items, items are linked through storage ids of parent items"""
+
+        host_ids = self.import_hosts()
+        self.import_hostnames(host_ids)
+        service_ids = self.import_services(host_ids)
+        self.import_vulns(host_ids, service_ids)
+        self.import_notes(host_ids, service_ids)
+        db.session.commit()
+
+    @staticmethod
+    def _item(obj, identity, columns, **identity_values):
+        """project parsed object to item dict; empty values are normalized to None"""
+
+        item = {col: identity_values[col] if col in identity_values else getattr(obj, col) for col in identity}
+        item.update({col: getattr(obj, col) or None for col in columns})
+        return item
+
+    def _resolve(self, table, identity, items):
+        """
+        resolve storage rows for items by identity
+
+        :return: list of resolved rows (dict) or None for each item
+        """
+
+        resolved = [None] * len(items)
+        for batch in batched(enumerate(items), self.BATCH_SIZE):
+            keys = typed_values(table, ('idx', *identity), [(idx, *[item[col] for col in identity]) for idx, item in batch], 'keys')
+            stmt = (
+                select(keys.c.idx, table.c.id)
+                .select_from(keys)
+                .join(table, and_(*[identity_expr(table, table.c[col]) == identity_expr(table, keys.c[col]) for col in identity]))
+            )
+            for row in db.session.execute(stmt).mappings():
+                resolved[row['idx']] = dict(row)
+        return resolved
+
+    @staticmethod
+    def _dedupe(table, identity, items):
+        """
+        merge items sharing storage identity (eg. pidb items with xtype None and ''), a single upsert
+        cannot update the same row twice. items are merged the same way as by ParsedItemsDb upserts.
+
+        :return: list of unique items
+        """
+
+        unique = {}
+        for item in items:
+            key = identity_key(table, identity, item)
+            if key not in unique:
+                unique[key] = dict(item)
+                continue
+
+            merged = unique[key]
+            for col, value in item.items():
+                if (value is None) or (col in identity):
+                    continue
+                merged[col] = (merged[col] or []) + value if isinstance(value, list) else value
+        return list(unique.values())
+
+    def _insert_row(self, table, item, tagged):
+        """row for new item, empty values are replaced by column defaults"""
+
+        row = {
+            col: table.c[col].default.arg if (value is None) and (table.c[col].default is not None) and table.c[col].default.is_scalar else value
+            for col, value in item.items()
+        }
+        if tagged:
+            row['tags'] = self.addtags
+        return row
+
+    @staticmethod
+    def _merge_value(table, stmt, col):
+        """
+        update value for conflicting row, empty proposed value keeps the existing one. values
+        replaced by column defaults in _insert_row are treated as empty.
+        """
+
+        value = stmt.excluded[col]
+        if (table.c[col].default is not None) and table.c[col].default.is_scalar:
+            value = func.nullif(value, cast(table.c[col].default.arg, table.c[col].type))
+        return coalesce(value, table.c[col])
+
+    def _merge_tags(self, table):
+        """append missing addtags to existing tags, existing tags order is preserved"""
+
+        tags = table.c.tags
+        for tag in self.addtags:
+            tags = func.array_cat(
+                tags,
+                case((literal(tag) == any_(table.c.tags), cast([], pg_ARRAY(db.String))), else_=cast([tag], pg_ARRAY(db.String)))
+            )
+        return tags
+
+    def _upsert(
+        self,
+        table,
+        identity,
+        columns,
+        items,
+        tagged=True,
+        merge=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        """
+        insert new items and update existing rows, existing row is updated only if it's data changes
+
+        :param merge: update values overriding default merge of columns
+        :return: list of storage ids for items
+        """
+
+        stmt = pg_insert(table)
+        values = {col: self._merge_value(table, stmt, col) for col in columns}
+        values.update(merge or {})
+        if tagged and self.addtags:
+            values['tags'] = self._merge_tags(table)
+        changed = or_(*[table.c[col].is_distinct_from(value) for col, value in values.items()])
+        if 'modified' in table.c:
+            values['modified'] = datetime.utcnow()
+        stmt = (
+            stmt
+            .on_conflict_do_update(index_elements=[identity_expr(table, table.c[col]) for col in identity], set_=values, where=changed)
+            .returning(table.c.id, *[table.c[col] for col in identity])
+        )
+
+        unique = self._dedupe(table, identity, items)
+        ids = {}
+        for batch in batched(unique, self.BATCH_SIZE):
+            for row in db.session.execute(stmt, [self._insert_row(table, item, tagged) for item in batch]).mappings():
+                ids[identity_key(table, identity, row)] = row['id']
+
+        # unchanged rows are not returned by upsert
+        unchanged = [item for item in unique if identity_key(table, identity, item) not in ids]
+        for item, row in zip(unchanged, self._resolve(table, identity, unchanged)):
+            ids[identity_key(table, identity, item)] = row['id']
+
+        current_app.logger.debug(f'storage import {table.name}, {len(unique) - len(unchanged)} upserted, {len(unchanged)} unchanged')
+        return [ids[identity_key(table, identity, item)] for item in items]
+
+    def import_hosts(self):
+        """import hosts, return host ids by pidb host iid"""
+
+        ihosts = list(self.pidb.hosts)
+        items = [self._item(ihost, HOST_IDENTITY, HOST_COLUMNS) for ihost in ihosts]
+        ids = self._upsert(Host.__table__, HOST_IDENTITY, HOST_COLUMNS, items)
+        return {ihost.iid: host_id for ihost, host_id in zip(ihosts, ids)}
+
+    def import_hostnames(self, host_ids):
+        """merge parsed hostnames into hosts hostnames note"""
+
+        table = Note.__table__
+        items = [
+            {
+                'host_id': host_ids[ihost.iid],
+                'xtype': 'hostnames',
+                'service_id': None,
+                'via_target': None,
+                'data': json.dumps(sorted(set(ihost.hostnames)))
+            }
+            for ihost in self.pidb.hosts if ihost.hostnames
+        ]
+        hostnames = func.jsonb_array_elements_text(
+            cast(table.c.data, JSONB).concat(cast(literal_column('excluded.data', db.Text), JSONB))
+        ).table_valued('hostname').render_derived()
+        merged = cast(
+            select(func.json_agg(aggregate_order_by(distinct(hostnames.c.hostname), hostnames.c.hostname))).correlate(table).scalar_subquery(),
+            db.Text
+        )
+        self._upsert(table, NOTE_IDENTITY, ('data',), items, tagged=False, merge={'data': merged})
+
+    def import_services(self, host_ids):
+        """import services, return service ids by pidb service iid"""
+
+        iservices = list(self.pidb.services)
+        items = [
+            self._item(iservice, SERVICE_IDENTITY, SERVICE_COLUMNS, host_id=host_ids[iservice.host_iid])
+            for iservice in iservices
+        ]
+        ids = self._upsert(Service.__table__, SERVICE_IDENTITY, SERVICE_COLUMNS, items)
+        return {iservice.iid: service_id for iservice, service_id in zip(iservices, ids)}
+
+    def import_vulns(self, host_ids, service_ids):
+        """import vulns"""
+
+        items = [
+            self._item(
+                ivuln,
+                VULN_IDENTITY,
+                VULN_COLUMNS,
+                host_id=host_ids[ivuln.host_iid],
+                service_id=service_ids[ivuln.service_iid] if ivuln.service_iid is not None else None
+            )
+            for ivuln in self.pidb.vulns
+        ]
+        self._upsert(Vuln.__table__, VULN_IDENTITY, VULN_COLUMNS, items)
+
+    def import_notes(self, host_ids, service_ids):
+        """import notes"""
+
+        items = [
+            self._item(
+                inote,
+                NOTE_IDENTITY,
+                NOTE_COLUMNS,
+                host_id=host_ids[inote.host_iid],
+                service_id=service_ids[inote.service_iid] if inote.service_iid is not None else None
+            )
+            for inote in self.pidb.notes
+        ]
+        self._upsert(Note.__table__, NOTE_IDENTITY, NOTE_COLUMNS, items)
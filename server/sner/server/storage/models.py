@@ -34,12 +34,18 @@ from datetime import datetime
 
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import Index
+from sqlalchemy.sql import text
 
 from sner.lib import format_host_address
 from sner.server.extensions import db
 from sner.server.models import SelectableEnum
 
 
+# unique indexes enforcing storage identity of the items, see StorageManager.import_parsed
+IDENTITY_INDEXES = ('host_identity', 'service_identity', 'vuln_identity', 'note_identity')
+
+
 class StorageModelBase(db.Model):
     """storage model base"""
 
@@ -48,7 +54,12 @@ class StorageModelBase(db.Model):
     def update(self, obj):
         """Update model from data object. Existing values are not overwriten with empty values."""
 
-        iterator = obj.__dict__ if hasattr(obj, '__dict__') else obj
+        if hasattr(obj, '__dict__'):
+            iterator = obj.__dict__
+        elif hasattr(obj, '__slots__'):
+            iterator = {key: getattr(obj, key) for key in obj.__slots__}
+        else:
+            iterator = obj
         for key, value in iterator.items():
             if value and hasattr(self, key):
                 setattr(self, key, value)
@@ -71,6 +82,10 @@ class Host(StorageModelBase):
     vulns = relationship('Vuln', back_populates='host', cascade='delete,delete-orphan', passive_deletes=True)
     notes = relationship('Note', back_populates='host', cascade='delete,delete-orphan', passive_deletes=True)
 
+    __table_args__ = (
+        Index('host_identity', 'address', unique=True),  # storage identity, import upserts
+    )
+
     def __repr__(self):
         return f'<Host {self.id}: {self.address} {self.hostname}>'
 
@@ -96,6 +111,10 @@ class Service(StorageModelBase):
     vulns = relationship('Vuln', back_populates='service', cascade='delete,delete-orphan', passive_deletes=True)
     notes = relationship('Note', back_populates='service', cascade='delete,delete-orphan', passive_deletes=True)
 
+    __table_args__ = (
+        Index('service_identity', 'host_id', 'proto', 'port', unique=True),  # storage identity, import upserts
+    )
+
     def __repr__(self):
         host = format_host_address(self.host.address) if self.host else None
         return f'<Service {self.id}: {host} {self.proto}.{self.port}>'
@@ -135,6 +154,15 @@ class Vuln(StorageModelBase):
     host = relationship('Host', back_populates='vulns')
     service = relationship('Service', back_populates='vulns')
 
+    __table_args__ = (
+        # storage identity, import upserts; optional parts are compared null-safe
+        Index(
+            'vuln_identity',
+            'host_id', 'name', text("coalesce(xtype, '')"), text('coalesce(service_id, 0)'), text("coalesce(via_target, '')"),
+            unique=True
+        ),
+    )
+
     def __repr__(self):
         host = format_host_address(self.host.address) if self.host else None
         service = f'{self.service.proto}.{self.service.port}' if self.service else None
@@ -159,6 +187,15 @@ class Note(StorageModelBase):
     host = relationship('Host', back_populates='notes')
     service = relationship('Service', back_populates='notes')
 
+    __table_args__ = (
+        # storage identity, import upserts; optional parts are compared null-safe
+        Index(
+            'note_identity',
+            'host_id', text("coalesce(xtype, '')"), text('coalesce(service_id, 0)'), text("coalesce(via_target, '')"),
+            unique=True
+        ),
+    )
+
     def __repr__(self):
         host = format_host_address(self.host.address) if self.host else None
         service = f'{self.service.proto}.{self.service.port}' if self.service else None
@@ -5,13 +5,17 @@ misc utils used in server
 
 import datetime
 import json
+import zlib
 from http import HTTPStatus
+from tempfile import SpooledTemporaryFile
 
 import yaml
 from flask import current_app, jsonify
 from lark.exceptions import LarkError
 from sqlalchemy_filters import apply_filters
 from sqlalchemy_filters.exceptions import BadFilterFormat
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import ClosingIterator, get_input_stream
 
 from sner.server.scheduler.core import ExclFamily
 from sner.server.sqlafilter import FILTER_PARSER
@@ -152,3 +156,57 @@ def error_response(message, errors=None, code=HTTPStatus.BAD_REQUEST):
             'message': message
         }
     }), code
+
+
+class GzipRequestMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    wsgi middleware decompressing gzip encoded request bodies (sent by agents)
+
+    body is decompressed in chunks into spooled temporary file before the request is passed
+    to the application, invalid or truncated gzip stream is rejected with 400, decompressed
+    body larger than MAX_SIZE with 413.
+    """
+
+    MAX_SIZE = 64 * 1024**2
+    CHUNK_SIZE = 64 * 1024
+    SPOOL_SIZE = 1024**2
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def _decompress(self, stream, body):
+        """decompress gzip stream into body file, return decompressed size"""
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        size = 0
+        try:
+            while chunk := stream.read(self.CHUNK_SIZE):
+                # output over the size limit leaves unconsumed input
+                data = decompressor.decompress(chunk, self.MAX_SIZE - size + 1)
+                size += len(data)
+                if size > self.MAX_SIZE:
+                    raise RequestEntityTooLarge()
+                body.write(data)
+        except zlib.error:
+            raise BadRequest('invalid gzip body') from None
+
+        if not decompressor.eof:
+            raise BadRequest('truncated gzip body')
+        return size
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            body = SpooledTemporaryFile(max_size=self.SPOOL_SIZE)  # pylint: disable=consider-using-with  ; closed after response
+            try:
+                size = self._decompress(get_input_stream(environ), body)
+            except HTTPException as exc:
+                body.close()
+                return exc(environ, start_response)
+            body.seek(0)
+
+            environ['wsgi.input'] = body
+            environ['CONTENT_LENGTH'] = str(size)
+            del environ['HTTP_CONTENT_ENCODING']
+            return ClosingIterator(self.wsgi_app(environ, start_response), body.close)
+
+        return self.wsgi_app(environ, start_response)
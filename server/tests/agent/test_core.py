@@ -5,12 +5,15 @@ agent basic tests
 
 import json
 from pathlib import Path
+from time import monotonic
 from uuid import uuid4
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from flask import url_for
 
-from sner.agent.core import main as agent_main
+from sner.agent.core import main as agent_main, zipdir
 from sner.lib import file_from_zip
+from sner.plugin.dummy.agent import AgentModule as DummyModule
 from sner.server.extensions import db
 from sner.server.scheduler.models import Job, Queue
 
@@ -57,3 +60,62 @@ def test_run_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target
 
     job = Job.query.filter(Job.queue_id == dummy_target.queue_id).one()
     assert dummy_target.target in file_from_zip(job.output_abspath, 'assignment.json').decode('utf-8')
+    assert job.usage['targets'] == 1
+
+
+def test_run_slots_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target, target_factory):  # pylint: disable=unused-argument
+    """test concurrent multi-slot agent"""
+
+    queue = db.session.get(Queue, dummy_target.queue_id)
+    target_factory.create(queue=queue, target='target2')
+
+    result = agent_main([
+        '--server', url_for('frontend.index_route', _external=True),
+        '--apikey', apikey_agent,
+        '--oneshot',
+        '--slots', '2',
+        '--debug',
+    ])
+    assert result == 0
+    assert Job.query.filter(Job.queue_id == queue.id, Job.retval == 0).count() == 2
+
+
+def test_zipdir(tmpworkdir):  # pylint: disable=unused-argument
+    """test output packaging manifest and compression"""
+
+    Path('jobdir/sub').mkdir(parents=True)
+    for fname in ['output.xml', 'output.gnmap', 'image.png', 'sub/file']:
+        Path(f'jobdir/{fname}').write_text('data', encoding='utf-8')
+
+    zipdir('jobdir', 'output.zip', compresslevel=1, manifest=r'output\.xml|image\.png|sub/.*')
+
+    with ZipFile('output.zip') as ftmp:
+        assert sorted(ftmp.namelist()) == ['image.png', 'output.xml', 'sub/file']
+        assert ftmp.getinfo('output.xml').compress_type == ZIP_DEFLATED
+        assert ftmp.getinfo('image.png').compress_type == ZIP_STORED
+
+
+def test_module_execute_usage(tmpworkdir):  # pylint: disable=unused-argument
+    """test resource usage accounting of executed command"""
+
+    module = DummyModule()
+    assert module._execute(['sh', '-c', 'echo data; exit 3'], 'output', targets=1) == 3  # pylint: disable=protected-access
+    assert module.usage[0]['cmd'] == 'sh'
+    assert module.usage[0]['targets'] == 1
+    assert module.usage[0]['bytes_written'] == 5
+    assert module.usage[0]['max_rss'] > 0
+
+
+def test_module_execute_many(tmpworkdir):  # pylint: disable=unused-argument
+    """test concurrent execution of module commands"""
+
+    module = DummyModule()
+    commands = [(['sh', '-c', f'sleep 0.5; echo {idx}; exit {idx}'], f'output-{idx}', 1) for idx in range(4)]
+
+    started = monotonic()
+    assert module._execute_many(commands, concurrency=4) == [0, 1, 2, 3]  # pylint: disable=protected-access
+    assert monotonic() - started < 1.5
+    assert Path('output-3').read_text(encoding='utf-8') == '3\n'
+    assert len(module.usage) == 4
+    assert module.progress == 4
+    assert not module.processes
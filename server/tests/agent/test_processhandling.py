@@ -6,6 +6,7 @@ agents process handling
 import json
 import multiprocessing
 import os
+import re
 from http import HTTPStatus
 from time import sleep
 from uuid import uuid4
@@ -68,7 +69,7 @@ class SimpleServer():
         self.server = server
         self.url = self.server.url_for('/')[:-1]
         self.server.expect_request('/api/v2/scheduler/job/assign').respond_with_handler(self.handler_assign)
-        self.server.expect_request('/api/v2/scheduler/job/output').respond_with_handler(self.handler_output)
+        self.server.expect_request(re.compile(r'^/api/v2/scheduler/job/output/')).respond_with_handler(self.handler_output)
 
     @staticmethod
     def handler_assign(request):
@@ -101,3 +102,22 @@ def test_shutdown(tmpworkdir, httpserver):  # pylint: disable=unused-argument,re
     agent_main(['--shutdown', str(proc_agent.pid)])
     proc_agent.join(1)
     assert not proc_agent.is_alive()
+
+
+def test_shutdown_slots(tmpworkdir, httpserver):  # pylint: disable=unused-argument,redefined-outer-name
+    """test shutdown signal forwarding to slot workers"""
+
+    sserver = SimpleServer(httpserver)
+
+    proc_agent = multiprocessing.Process(
+        target=agent_main,
+        args=(['--server', sserver.url, '--apikey', 'dummy', '--slots', '2', '--debug'],)
+    )
+    proc_agent.start()
+    sleep(1)
+    assert proc_agent.is_alive()
+
+    agent_main(['--shutdown', str(proc_agent.pid)])
+    proc_agent.join(3)
+    assert not proc_agent.is_alive()
+    assert proc_agent.exitcode == 0
@@ -5,17 +5,19 @@ tests with various server communication test cases
 
 import multiprocessing
 import os
+import re
 import signal
+import threading
 from contextlib import contextmanager
 from http import HTTPStatus
 from time import sleep
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from uuid import uuid4
 
-from flask import url_for
+from flask import Response, url_for
 
 import sner.agent.core
-from sner.agent.core import main as agent_main
+from sner.agent.core import DEFAULT_CONFIG, main as agent_main, ServerableAgent
 from tests.agent import xjsonify
 
 
@@ -46,7 +48,7 @@ class FailServer():
         self.cnt_assign = 0
         self.cnt_output = 0
         self.server.expect_request('/api/v2/scheduler/job/assign').respond_with_handler(self.handler_assign)
-        self.server.expect_request('/api/v2/scheduler/job/output').respond_with_handler(self.handler_output)
+        self.server.expect_request(re.compile(r'^/api/v2/scheduler/job/output/')).respond_with_handler(self.handler_output)
 
     def handler_assign(self, request):
         """handle assign request"""
@@ -61,9 +63,14 @@ class FailServer():
         """handle output request"""
         if request.headers.get('X-API-KEY') != 'dummy':
             return xjsonify({'message': 'unauthorized'})
+        if request.method == 'HEAD':
+            return Response(status=HTTPStatus.OK, headers={'Upload-Offset': '0'})
         if self.cnt_output < 2:
             self.cnt_output += 1
             return xjsonify({'message': 'invalid request'}), HTTPStatus.BAD_REQUEST
+        if self.cnt_output < 3:
+            self.cnt_output += 1
+            return Response(status=HTTPStatus.ACCEPTED, headers={'Upload-Offset': '1'})
         return xjsonify({'message': 'success'})
 
 
@@ -111,3 +118,49 @@ def test_invalid_server_oneshot(tmpworkdir):  # pylint: disable=unused-argument,
 
     result = agent_main(['--server', 'http://localhost:0', '--debug', '--oneshot'])
     assert result == 1
+
+
+def test_heartbeat(httpserver):  # pylint: disable=redefined-outer-name
+    """test heartbeat keeps leases and abandons jobs discarded by server"""
+
+    heartbeats = []
+
+    def handler_heartbeat(request):
+        heartbeats.append(request.json)
+        return xjsonify({'message': 'success' if request.json['id'] == 'running' else 'discard job'})
+
+    httpserver.expect_request('/api/v2/scheduler/job/heartbeat').respond_with_handler(handler_heartbeat)
+
+    agent = ServerableAgent({**DEFAULT_CONFIG, 'SERVER': httpserver.url_for('/')[:-1], 'APIKEY': 'dummy', 'HEARTBEAT_INTERVAL': 0.1})
+    agent.leased_jobs = {'running', 'spooled'}
+    agent.running_job = 'running'
+    agent.module_instance = Mock(progress=3)
+
+    heartbeat = threading.Thread(target=agent.heartbeat)
+    heartbeat.start()
+    sleep(0.5)
+    agent.heartbeat_stop.set()
+    heartbeat.join()
+
+    assert {'id': 'running', 'progress': 3} in heartbeats
+    assert {'id': 'spooled'} in heartbeats
+    assert agent.leased_jobs == {'running'}
+    agent.module_instance.terminate.assert_not_called()
+
+
+def test_uploader_shutdown(tmpworkdir, httpserver):  # pylint: disable=unused-argument,redefined-outer-name
+    """test uploader does not retry failed uploads after shutdown and leaves outputs on disk"""
+
+    httpserver.expect_request(re.compile(r'^/api/v2/scheduler/job/output/')).respond_with_data('', status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+    agent = ServerableAgent({**DEFAULT_CONFIG, 'SERVER': httpserver.url_for('/')[:-1], 'APIKEY': 'dummy'})
+    with open('output.zip', 'wb') as ftmp:
+        ftmp.write(b'output')
+    agent.loop = False
+    agent.upload_spool.put(('job', 0, os.path.abspath('output.zip')))
+    agent.upload_spool.put(None)
+
+    agent.uploader()
+
+    assert len(httpserver.log) == 1
+    assert os.path.exists('output.zip')
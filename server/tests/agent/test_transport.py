@@ -0,0 +1,49 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+agent transport tests
+"""
+
+import gzip
+import json
+from http import HTTPStatus
+
+import pytest
+import requests
+from werkzeug.wrappers import Response
+
+from sner.agent.transport import Transport
+
+
+def test_transport(httpserver):
+    """test gzip body, retry and retry budget"""
+
+    transport = Transport('dummy', 5, backoff_time=0.01, backoff_max=0.1, retries=1)
+    data = {'caps': ['cap'] * 100}
+
+    def handler(request):
+        assert request.headers['X-API-KEY'] == 'dummy'
+        assert request.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(request.get_data())) == data
+        return Response('{}', content_type='application/json')
+
+    httpserver.expect_ordered_request('/api').respond_with_data('', status=HTTPStatus.SERVICE_UNAVAILABLE)
+    httpserver.expect_ordered_request('/api').respond_with_handler(handler)
+    response = transport.request('POST', httpserver.url_for('/api'), json_data=data)
+    assert response.status_code == HTTPStatus.OK
+    assert transport.stats == {'calls': 2, 'retries': 1, 'failures': 1}
+    assert transport.failures == 0
+
+    httpserver.expect_request('/busy').respond_with_data('', status=HTTPStatus.TOO_MANY_REQUESTS)
+    with pytest.raises(requests.exceptions.HTTPError):
+        transport.request('POST', httpserver.url_for('/busy'), json_data={})
+    assert transport.failures == 2
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.request('GET', 'http://localhost:0', retries=0)
+    assert transport.failures == 3
+
+    # long outage must not overflow backoff computation
+    transport.failures = 5000
+    transport.backoff()
+
+    transport.close()
@@ -4,6 +4,7 @@ manymap plugin agent tests
 """
 
 import json
+from zipfile import ZipFile
 from uuid import uuid4
 
 from sner.agent.core import main as agent_main
@@ -18,12 +19,15 @@ def test_basic(tmpworkdir):  # pylint: disable=unused-argument
         'config': {
             'module': 'manymap',
             'args': '-sV',
-            'delay': 1
+            'delay': 1,
+            'concurrency': 2
         },
         'targets': ['invalid', 'tcp://127.0.0.1:1', 'udp://[::1]:2']
     }
 
     result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
     assert result == 0
-    assert 'Host: 127.0.0.1 (localhost)' in file_from_zip('%s.zip' % test_a['id'], 'output-1.gnmap').decode('utf-8')
-    assert '# Nmap done at' in file_from_zip('%s.zip' % test_a['id'], 'output-2.gnmap').decode('utf-8')
+    assert '<address addr="127.0.0.1"' in file_from_zip(f'{test_a["id"]}.zip', 'output-1.xml').decode('utf-8')
+    assert '<finished ' in file_from_zip(f'{test_a["id"]}.zip', 'output-2.xml').decode('utf-8')
+    with ZipFile(f'{test_a["id"]}.zip') as ftmp:
+        assert not [x for x in ftmp.namelist() if x.endswith(('.nmap', '.gnmap'))]
@@ -21,5 +21,21 @@ def test_basic(tmpworkdir):  # pylint: disable=unused-argument
 
     result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
     assert result == 0
-    assert 'Host: 127.0.0.1 (localhost)' in file_from_zip(f'{test_a["id"]}.zip', 'output.gnmap').decode('utf-8')
-    assert 'Host: ::1 (localhost)' in file_from_zip(f'{test_a["id"]}.zip', 'output6.gnmap').decode('utf-8')
+    assert '<address addr="127.0.0.1"' in file_from_zip(f'{test_a["id"]}.zip', 'output.xml').decode('utf-8')
+    assert '<address addr="::1"' in file_from_zip(f'{test_a["id"]}.zip', 'output6.xml').decode('utf-8')
+
+
+def test_shards(tmpworkdir):  # pylint: disable=unused-argument
+    """nmap module sharded execution test"""
+
+    test_a = {
+        'id': str(uuid4()),
+        'config': {'module': 'nmap', 'args': '-sL', 'timing_perhost': 1, 'shards': 2},
+        'targets': ['127.0.0.1', '127.0.0.2', '127.0.0.3', '::1']
+    }
+
+    result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
+    assert result == 0
+    assert '<address addr="127.0.0.3"' in file_from_zip(f'{test_a["id"]}.zip', 'output-0.xml').decode('utf-8')
+    assert '<address addr="127.0.0.2"' in file_from_zip(f'{test_a["id"]}.zip', 'output-1.xml').decode('utf-8')
+    assert '<address addr="::1"' in file_from_zip(f'{test_a["id"]}.zip', 'output6-0.xml').decode('utf-8')
@@ -3,6 +3,9 @@
 nmap output parser tests
 """
 
+from pathlib import Path
+from zipfile import ZipFile
+
 import pytest
 from libnmap.parser import NmapParserException
 
@@ -30,3 +33,17 @@ def test_parse_path():
     assert [x.port for x in pidb.services] == expected_services
     assert len(list(filter(lambda x: x.xtype == 'cpe', pidb.notes))) == 5
     assert len(list(filter(lambda x: x.xtype == 'nmap.banner_dict', pidb.notes))) == 4
+
+
+def test_parse_path_shards(tmp_path):
+    """check parsing of sharded job output"""
+
+    data = Path('tests/server/data/parser-nmap-output.xml').read_text(encoding='utf-8')
+    with ZipFile(tmp_path / 'output.zip', 'w') as ftmp:
+        ftmp.writestr('output-0.xml', data)
+        ftmp.writestr('output-1.xml', data.replace('127.0.0.1', '127.0.0.2'))
+        ftmp.writestr('output-1', 'normal output')
+
+    pidb = ParserModule.parse_path(tmp_path / 'output.zip')
+
+    assert sorted(x.address for x in pidb.hosts) == ['127.0.0.1', '127.0.0.2']
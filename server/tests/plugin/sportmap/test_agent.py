@@ -22,5 +22,5 @@ def test_basic(tmpworkdir):  # pylint: disable=unused-argument
 
     result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
     assert result == 0
-    assert '-- 1 IP address (1 host up) scanned' in file_from_zip(f'{test_a["id"]}.zip', 'output-sport-53.gnmap').decode('utf-8')
-    assert '-- 1 IP address (1 host up) scanned' in file_from_zip(f'{test_a["id"]}.zip', 'output6-sport-53.gnmap').decode('utf-8')
+    assert '<hosts up="1"' in file_from_zip(f'{test_a["id"]}.zip', 'output-sport-53.xml').decode('utf-8')
+    assert '<hosts up="1"' in file_from_zip(f'{test_a["id"]}.zip', 'output6-sport-53.xml').decode('utf-8')
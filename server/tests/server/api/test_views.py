@@ -4,10 +4,12 @@ api.views tests
 """
 
 import base64
+import hashlib
 from datetime import datetime
 from http import HTTPStatus
 from ipaddress import ip_network
 from pathlib import Path
+from threading import BoundedSemaphore
 from unittest.mock import patch
 
 from flask import current_app, url_for
@@ -16,7 +18,7 @@ from sqlalchemy import create_engine, func, select
 import sner.server.api.views
 import sner.server.api.schema as api_schema
 from sner.server.extensions import db
-from sner.server.scheduler.core import SchedulerService, SCHEDULER_LOCK_NUMBER
+from sner.server.scheduler.core import JobManager, QueueManager, SchedulerService, SCHEDULER_LOCK_NUMBER
 from sner.server.scheduler.models import Heatmap, Job, Queue, Readynet, Target
 
 
@@ -30,6 +32,8 @@ def test_v2_scheduler_job_assign_route(api_agent, target):
     assert response.status_code == HTTPStatus.OK
     assert response.json
     assert len(Queue.query.filter(Queue.name == qname).one().jobs) == 1
+    # lease is granted by heartbeat only
+    assert Queue.query.filter(Queue.name == qname).one().jobs[0].lease is None
 
     # assign from non-existent queue, should return response-nowork
     response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'queue': 'notexist'})
@@ -107,6 +111,50 @@ def test_v2_scheduler_job_assign_route_locked(api_agent, target):  # pylint: dis
     assert not response.json
 
 
+def test_v2_scheduler_job_assign_route_longpoll(api_agent, queue):
+    """job assign route long-poll test"""
+
+    current_app.config['SNER_SCHEDULER_LONGPOLL_TIMEOUT'] = 1
+
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'wait': 10})
+    assert response.status_code == HTTPStatus.OK
+    assert not response.json
+
+    # busy scheduler
+    db.session.commit()
+    with create_engine(current_app.config['SQLALCHEMY_DATABASE_URI']).connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER)))
+        with patch.object(SchedulerService, 'TIMEOUT_JOB_ASSIGN', 0.5):
+            response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'wait': 10})
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+    assert not response.json
+
+    # waiters limit reached, immediate reply
+    with patch.dict(current_app.extensions, {'sner_longpoll_waiters': BoundedSemaphore(1)}):
+        current_app.extensions['sner_longpoll_waiters'].acquire()
+        current_app.config['SNER_SCHEDULER_LONGPOLL_TIMEOUT'] = 60
+        response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'wait': 60})
+        assert not response.json
+
+    QueueManager.enqueue(queue, ['127.0.0.1'])
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'wait': 10})
+    assert response.json['targets'] == ['127.0.0.1']
+
+
+def test_v2_scheduler_job_heartbeat_route(api_agent, job):
+    """job heartbeat route test"""
+
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_heartbeat_route'), {'id': job.id, 'progress': 1})
+    assert response.json['message'] == 'success'
+    assert job.lease > datetime.utcnow()
+    assert job.progress == 1
+
+    job.retval = 0
+    db.session.commit()
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_heartbeat_route'), {'id': job.id})
+    assert response.json['message'] == 'discard job'
+
+
 def test_v2_scheduler_job_output_route(api_agent, job):
     """job output route test"""
 
@@ -160,6 +208,78 @@ def test_v2_scheduler_job_output_route_locked(api_agent, job):
     assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
 
 
+def test_v2_scheduler_job_output_upload_route(api_agent, job):
+    """job output upload route test"""
+
+    data = b'a-test-file-contents'
+    url = url_for('api.v2_scheduler_job_output_upload_route', job_id=job.id)
+    headers = {'Upload-Length': str(len(data)), 'X-Sner-Retval': '12345', 'X-Sner-Sha256': hashlib.sha256(data).hexdigest()}
+
+    response = api_agent.head(url)
+    assert response.headers['Upload-Offset'] == '0'
+
+    response = api_agent.put(url, data[:5], headers=headers, status='*')
+    assert response.status_code == HTTPStatus.ACCEPTED
+    assert response.headers['Upload-Offset'] == '5'
+    assert api_agent.head(url).headers['Upload-Offset'] == '5'
+
+    response = api_agent.put(url, data[10:], headers={**headers, 'Upload-Offset': '10'}, status='*')
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.headers['Upload-Offset'] == '5'
+
+    response = api_agent.put(url, data[5:], headers={**headers, 'Upload-Offset': '5'})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json['message'] == 'success'
+    assert job.retval == 12345
+    assert Path(job.output_abspath).read_bytes() == data
+    assert not JobManager.upload_path(job).exists()
+
+    response = api_agent.put(url, data, headers=headers)
+    assert response.json['message'] == 'discard job'
+
+
+def test_v2_scheduler_job_output_upload_route_invalidrequest(api_agent, job):
+    """job output upload route test invalid requests"""
+
+    data = b'a-test-file-contents'
+    url = url_for('api.v2_scheduler_job_output_upload_route', job_id=job.id)
+    headers = {'Upload-Length': str(len(data)), 'X-Sner-Retval': '1', 'X-Sner-Sha256': hashlib.sha256(data).hexdigest()}
+
+    response = api_agent.put(url, data, headers={'Upload-Length': 'invalid'}, status='*')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = api_agent.put(url, data, headers={**headers, 'X-Sner-Sha256': 'invalid'}, status='*')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert not JobManager.upload_path(job).exists()
+
+    response = api_agent.put(url, data + b'extra', headers=headers, status='*')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert not JobManager.upload_path(job).exists()
+    assert job.retval is None
+
+
+def test_v2_scheduler_job_output_upload_route_locked(api_agent, job):
+    """job output upload route test locked, finished upload is resumable"""
+
+    data = b'a-test-file-contents'
+    url = url_for('api.v2_scheduler_job_output_upload_route', job_id=job.id)
+    headers = {'Upload-Length': str(len(data)), 'X-Sner-Retval': '0', 'X-Sner-Sha256': hashlib.sha256(data).hexdigest()}
+
+    db.session.commit()
+    with create_engine(current_app.config['SQLALCHEMY_DATABASE_URI']).connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER)))
+        with patch.object(sner.server.scheduler.core.SchedulerService, 'TIMEOUT_JOB_OUTPUT', 1):
+            response = api_agent.put(url, data, headers=headers, status='*')
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert api_agent.head(url).headers['Upload-Offset'] == str(len(data))
+
+    response = api_agent.put(url, b'', headers={**headers, 'Upload-Offset': str(len(data))})
+    assert response.json['message'] == 'success'
+    assert Path(job.output_abspath).read_bytes() == data
+
+
 def test_v2_scheduler_job_lifecycle_with_heatmap(api_agent, queue, target_factory):
     """job assign route test"""
 
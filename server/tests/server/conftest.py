@@ -122,6 +122,18 @@ class TestAppApi(TestApp):
         kwargs['headers'] = {'X-API-KEY': self.apikey}
         return super().post_json(*args, **kwargs)
 
+    def head(self, *args, **kwargs):
+        """authenticated head"""
+
+        kwargs['headers'] = {'X-API-KEY': self.apikey}
+        return super().head(*args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        """authenticated put"""
+
+        kwargs['headers'] = {**kwargs.get('headers', {}), 'X-API-KEY': self.apikey}
+        return super().put(*args, **kwargs)
+
 
 @pytest.fixture
 def api_agent(app, apikey_agent):  # pylint: disable=redefined-outer-name
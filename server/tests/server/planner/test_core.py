@@ -73,6 +73,9 @@ def test_planner_simple(app, queue_factory):  # pylint: disable=unused-argument
           storage_cleanup:
             enabled: true
 
+          reap_expired_jobs:
+            enabled: true
+
           rebuild_versioninfo_map:
             schedule: 10minutes
       """
@@ -5,6 +5,7 @@ planner stages tests
 
 import logging
 import os
+from datetime import datetime, timedelta
 from ipaddress import ip_address
 from pathlib import Path
 from unittest.mock import patch
@@ -20,6 +21,7 @@ from sner.server.planner.stages import (
     Netlist,
     project_hosts,
     project_services,
+    ReapExpiredJobs,
     project_sixenum_targets,
     ServiceDisco,
     SixDisco,
@@ -210,6 +212,16 @@ def test_storagecleanup(app, host_factory, service_factory):  # pylint: disable=
     assert Host.query.count() == 1
 
 
+def test_reapexpiredjobs(app, queue, job_factory):  # pylint: disable=unused-argument
+    """test planners reap expired jobs stage"""
+
+    job_factory.create(queue=queue, retval=None, lease=datetime.utcnow() - timedelta(hours=1))
+    ReapExpiredJobs().run()
+
+    assert Job.query.count() == 0
+    assert Target.query.count() == 2
+
+
 @pytest.mark.skipif('PYTEST_SLOW' not in os.environ, reason='large dataset test is slow')
 def test_storagerescan_largedataset(runner, queue_factory, host_factory):  # pylint: disable=unused-argument
     """test StorageRescan with large dataset"""
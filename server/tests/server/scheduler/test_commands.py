@@ -4,10 +4,12 @@ scheduler.commands tests
 """
 
 from pathlib import Path
+from unittest.mock import patch
 
 from sner.server.extensions import db
 from sner.server.scheduler.commands import command
 from sner.server.scheduler.core import SchedulerService
+from sner.server.scheduler.daemon import SchedulerDaemon
 from sner.server.scheduler.models import Job, Queue
 
 
@@ -116,8 +118,24 @@ def test_repeat_failed_jobs_command(runner):
     assert result.exit_code == 0
 
 
+def test_reap_expired_jobs_command(runner):
+    """test reap-expired-jobs command"""
+
+    result = runner.invoke(command, ['reap-expired-jobs'])
+    assert result.exit_code == 0
+
+
 def test_recover_heatmap_command(runner):
     """test recover-heatmap command"""
 
     result = runner.invoke(command, ['recover-heatmap'])
     assert result.exit_code == 0
+
+
+def test_daemon_command(runner):
+    """test daemon command"""
+
+    with patch.object(SchedulerDaemon, 'run') as run_mock:
+        result = runner.invoke(command, ['daemon'])
+    assert result.exit_code == 0
+    assert run_mock.called
@@ -3,17 +3,26 @@
 scheduler core tests
 """
 
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from io import BytesIO
 from ipaddress import ip_address, ip_network
 from pathlib import Path
+from random import seed
+from threading import BoundedSemaphore
+from unittest.mock import patch
+from zipfile import ZipFile
 
 import pytest
 import yaml
 from flask import current_app
+from sqlalchemy import select, text
 
 from sner.server.dbx_command import QueuePrio
 from sner.server.extensions import db
-from sner.server.scheduler.core import enumerate_network, ExclMatcher, QueueManager, SchedulerService, sixenum_target_boundaries
-from sner.server.scheduler.models import Heatmap, Job, Readynet
+from sner.server.scheduler.core import enumerate_network, ExclMatcher, JobManager, QueueManager, SchedulerService, sixenum_target_boundaries
+from sner.server.scheduler.models import Heatmap, Job, Readynet, Target
 
 
 def test_enumerate_network():
@@ -76,6 +85,39 @@ def test_excl_matcher(app):  # pylint: disable=unused-argument
 
     for item in matcher.excls:
         repr(item)
+    assert matcher.excls[0].match('notarget1')
+    assert matcher.excls[1].match(str(tnetwork.network_address))
+    assert not matcher.excls[1].match('notarget1')
+
+
+def test_excl_matcher_compiled(app):  # pylint: disable=unused-argument
+    """test compiled matcher engines"""
+
+    config = [
+        ['network', '127.0.0.0/25'],
+        ['network', '127.0.0.128/25'],
+        ['network', '127.0.0.64/26'],
+        ['network', '10.0.0.0/8'],
+        ['network', '2001:db8::/32'],
+        ['regex', r'^tcp://.*:(22|23)$'],
+        ['regex', r'^(dup)\1$'],
+        ['regex', r'(?i)^UPPER$'],
+    ]
+    matcher = ExclMatcher(config)
+
+    assert matcher.match_many([
+        '127.0.0.0', '127.0.0.255', '127.0.1.0', '126.255.255.255', '10.1.2.3', '2001:db8::1', '2001:db9::1',
+        'tcp://127.0.1.1:22', 'tcp://[::1]:23', 'tcp://127.0.1.1:24', 'tcp://[2001:db8::1]:80', 'dupdup', 'dup', 'upper',
+        'sixenum://2001:db7:ffff:ffff:ffff:ffff:ffff:0-ffff', 'sixenum://2001:db9::0-ffff',
+    ]) == [
+        True, True, False, False, True, True, False,
+        True, True, False, True, True, False, True,
+        False, False,
+    ]
+
+    assert ExclMatcher.cached(config) is ExclMatcher.cached(config)
+    assert ExclMatcher.cached(config) is not ExclMatcher.cached(config[:1])
+    assert not ExclMatcher([]).match('127.0.0.1')
 
 
 def test_queuemanager_errorhandling(app, queue):  # pylint: disable=unused-argument
@@ -89,6 +131,73 @@ def test_queuemanager_errorhandling(app, queue):  # pylint: disable=unused-argum
     assert 'failed to remove queue directory' in str(pytest_wrapped_e)
 
 
+def test_queuemanager_enqueue(app, queue):  # pylint: disable=unused-argument
+    """test QueueManager enqueue readynets accounting"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 1
+    SchedulerService.heatmap_put('127.0.1.0/24')
+
+    progress = []
+    with patch.object(QueueManager, 'ENQUEUE_CHUNK_SIZE', 3):
+        assert QueueManager.enqueue(queue, ['127.0.0.1', '127.0.0.2', ' 127.0.1.1 ', '', 'not,an "address"'], progress.append) == 4
+
+    assert progress == [3, 4]
+    assert {item.target for item in Target.query.all()} == {'127.0.0.1', '127.0.0.2', '127.0.1.1', 'not,an "address"'}
+    assert {item.hashval for item in Readynet.query.all()} == {'127.0.0.0/24', 'not,an "address"'}
+
+    assert QueueManager.enqueue(queue, [' ', '']) == 0
+
+
+def test_jobmanager_storeoutput(app, job):  # pylint: disable=unused-argument
+    """test job output storing"""
+
+    JobManager.store_output(job, b'output1')
+    assert Path(job.output_abspath).read_bytes() == b'output1'
+
+    upload_path = Path(job.output_abspath).with_name('upload')
+    upload_path.write_bytes(b'output2')
+    JobManager.store_output(job, upload_path)
+    upload_path.unlink()
+    assert Path(job.output_abspath).read_bytes() == b'output2'
+
+    with pytest.raises(TypeError):
+        JobManager.store_output(job, 'invalid')
+    with pytest.raises(TypeError):
+        JobManager.store_output(job, BytesIO(b'invalid'))
+    assert Path(job.output_abspath).read_bytes() == b'output2'
+    assert [item.name for item in Path(job.output_abspath).parent.iterdir()] == [Path(job.output_abspath).name]
+
+
+def test_jobmanager_outputusage(app, job):  # pylint: disable=unused-argument
+    """test reading resource usage from job output manifest"""
+
+    buf = BytesIO()
+    with ZipFile(buf, 'w') as ftmp:
+        ftmp.writestr('manifest.json', json.dumps({'usage': {'targets': 1, 'wall_time': 1.5}}))
+    SchedulerService.job_output(job, 0, buf.getvalue())
+    assert db.session.get(Job, job.id).usage == {'targets': 1, 'wall_time': 1.5}
+
+    JobManager.store_output(job, b'invalid')
+    assert JobManager.output_usage(job) is None
+
+
+def test_schedulerservice_lockstats(app, job):  # pylint: disable=unused-argument
+    """test scheduler lock hold time accounting"""
+
+    count = SchedulerService.lock_hold_stats['count']
+
+    SchedulerService.job_output(job, 0, b'')
+    assert SchedulerService.lock_hold_stats['count'] == count + 1
+    assert SchedulerService.lock_hold_stats['max'] > 0
+
+    # nested lock is accounted once
+    SchedulerService.get_lock()
+    SchedulerService.get_lock()
+    SchedulerService.release_lock()
+    SchedulerService.release_lock()
+    assert SchedulerService.lock_hold_stats['count'] == count + 2
+
+
 def test_schedulerservice_hashval():
     """test heatmap hashval computation"""
 
@@ -99,6 +208,14 @@ def test_schedulerservice_hashval():
     assert SchedulerService.hashval('tcp://[::1]:11') == '::/48'
     assert SchedulerService.hashval('sixenum://2001:db8:aa::1:2:3:11') == '2001:db8:aa::/48'
     assert SchedulerService.hashval('sixenum://2001:db8:bb::1:2:3:0-ffff') == '2001:db8:bb::/48'
+    assert SchedulerService.hashval('fe80::1%eth0') == 'fe80::/48'
+    assert SchedulerService.hashval('sixenum://fe80::1%eth0') == 'fe80::/48'
+    assert SchedulerService.hashval('127.0.0.1%eth0') == '127.0.0.1%eth0'
+
+    values = ['10.255.255.255', 'ffff:ffff:ffff:ffff::1', '::ffff:127.0.0.1', 'udp://[2001:db8::1]:53', 'url']
+    assert SchedulerService.hashval_many(values) == list(map(SchedulerService.hashval, values)) == [
+        '10.255.255.0/24', 'ffff:ffff:ffff::/48', '::/48', '2001:db8::/48', 'url'
+    ]
 
 
 def test_schedulerservice_readynetupdates(app, queue, target_factory):  # pylint: disable=unused-argument
@@ -161,6 +278,157 @@ def test_schedulerservice_hashvalprocessing(app, queue, target_factory):  # pyli
     assert Heatmap.query.one().hashval == '127.0.0.0/24'
 
 
+def test_schedulerservice_batchassign(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service batched job_assign honors rate-limit and exclusions"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 3
+    queue.group_size = 20
+
+    for net in ['127.0.1', '127.0.2', '127.0.3', '127.66.66']:
+        for addr in range(5):
+            tmp = f'{net}.{addr}'
+            target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+    db.session.commit()
+
+    assignment = SchedulerService.job_assign(None, [])
+
+    assert len(assignment['targets']) == 9
+    assert not [item for item in assignment['targets'] if item.startswith('127.66.66.')]
+    assert {item.hashval: item.count for item in Heatmap.query.all()} == {'127.0.1.0/24': 3, '127.0.2.0/24': 3, '127.0.3.0/24': 3}
+    assert Readynet.query.count() == 0
+    assert SchedulerService.heatmap_check()
+
+    SchedulerService.job_output(db.session.get(Job, assignment['id']), 0, b'')
+    assert Readynet.query.count() == 3
+
+
+def test_schedulerservice_randomreadynets(app, queue):  # pylint: disable=unused-argument
+    """test random readynets selection stays uniform across readynets (chi-square goodness of fit)"""
+
+    hashvals = [f'127.0.{idx}.0/24' for idx in range(10)]
+    for hashval in hashvals:
+        db.session.add(Readynet(queue_id=queue.id, hashval=hashval))
+    db.session.commit()
+
+    seed(1)
+    db.session.execute(text('SELECT setseed(0.5)'))
+    rounds = 1000
+
+    for count in [1, 3]:
+        picks = Counter()
+        for _ in range(rounds):
+            readynets = SchedulerService._random_readynets(queue, count)  # pylint: disable=protected-access
+            picks.update(row.hashval for row in db.session.execute(select(readynets)).all())
+
+        assert set(picks) == set(hashvals)
+        expected = rounds * count / len(hashvals)
+        # chi-square critical value for 9 degrees of freedom at p=0.001
+        assert sum((picks[hashval] - expected)**2 / expected for hashval in hashvals) < 27.88
+
+
+def test_schedulerservice_skiplocked(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service skiplocked engine job_assign"""
+
+    current_app.config['SNER_SCHEDULER_ENGINE'] = 'skiplocked'
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 3
+    queue.group_size = 20
+
+    for net in ['127.0.1', '127.0.2', '127.0.3', '127.66.66']:
+        for addr in range(5):
+            tmp = f'{net}.{addr}'
+            target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+    db.session.commit()
+
+    # concurrent assigner holding readynet row is skipped
+    with db.engine.connect() as conn:
+        conn.execute(select(Readynet).filter(Readynet.hashval == '127.0.3.0/24').with_for_update())
+        assignment1 = SchedulerService.job_assign(None, [])
+        conn.rollback()
+
+    assert len(assignment1['targets']) == 6
+    assert not [item for item in assignment1['targets'] if item.startswith(('127.0.3.', '127.66.66.'))]
+    assert Readynet.query.count() == 1
+
+    assignment2 = SchedulerService.job_assign(None, [])
+    assert len(assignment2['targets']) == 3
+    assert {item.hashval: item.count for item in Heatmap.query.filter(Heatmap.count > 0).all()} == {
+        '127.0.1.0/24': 3, '127.0.2.0/24': 3, '127.0.3.0/24': 3
+    }
+    assert Readynet.query.count() == 0
+    assert not SchedulerService.job_assign(None, [])
+    assert SchedulerService.heatmap_check()
+
+    # hot readynet held by concurrent assigner is skipped on deactivation and pruned by the next claim
+    SchedulerService.job_output(db.session.get(Job, assignment2['id']), 0, b'')
+    assert Readynet.query.count() == 1
+    with db.engine.connect() as conn:
+        conn.execute(select(Readynet).with_for_update())
+        SchedulerService.heatmap_put_many(['127.0.3.0/24'] * 3, skip_locked=True)
+        conn.rollback()
+    assert Readynet.query.count() == 1
+    assert not SchedulerService.job_assign(None, [])
+    assert Readynet.query.count() == 0
+
+
+def test_schedulerservice_heatmapputpop(app, queue_factory, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service heatmap accounting and readynets (de)activation across queues"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 2
+    queue1 = queue_factory.create(name='queue1')
+    queue2 = queue_factory.create(name='queue2')
+    target_factory.create(queue=queue1, target='127.0.0.1', hashval=SchedulerService.hashval('127.0.0.1'))
+    target_factory.create(queue=queue2, target='127.0.0.2', hashval=SchedulerService.hashval('127.0.0.2'))
+    target_factory.create(queue=queue2, target='127.0.1.1', hashval=SchedulerService.hashval('127.0.1.1'))
+
+    assert SchedulerService.heatmap_put_many(['127.0.0.0/24', '127.0.0.0/24', '127.0.1.0/24']) == {'127.0.0.0/24': 2, '127.0.1.0/24': 1}
+    assert Readynet.query.count() == 1
+
+    assert SchedulerService.heatmap_pop_many(['127.0.0.0/24', '127.0.1.0/24']) == {'127.0.0.0/24': 1, '127.0.1.0/24': 0}
+    assert Readynet.query.count() == 3
+
+    with patch.object(SchedulerService, 'HEATMAP_GC_PROBABILITY', 1.0):
+        assert SchedulerService.heatmap_put('127.0.0.0/24') == 2
+        assert SchedulerService.heatmap_pop('127.0.0.0/24') == 1
+    assert Heatmap.query.count() == 1
+
+    assert not SchedulerService.heatmap_put_many([])
+    assert not SchedulerService.heatmap_pop_many([])
+
+
+def test_schedulerservice_worklistener(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test available work notifications"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 1
+    target_factory.create(queue=queue, target='127.0.0.1', hashval=SchedulerService.hashval('127.0.0.1'))
+    target_factory.create(queue=queue, target='127.0.0.2', hashval=SchedulerService.hashval('127.0.0.2'))
+    assignment = SchedulerService.job_assign(None, [])
+
+    with SchedulerService.work_listener() as wait_for_work:
+        assert not wait_for_work(0.1)
+
+        QueueManager.enqueue(queue, ['127.0.1.1'])
+        assert wait_for_work(1)
+        assert not wait_for_work(0.1)
+
+        # heatmap cool-down
+        SchedulerService.job_output(db.session.get(Job, assignment['id']), 0, b'')
+        assert wait_for_work(1)
+
+
+def test_schedulerservice_worklistener_waiters(app):
+    """test available work listeners limit"""
+
+    app.extensions['sner_longpoll_waiters'] = BoundedSemaphore(1)
+
+    with SchedulerService.work_listener() as wait_for_work:
+        assert wait_for_work
+        with SchedulerService.work_listener() as wait_for_work2:
+            assert wait_for_work2 is None
+
+    with SchedulerService.work_listener() as wait_for_work:
+        assert wait_for_work
+
+
 def test_schedulerservice_readynetrecount(app, queue, target_factory):  # pylint: disable=unused-argument
     """test scheduler service readynet_recount"""
 
@@ -283,6 +551,23 @@ def test_schedulerservice_repeatfailedjobs(app, queue, job_factory):  # pylint:
     assert Job.query.filter(Job.retval == -15).count() == 0
 
 
+def test_schedulerservice_reapexpiredjobs(app, queue, job_factory):  # pylint: disable=unused-argument
+    """test scheduler service reap_expired_jobs"""
+
+    job_factory.create(queue=queue, retval=None, lease=datetime.utcnow() + timedelta(hours=1))
+    job_factory.create(queue=queue, retval=None, lease=datetime.utcnow() - timedelta(hours=1))
+    # agent without heartbeat, job is left for manual reconcile
+    job_factory.create(queue=queue, retval=None, lease=None, time_start=datetime.utcnow() - timedelta(days=1))
+
+    assert SchedulerService.reap_expired_jobs() == 1
+    assert Job.query.count() == 2
+    assert Job.query.filter(Job.lease == None).count() == 1  # noqa: E711  pylint: disable=singleton-comparison
+    assert Target.query.count() == 2
+    assert SchedulerService.heatmap_check()
+
+    assert SchedulerService.reap_expired_jobs() == 0
+
+
 def test_schedulerservice_recoverheatmap(app, queue, job_factory):  # pylint: disable=unused-argument
     """test scheduler service repeat_failed_jobs"""
 
@@ -0,0 +1,268 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+scheduler daemon tests
+"""
+
+import os
+from threading import Thread
+
+import pytest
+from flask import current_app
+
+from sner.server.extensions import db
+from sner.server.scheduler.core import JobManager, QueueManager, SchedulerDaemonClient, SchedulerService, SchedulerServiceBusyException
+from sner.server.scheduler.daemon import Journal, SchedulerDaemon, SchedulerState
+from sner.server.scheduler.models import Heatmap, Job, Readynet, Target
+
+
+@pytest.fixture
+def scheduler_daemon(app, tmpworkdir):  # pylint: disable=redefined-outer-name
+    """yield running scheduler daemon"""
+
+    app.config['SNER_SCHEDULER_ENGINE'] = 'daemon'
+    app.config['SNER_SCHEDULER_SOCKET'] = os.path.join(tmpworkdir, 'scheduler.sock')
+    daemon = SchedulerDaemon(app, app.config['SNER_SCHEDULER_SOCKET'], os.path.join(tmpworkdir, 'scheduler.journal'), 3600)
+    thread = Thread(target=daemon.run)
+    thread.start()
+    SchedulerDaemonClient.call('sync')
+
+    yield daemon
+
+    daemon.shutdown()
+    thread.join()
+
+
+def test_journal(tmpworkdir):
+    """test journal replay"""
+
+    journal = Journal(os.path.join(tmpworkdir, 'journal'))
+    journal.append({'ids': [1, 2], 'heat': {'a': 1}, 'job': 'job1', 'time': 1, 'hashvals': ['a']})
+    journal.append({'ids': [3], 'heat': {'b': 1}, 'job': 'job2', 'time': 2, 'hashvals': ['b']})
+    journal.append({'heat': {'a': 0}, 'done': 'job1', 'time': 3})
+    journal.file.write('{"ids": [4')
+    journal.file.flush()
+
+    assert journal.replay() == ({1, 2, 3}, {'a': 0, 'b': 1}, {'job2': (2, ['b'])}, {'job1': 3})
+
+    journal.truncate()
+    assert journal.replay() == (set(), {}, {}, {})
+    journal.close()
+
+
+def test_state(app, queue, target_factory, tmpworkdir):  # pylint: disable=unused-argument
+    """test in-memory state assign, release, snapshot and recovery"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 2
+    queue.group_size = 2
+    for tmp in ['127.0.0.1', '127.0.0.2', '127.0.0.3', '127.0.1.1', '127.66.66.1']:
+        target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+
+    journal_path = os.path.join(tmpworkdir, 'journal')
+    state = SchedulerState(Journal(journal_path))
+    state.load()
+    assert sorted(state.queues[queue.id].readynets) == ['127.0.0.0/24', '127.0.1.0/24', '127.66.66.0/24']
+
+    assignments = []
+    while assignment := state.assign(queue.name, []):
+        assignments.append(assignment)
+    assigned = [target for assignment in assignments for target in assignment['targets']]
+    assert len(assigned) == 3
+    assert '127.66.66.1' not in assigned
+    assert not state.assign(None, [])
+    assert set(state.pending) == {assignment['id'] for assignment in assignments}
+
+    # crash recovery replays journal over database state, heatmap is rebuilt from pending assignments
+    recovered = SchedulerState(Journal(journal_path))
+    recovered.load()
+    assert recovered.heatmap == state.heatmap
+    assert recovered.queues[queue.id].targets == state.queues[queue.id].targets
+    assert recovered.queues[queue.id].readynets == state.queues[queue.id].readynets
+
+    for assignment in assignments:
+        state.release(assignment['targets'], assignment['id'])
+    assert state.heatmap == {}
+    assert not state.pending
+    assert state.queues[queue.id].readynets
+
+    assignment = state.assign(queue.name, [])
+    JobManager.create(queue, assignment['targets'], assignment['id'])
+    state.snapshot()
+    assert Target.query.count() == 0
+    assert Readynet.query.count() == 0
+    assert SchedulerService.heatmap_check()
+    assert sum(item.count for item in Heatmap.query.all()) == 1
+    assert Journal(journal_path).replay() == (set(), {}, {assignment['id']: state.pending[assignment['id']]}, state.released)
+
+    # heatmap is rebuilt from running jobs
+    recovered = SchedulerState(Journal(journal_path))
+    recovered.load()
+    assert recovered.heatmap == state.heatmap
+    assert recovered.queues[queue.id].targets == state.queues[queue.id].targets
+    assert not recovered.pending
+
+
+def test_state_journal_error(app, queue, target_factory, tmpworkdir, monkeypatch):  # pylint: disable=unused-argument
+    """test assign reverts state changes when journal append fails"""
+
+    queue.group_size = 2
+    for tmp in ['127.0.0.1', '127.0.1.1']:
+        target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+
+    state = SchedulerState(Journal(os.path.join(tmpworkdir, 'journal')))
+    state.load()
+    targets = {hashval: list(items) for hashval, items in state.queues[queue.id].targets.items()}
+    readynets = sorted(state.queues[queue.id].readynets)
+
+    def raise_oserror(*args, **kwargs):
+        raise OSError('journal failed')
+
+    monkeypatch.setattr(state.journal, 'append', raise_oserror)
+    with pytest.raises(OSError):
+        state.assign(queue.name, [])
+
+    assert state.queues[queue.id].targets == targets
+    assert sorted(state.queues[queue.id].readynets) == readynets
+    assert state.heatmap == {}
+    assert not state.popped_ids
+    assert not state.pending
+
+
+def test_state_release_orphaned(app, queue, target_factory, tmpworkdir):  # pylint: disable=unused-argument
+    """test release of assignments which jobs has not been created"""
+
+    for tmp in ['127.0.0.1', '127.0.1.1']:
+        target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+
+    state = SchedulerState(Journal(os.path.join(tmpworkdir, 'journal')))
+    state.load()
+    orphan = state.assign(queue.name, [])
+    assignment = state.assign(queue.name, [])
+    JobManager.create(queue, assignment['targets'], assignment['id'])
+
+    assert not state.release_orphaned()
+    assert set(state.pending) == {orphan['id']}
+    assert state.release_orphaned(grace=0) == [orphan['id']]
+    assert not state.pending
+    assert state.heatmap == {SchedulerService.hashval(assignment['targets'][0]): 1}
+
+    # late job for orphaned assignment does not release heatmap twice
+    assert not state.release(orphan['targets'], orphan['id'])
+    assert state.heatmap == {SchedulerService.hashval(assignment['targets'][0]): 1}
+
+
+def test_state_release_idempotent(app, queue, target_factory, tmpworkdir):  # pylint: disable=unused-argument
+    """test released job is not accounted on load before it's finished and is released only once"""
+
+    for tmp in ['127.0.0.1', '127.0.1.1']:
+        target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+
+    journal_path = os.path.join(tmpworkdir, 'journal')
+    state = SchedulerState(Journal(journal_path))
+    state.load()
+    assignment = state.assign(queue.name, [])
+    job = Job(id=JobManager.create(queue, assignment['targets'], assignment['id'])['id'])
+    other = state.assign(queue.name, [])
+    JobManager.create(queue, other['targets'], other['id'])
+    other_heatmap = {SchedulerService.hashval(other['targets'][0]): 1}
+
+    # output received, daemon snapshot/load before the job is finished
+    state.release(assignment['targets'], assignment['id'])
+    state.snapshot()
+    state.load()
+    assert state.heatmap == other_heatmap
+
+    # crash recovery keeps released jobs
+    recovered = SchedulerState(Journal(journal_path))
+    recovered.load()
+    assert recovered.heatmap == other_heatmap
+
+    # repeated output (failed finish) does not release heatmap twice
+    assert not state.release(assignment['targets'], assignment['id'])
+    assert state.heatmap == other_heatmap
+
+    # finished jobs are not tracked anymore
+    job = db.session.get(Job, job.id)
+    job.retval = 0
+    db.session.commit()
+    state.sync()
+    assert not state.released
+
+
+def test_daemon(scheduler_daemon, queue, target_factory):  # pylint: disable=unused-argument,redefined-outer-name
+    """test scheduler service with daemon engine"""
+
+    target_factory.create(queue=queue, target='127.0.0.1', hashval=SchedulerService.hashval('127.0.0.1'))
+    assert not SchedulerService.job_assign(None, [])
+
+    QueueManager.enqueue(queue, ['127.0.0.2', '127.0.0.3'])
+    assignment = SchedulerService.job_assign(queue.name, [])
+    assert len(assignment['targets']) == 1
+    assert db.session.get(Job, assignment['id'])
+
+    SchedulerService.job_output(db.session.get(Job, assignment['id']), 0, b'')
+    assert db.session.get(Job, assignment['id']).retval == 0
+
+    # maintenance operations pause the daemon, state reloaded on resume
+    QueueManager.flush(queue)
+    assert not scheduler_daemon.state.queues[queue.id].targets
+    assert not SchedulerService.job_assign(None, [])
+
+    QueueManager.enqueue(queue, ['127.0.0.4'])
+    assignment = SchedulerService.job_assign(None, [])
+    assert assignment['targets'] == ['127.0.0.4']
+    assert SchedulerService.heatmap_check()
+
+    SchedulerService.get_lock()
+    with pytest.raises(SchedulerServiceBusyException):
+        SchedulerService.job_assign(None, [])
+    SchedulerService.release_lock()
+
+
+def test_daemon_lock_error(scheduler_daemon, queue):  # pylint: disable=unused-argument,redefined-outer-name
+    """test scheduler lock releases the lock and resumes the daemon when lock holder fails"""
+
+    QueueManager.enqueue(queue, ['127.0.0.1'])
+
+    with pytest.raises(RuntimeError):
+        with SchedulerService.lock():
+            assert scheduler_daemon.paused
+            raise RuntimeError('maintenance failed')
+    assert not scheduler_daemon.paused
+    assert SchedulerService.job_assign(None, [])
+
+
+def test_daemon_stale_pause(scheduler_daemon, queue):  # pylint: disable=unused-argument,redefined-outer-name
+    """test daemon drops pause of gone lock holder"""
+
+    QueueManager.enqueue(queue, ['127.0.0.1'])
+
+    # pause held by lock holder
+    SchedulerService.get_lock()
+    with pytest.raises(SchedulerServiceBusyException):
+        SchedulerService.job_assign(None, [])
+    SchedulerService.release_lock()
+
+    # lock holder has gone without resuming
+    SchedulerDaemonClient.call('pause')
+    assert SchedulerService.job_assign(None, [])
+    assert not scheduler_daemon.paused
+
+
+def test_daemon_client_error(app, tmpworkdir):  # pylint: disable=unused-argument
+    """test daemon client errors"""
+
+    current_app.config['SNER_SCHEDULER_ENGINE'] = 'daemon'
+    current_app.config['SNER_SCHEDULER_SOCKET'] = os.path.join(tmpworkdir, 'notexist.sock')
+
+    with pytest.raises(SchedulerServiceBusyException):
+        SchedulerService.job_assign(None, [])
+    with pytest.raises(SchedulerServiceBusyException):
+        SchedulerService.get_lock()
+
+
+def test_daemon_request_error(scheduler_daemon):  # pylint: disable=unused-argument,redefined-outer-name
+    """test daemon request error handling"""
+
+    with pytest.raises(SchedulerServiceBusyException):
+        SchedulerDaemonClient.call('notexist')
+    assert SchedulerDaemonClient.call('snapshot') == {}
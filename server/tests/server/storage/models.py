@@ -4,8 +4,9 @@ storage test models
 """
 
 from datetime import datetime
+from ipaddress import ip_address
 
-from factory import LazyAttribute, SubFactory
+from factory import LazyAttribute, Sequence, SubFactory
 
 from sner.server.storage.models import Host, Note, Service, SeverityEnum, Versioninfo, Vuln
 from sner.server.storage.versioninfo import versioninfo_docid
@@ -18,7 +19,7 @@ class HostFactory(BaseModelFactory):  # pylint: disable=too-few-public-methods
         """test host model factory"""
         model = Host
 
-    address = '127.128.129.130'
+    address = Sequence(lambda n: str(ip_address('127.128.129.130') + n))
     hostname = 'localhost.localdomain'
     os = 'some linux'
     comment = 'testing webserver'
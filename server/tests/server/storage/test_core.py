@@ -3,6 +3,8 @@
 storage.core functions tests
 """
 
+import json
+
 import pytest
 
 from sner.server.parser import ParsedItemsDb
@@ -39,6 +41,71 @@ def test_importparsed(app):  # pylint: disable=unused-argument
     assert host.notes[0].tags == ['testtag']
 
 
+def test_importparsed_update(app):  # pylint: disable=unused-argument
+    """test import parsed merges into existing storage items"""
+
+    pidb = ParsedItemsDb()
+    pidb.upsert_host('192.0.2.1', hostname='host1', hostnames=['host1'], os='os1')
+    pidb.upsert_vuln('192.0.2.1', 'name1', 'xtype1', 'tcp', 80, severity='info', refs=['ref1'], data='data1')
+    pidb.upsert_note('192.0.2.1', 'xtype1', data='data1')
+    StorageManager.import_parsed(pidb, ['tag1'])
+    modified = Host.query.one().modified
+
+    StorageManager.import_parsed(pidb)
+    assert Host.query.one().modified == modified
+
+    pidb = ParsedItemsDb()
+    pidb.upsert_host('192.0.2.1', hostname='', hostnames=['host2'])
+    pidb.upsert_vuln('192.0.2.1', 'name1', 'xtype1', 'tcp', 80, severity='high')
+    pidb.upsert_note('192.0.2.1', 'xtype1', data='data2')
+    pidb.upsert_note('192.0.2.1', 'xtype1', 'tcp', 80, data='data3')
+    StorageManager.import_parsed(pidb, ['tag2'])
+
+    host = Host.query.one()
+    assert host.hostname == 'host1'
+    assert host.os == 'os1'
+    assert host.tags == ['tag1', 'tag2']
+    assert len(host.services) == 1
+    assert host.vulns[0].severity == SeverityEnum.HIGH
+    assert host.vulns[0].refs == ['ref1']
+    assert host.vulns[0].data == 'data1'
+    assert sorted(json.loads(Note.query.filter(Note.xtype == 'hostnames').one().data)) == ['host1', 'host2']
+    assert Note.query.filter(Note.xtype == 'xtype1', Note.service == None).one().data == 'data2'  # noqa: E711  pylint: disable=singleton-comparison
+    assert Note.query.filter(Note.xtype == 'xtype1', Note.service != None).one().data == 'data3'  # noqa: E711  pylint: disable=singleton-comparison
+
+
+def test_importparsed_tags(app, host_factory):  # pylint: disable=unused-argument
+    """test import parsed appends addtags to existing tags"""
+
+    host_factory.create(address='192.0.2.1', tags=['tagb', 'taga'])
+    pidb = ParsedItemsDb()
+    pidb.upsert_host('192.0.2.1')
+
+    StorageManager.import_parsed(pidb, ['taga', 'tagc'])
+
+    assert Host.query.one().tags == ['tagb', 'taga', 'tagc']
+
+
+def test_importparsed_identity_duplicates(app):  # pylint: disable=unused-argument
+    """test import parsed items sharing storage identity (empty values are compared as same identity)"""
+
+    pidb = ParsedItemsDb()
+    pidb.upsert_note('192.0.2.1', None, data='data1')
+    pidb.upsert_note('192.0.2.1', '', data='data2')
+    pidb.upsert_vuln('192.0.2.1', 'vuln1', 'xtype1', via_target=None, severity=SeverityEnum.INFO, refs=['ref1'])
+    pidb.upsert_vuln('192.0.2.1', 'vuln1', 'xtype1', via_target='', descr='descr1', refs=['ref2'])
+    assert len(pidb.notes) == 2
+    assert len(pidb.vulns) == 2
+
+    StorageManager.import_parsed(pidb)
+
+    assert Note.query.one().data == 'data2'
+    tvuln = Vuln.query.one()
+    assert tvuln.severity == SeverityEnum.INFO
+    assert tvuln.descr == 'descr1'
+    assert tvuln.refs == ['ref1', 'ref2']
+
+
 def test_storagecleanup(app, host_factory, service_factory, vuln_factory, note_factory):  # pylint: disable=unused-argument
     """test planners cleanup storage stage"""
 
@@ -59,7 +126,7 @@ def test_storagecleanup(app, host_factory, service_factory, vuln_factory, note_f
     service3 = service_factory.create(host=host3, proto='tcp', port=1, state='filtered:reason')
     note_factory.create(host=host3, service=service3)
     vuln_factory.create(host=host3, service=service3)
-    service4 = service_factory.create(host=host3, proto='tcp', port=1, state='open:reason')
+    service4 = service_factory.create(host=host3, proto='tcp', port=2, state='open:reason')
     vuln_factory.create(host=host3)
     vuln_factory.create(host=host3, service=service4)
 
@@ -46,6 +46,16 @@ def test_host_add_route(cl_operator, host_factory):
     assert thost.comment == ahost.comment
 
 
+def test_host_add_route_duplicate(cl_operator, host):
+    """host add route test, storage identity conflict"""
+
+    form_data = [('address', host.address), ('hostname', 'duplicate.host')]
+    response = cl_operator.post(url_for('storage.host_add_route'), params=form_data, status='*')
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert Host.query.count() == 1
+
+
 def test_host_edit_route(cl_operator, host):
     """host edit route test"""
 
@@ -46,6 +46,16 @@ def test_note_add_route(cl_operator, host, service, note_factory):
     assert tnote.comment == anote.comment
 
 
+def test_note_add_route_duplicate(cl_operator, note):
+    """note add route test, storage identity conflict"""
+
+    form_data = [('host_id', note.host.id), ('xtype', note.xtype), ('data', 'another note data')]
+    response = cl_operator.post(url_for('storage.note_add_route', model_name='host', model_id=note.host.id), params=form_data, status='*')
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert Note.query.count() == 1
+
+
 def test_note_edit_route(cl_operator, note):
     """note edit route test"""
 
@@ -183,6 +183,23 @@ def test_vuln_multicopy_json_route(cl_operator, vuln, host_factory):
     assert Vuln.query.filter(Vuln.name == vuln.name).count() == 2
 
 
+def test_vuln_multicopy_json_route_duplicate(cl_operator, vuln, host_factory):
+    """vuln multicopy route test, storage identity conflict rejects the whole copy"""
+
+    host = host_factory.create()
+
+    form_data = [
+        ('name', vuln.name),
+        ('xtype', vuln.xtype),
+        ('severity', vuln.severity),
+        ('endpoints', json.dumps([{'host_id': host.id}, {'host_id': vuln.host_id}]))
+    ]
+    response = cl_operator.post(url_for('storage.vuln_multicopy_json_route', vuln_id=vuln.id), params=form_data, status='*')
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert Vuln.query.filter(Vuln.name == vuln.name).count() == 1
+
+
 def test_vuln_multicopy_endpoints_json_route(cl_operator, vuln):
     """vuln multicopy endpoints route test"""
 
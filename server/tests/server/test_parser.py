@@ -55,3 +55,32 @@ def test_upsert_note():
     assert len(pidb.hosts) == 2
     assert len(pidb.services) == 1
     assert len(pidb.notes) == 2
+
+
+def test_remove_many():
+    """test remove items"""
+
+    pidb = ParsedItemsDb()
+    for idx in range(5):
+        pidb.upsert_host(address=f'192.0.2.{idx}')
+
+    pidb.hosts.remove_many(pidb.hosts.where(address='192.0.2.1'))
+    pidb.hosts.remove(pidb.hosts.by.iid[3])
+
+    assert [host.address for host in pidb.hosts] == ['192.0.2.0', '192.0.2.2', '192.0.2.4']
+    assert 1 not in pidb.hosts.by.iid
+    assert pidb.upsert_host(address='192.0.2.1').iid == 5
+    assert pidb.upsert_host(address='192.0.2.2').iid == 2
+
+
+def test_update():
+    """test merge of parsed items"""
+
+    pidb = ParsedItemsDb()
+    pidb.upsert_vuln('192.0.2.1', 'vuln', 'testxtype', descr='descr1', refs=['ref1'])
+    vuln = pidb.upsert_vuln('192.0.2.1', 'vuln', 'testxtype', data='data1', refs=['ref2'])
+
+    assert not hasattr(vuln, '__dict__')
+    assert vuln.descr == 'descr1'
+    assert vuln.data == 'data1'
+    assert vuln.refs == ['ref1', 'ref2']
@@ -3,9 +3,15 @@
 misc server components tests
 """
 
+import gzip
+from http import HTTPStatus
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Request, Response
+
 from sner.server.extensions import db
 from sner.server.storage.models import Host
-from sner.server.utils import windowed_query
+from sner.server.utils import GzipRequestMiddleware, windowed_query
 
 
 def test_windowed_query(app, host):  # pylint: disable=unused-argument
@@ -13,3 +19,34 @@ def test_windowed_query(app, host):  # pylint: disable=unused-argument
 
     assert list(windowed_query(Host.query, Host.id, 1))
     assert list(windowed_query(db.session.query(Host.id, Host.id).select_from(Host), Host.id, 1))
+
+
+def test_gzip_request_middleware(monkeypatch):
+    """test gzip request body decompression"""
+
+    @Request.application
+    def echo_app(request):
+        return Response(request.get_data())
+
+    client = Client(GzipRequestMiddleware(echo_app))
+
+    response = client.post('/', data=gzip.compress(b'data'), headers={'Content-Encoding': 'gzip'})
+    assert response.get_data() == b'data'
+
+    response = client.post('/', data=b'data')
+    assert response.get_data() == b'data'
+
+    response = client.post('/', data=b'invalid', headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = client.post('/', data=gzip.compress(b'data')[:-4], headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    monkeypatch.setattr(GzipRequestMiddleware, 'CHUNK_SIZE', 2)
+    monkeypatch.setattr(GzipRequestMiddleware, 'SPOOL_SIZE', 2)
+    response = client.post('/', data=gzip.compress(b'data' * 100), headers={'Content-Encoding': 'gzip'})
+    assert response.get_data() == b'data' * 100
+
+    monkeypatch.setattr(GzipRequestMiddleware, 'MAX_SIZE', 2)
+    response = client.post('/', data=gzip.compress(b'data'), headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
@@ -0,0 +1,38 @@
+#!/bin/bash
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+#
+# benchmark scheduler enqueue and readynet-recount against large queue
+# populate 'dev.dummy' queue with tests/test_generate_targets.sh first (50M targets)
+# benchmark targets are removed from the queue on exit
+
+QUEUE=${1:-dev.dummy}
+ROUNDS=${2:-5}
+HASHVALS=""
+
+cleanup() {
+	rm -f /tmp/sner_bench_enqueue.txt
+	if [[ -n "$HASHVALS" ]]; then
+		echo "## cleanup benchmark targets"
+		for TABLE in target readynet; do
+			bin/server psql -c "DELETE FROM ${TABLE} USING queue WHERE ${TABLE}.queue_id = queue.id AND queue.name = '${QUEUE}' AND ${TABLE}.hashval LIKE ANY (ARRAY[${HASHVALS}])"
+		done
+	fi
+}
+trap cleanup EXIT
+
+echo "## queue $QUEUE targets"
+bin/server psql -c "SELECT count(*) AS targets, count(DISTINCT hashval) AS hashvals FROM target JOIN queue ON target.queue_id = queue.id WHERE queue.name = '${QUEUE}'"
+
+ROUND=0
+while [[ $ROUND -lt $ROUNDS ]]; do
+	NET="100.$(( 64 + ROUND )).0.0/16"
+	HASHVALS="${HASHVALS:+${HASHVALS}, }'100.$(( 64 + ROUND )).%'"
+	echo "## round $ROUND enqueue $NET"
+	bin/server scheduler enumips "$NET" > /tmp/sner_bench_enqueue.txt
+	time bin/server scheduler queue-enqueue "$QUEUE" --file=/tmp/sner_bench_enqueue.txt
+
+	echo "## round $ROUND readynet-recount"
+	time bin/server scheduler readynet-recount
+
+	ROUND=$((ROUND+1))
+done
@@ -0,0 +1,33 @@
+#!/bin/bash
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+#
+# micro-benchmark scheduler hashval computation over mixed ipv4, ipv6, service and sixenum targets
+
+COUNT=${1:-10000000}
+
+python3 - "$COUNT" <<'PYEOF'
+import sys
+from time import perf_counter
+
+from sner.server.scheduler.core import SchedulerService
+
+count = int(sys.argv[1])
+generators = [
+    lambda idx: f'10.{(idx >> 16) & 0xff}.{(idx >> 8) & 0xff}.{idx & 0xff}',
+    lambda idx: f'2001:db8:{(idx >> 16) & 0xffff:x}::{idx & 0xffff:x}',
+    lambda idx: f'tcp://10.{(idx >> 16) & 0xff}.{(idx >> 8) & 0xff}.{idx & 0xff}:{idx % 65535 + 1}',
+    lambda idx: f'sixenum://2001:db8:{(idx >> 16) & 0xffff:x}::{idx & 0xffff:x}:0-ffff',
+]
+targets = [generators[idx % len(generators)](idx) for idx in range(count)]
+
+start = perf_counter()
+SchedulerService.hashval_many(targets)
+elapsed = perf_counter() - start
+print(f'hashval_many {count} targets: {elapsed:.2f}s, {count / elapsed:.0f} targets/s')
+
+start = perf_counter()
+for target in targets:
+    SchedulerService.hashval(target)
+elapsed = perf_counter() - start
+print(f'hashval (cached) {count} targets: {elapsed:.2f}s, {count / elapsed:.0f} targets/s, {SchedulerService.hashval.cache_info()}')
+PYEOF